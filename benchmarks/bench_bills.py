@@ -0,0 +1,65 @@
+# /rachar com muitos participantes: criação da conta participante a participante (um INSERT e uma
+# busca de username por pessoa, cada um na fila do escritor) contra create_shared_bill (um IN (...) e
+# um executemany numa transação), e uma rajada de cliques em "Já paguei" editando o resumo a cada
+# clique contra o BillSummaryEditor com debounce. O bot é falso e só conta as edições.
+#
+# Uso: python benchmarks/bench_bills.py [participantes] [janela_da_rajada_s]
+
+import asyncio, os, sys, tempfile, time
+from decimal import Decimal
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+savie, db = savie_bot.savie, savie_bot.db
+
+class CountingBot:
+    def __init__(self): self.edits = 0
+    async def edit_message_text(self, **kwargs): self.edits += 1; await asyncio.sleep(0.02)
+
+def legacy_find_user(username: str):
+    return savie.conn.execute("SELECT user_id FROM users WHERE username = ?", (username,)).fetchone()
+
+def legacy_add_participant(bill_id: int, user_id: int | None, username: str, cents: int) -> int:
+    with savie.conn:
+        return savie.conn.execute("INSERT INTO bill_participants (bill_id, participant_user_id, participant_username, amount_due_cents) VALUES (?, ?, ?, ?)",
+                                  (bill_id, user_id, username, cents)).lastrowid
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    window = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    usernames = [f"amigo{i}" for i in range(count)]
+    for i, username in enumerate(usernames): savie.register_user(1000 + i, username, username)
+
+    started = time.perf_counter()
+    bill_id = await db.write(lambda: savie.conn.execute("INSERT INTO shared_bills (creator_user_id, group_chat_id, description, total_amount_cents) VALUES (1, -100, 'Churrasco', 100000)").lastrowid)
+    for username, cents in zip(usernames, savie_bot.split_cents(100000, count)):
+        user = await db.read(legacy_find_user, username); await db.write(legacy_add_participant, bill_id, user['user_id'] if user else None, username, cents)
+    print(f"criação participante a participante: {(time.perf_counter() - started) * 1000:7.1f} ms ({2 * count + 1} idas ao banco)")
+    started = time.perf_counter()
+    bill_id = await db.write(savie.create_shared_bill, 1, None, -100, "Churrasco", Decimal("1000"), usernames)
+    print(f"create_shared_bill em lote:          {(time.perf_counter() - started) * 1000:7.1f} ms (1 ida ao banco)")
+    await db.write(savie.update_bill_summary_message, bill_id, 10)
+    _, participants = await db.read(savie.get_bill_status, bill_id)
+
+    async def click(participant, editor, bot):
+        await asyncio.sleep(window * participant['id'] % count / count)
+        await db.write(savie.mark_bill_paid, participant['id'], participant['participant_user_id'])
+        if editor: editor.schedule(bot, bill_id)
+        else:
+            bill, rows = await db.read(savie.get_bill_status, bill_id)
+            await bot.edit_message_text(chat_id=bill['group_chat_id'], message_id=bill['summary_message_id'], text=savie_bot.BillSummaryEditor.render(bill, rows))
+
+    bot = CountingBot(); await asyncio.gather(*(click(p, None, bot) for p in participants))
+    print(f"uma edição por clique:   {count} cliques -> {bot.edits} edições (o Telegram aceita ~20/min por grupo)")
+    await db.write(lambda: savie.conn.execute("UPDATE bill_participants SET status = 'pending' WHERE bill_id = ?", (bill_id,)) and savie.conn.commit())
+    bot = CountingBot(); editor = savie_bot.BillSummaryEditor(savie, db, savie_bot.RateLimiter())
+    started = time.perf_counter(); await asyncio.gather(*(click(p, editor, bot) for p in participants))
+    while editor._scheduled: await asyncio.sleep(0.05)
+    print(f"BillSummaryEditor:       {count} cliques -> {bot.edits} edição(ões) em {time.perf_counter() - started:.1f}s (janela {editor.delay:.0f}s)")
+    db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+# Benchmark offline do pipeline de categorização (cache + coalescência + micro-batching)
+# usando o provedor falso local (benchmarks/fake_llm.py) atrás do LLMClient, no lugar do Gemini.
+#
+# Uso: python benchmarks/bench_categorization.py [requisicoes] [descricoes_distintas] [latencia_ms]
+
+import asyncio, os, random, sys, tempfile, time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+from fake_llm import FakeLLMProvider  # noqa: E402
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    latency = (int(sys.argv[3]) if len(sys.argv) > 3 else 300) / 1000
+    # Descrições sem palavra-chave conhecida, com popularidade tipo Zipf (poucas muito repetidas).
+    descriptions = [f"Loja Qwerty {i}" for i in range(distinct)]
+    weights = [1 / (i + 1) for i in range(distinct)]
+    workload = random.Random(42).choices(descriptions, weights=weights, k=requests)
+
+    model = savie_bot.LLMClient(FakeLLMProvider(latency))
+    service = savie_bot.CategorizationService(savie_bot.savie, savie_bot.db, savie_bot.matcher, model=model)
+    started = time.perf_counter()
+    for start in range(0, requests, 200):  # rajadas de 200 mensagens concorrentes
+        await asyncio.gather(*(service.categorize_expense(d) for d in workload[start:start + 200]))
+    elapsed = time.perf_counter() - started
+
+    stats = service.stats
+    print(f"requisições={stats['requests']} tempo={elapsed:.2f}s vazão={stats['requests'] / elapsed:.0f}/s")
+    print(f"cache_hits={stats['cache_hits']} ({stats['cache_hits'] / requests:.0%}) coalescidas={stats['coalesced']} "
+          f"chamadas_ia={stats['ai_calls']} descrições_por_chamada={stats['ai_descriptions'] / max(1, stats['ai_calls']):.1f}")
+    print(f"sem pipeline seriam {requests} chamadas sequenciais ≈ {requests * latency:.0f}s só esperando a IA")
+
+if __name__ == "__main__":
+    asyncio.run(main()); savie_bot.db.close()
@@ -0,0 +1,60 @@
+# Benchmark de carga da camada de banco: latência p99 de "handlers" simulados
+# com centenas de usuários concorrentes, comparando chamadas SQLite direto no
+# event loop contra o SQLiteExecutor (thread escritora + pool de leitura).
+# O número que importa é o lag do event loop: no modo síncrono ele cresce com a
+# carga e congela todos os outros updates.
+#
+# Uso: python benchmarks/bench_db_load.py [usuarios] [mensagens_por_usuario]
+
+import asyncio, os, sys, tempfile, time
+from datetime import date
+from decimal import Decimal
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+savie, db = savie_bot.savie, savie_bot.db
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples); return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def sync_handler(user_id: int, i: int):
+    savie.get_user_profile(user_id)
+    savie.add_expense(user_id, Decimal("12.50"), f"Lanche {i}", "🍽️ Alimentação", date.today())
+    savie.get_monthly_summary(user_id)
+    await asyncio.sleep(0)
+
+async def async_handler(user_id: int, i: int):
+    await db.read(savie.get_user_profile, user_id)
+    await db.write(savie.add_expense, user_id, Decimal("12.50"), f"Lanche {i}", "🍽️ Alimentação", date.today())
+    await db.read(savie.get_monthly_summary, user_id)
+
+async def simulate_user(handler, user_id: int, messages: int, latencies: list):
+    for i in range(messages):
+        started = time.perf_counter(); await handler(user_id, i); latencies.append(time.perf_counter() - started)
+
+async def monitor_loop_lag(lags: list, interval: float = 0.005):
+    # Mede quanto o event loop atrasa para acordar: é o tempo em que outros usuários ficariam travados.
+    while True:
+        expected = time.perf_counter() + interval; await asyncio.sleep(interval); lags.append(max(0.0, time.perf_counter() - expected))
+
+async def run(handler, users: int, messages: int):
+    latencies, lags = [], []; started = time.perf_counter()
+    monitor = asyncio.create_task(monitor_loop_lag(lags))
+    await asyncio.gather(*(simulate_user(handler, 10_000 + u, messages, latencies) for u in range(users)))
+    elapsed = time.perf_counter() - started; monitor.cancel()
+    print(f"{handler.__name__:14s} ops={len(latencies):6d} tempo={elapsed:6.2f}s "
+          f"p50={percentile(latencies, 0.50)*1000:7.1f}ms p95={percentile(latencies, 0.95)*1000:7.1f}ms p99={percentile(latencies, 0.99)*1000:7.1f}ms "
+          f"lag_loop_max={max(lags or [0])*1000:7.1f}ms")
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for u in range(users): savie.register_user(10_000 + u, f"user{u}", "Bench")
+    await run(sync_handler, users, messages)
+    await run(async_handler, users, messages)
+
+if __name__ == "__main__":
+    asyncio.run(main()); db.close()
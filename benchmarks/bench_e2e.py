@@ -0,0 +1,168 @@
+# Teste de carga ponta a ponta, offline: a Application real (handlers, PerUserUpdateProcessor,
+# persistência, SQLiteExecutor, categorização) recebendo Updates sintéticos na update_queue, com o
+# Bot API falso local e o provedor de IA falso (fake_llm) atrás do LLMClient, com latência configurável, sobre um banco
+# pré-populado. Cada usuário simulado segue um roteiro: gasto + clique em Confirmar/Cancelar,
+# parcelamento + Confirmar, botões do teclado e conversa solta (resposta da IA).
+#
+# Mede vazão, latência por update (da entrada na fila ao fim do handler) p50/p95/p99, lag do event
+# loop, espera pelo lock do usuário e espera na fila do SQLite (escritor único / pool de leitura).
+# Com --json o resultado é acrescentado como uma linha JSON, para comparar execuções.
+#
+# Uso: python benchmarks/bench_e2e.py [usuários] [ações_por_usuário] [gastos_pré_existentes_por_usuário]
+#                                     [latência_ia_ms] [latência_telegram_ms] [--json arquivo]
+
+import asyncio, itertools, json, logging, os, random, sys, tempfile, time
+from datetime import date, timedelta
+
+API_PORT = 18081
+os.environ.update({"DB_PATH": os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db"), "BOT_TOKEN": "123:fake",
+                   "TELEGRAM_API_URL": f"http://127.0.0.1:{API_PORT}", "BOT_MODE": "webhook"})
+os.environ.pop("GOOGLE_API_KEY", None); os.environ.pop("WEBHOOK_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+import savie_metrics as metrics  # noqa: E402
+from fake_telegram_api import FakeTelegramAPI, serve  # noqa: E402
+from fake_llm import FakeLLMProvider  # noqa: E402
+from telegram import Update  # noqa: E402
+
+KNOWN = ["Mercado", "Uber", "Padaria", "Farmácia", "Gasolina", "Cinema"]  # resolvidas por palavra-chave
+UNKNOWN = [f"Loja Qwerty {i}" for i in range(200)]  # vão para a IA (cache + micro-batching)
+ITEMS = ["TV", "Notebook", "Geladeira", "Celular", "Sofá"]
+BUTTONS = ["📊 Gastos do Mês", "📈 Por Categoria", "💳 Ver Parcelas"]
+CHATTER = ["Obrigado!", "Valeu, Savie", "Bom dia", "Show de bola"]
+ACTIONS = (("gasto", 0.5), ("parcela", 0.1), ("botao", 0.3), ("conversa", 0.1))
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples); return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+def seed(users: int, expenses_per_user: int, rng: random.Random):
+    # Perfis completos (sem cadastro no meio do teste) e um histórico espalhado pelos últimos 12 meses.
+    savie = savie_bot.savie; today = date.today()
+    rows = [(u, rng.randint(500, 30000), rng.choice(KNOWN + UNKNOWN[:20]), "📦 Outros", today - timedelta(days=rng.randint(0, 365)))
+            for u in range(1, users + 1) for _ in range(expenses_per_user)]
+    with savie.conn:
+        savie.conn.executemany("INSERT INTO users (user_id, username, first_name, full_name, email) VALUES (?, ?, ?, ?, ?)",
+                               ((u, f"user{u}", f"Usuário{u}", f"Usuário{u} Teste", f"user{u}@example.com") for u in range(1, users + 1)))
+        savie.conn.executemany("INSERT INTO expenses (user_id, amount_cents, description, category, date) VALUES (?, ?, ?, ?, ?)", rows)
+        savie.index_recurrence([(u, d, c, k, w) for u, c, d, k, w in rows])
+    return len(rows)
+
+class LoadTest:
+    def __init__(self, application, api: FakeTelegramAPI):
+        self.application, self.api = application, api
+        self._update_ids = itertools.count(1); self._done: dict[int, asyncio.Future] = {}
+        self.latencies: dict[str, list[float]] = {}; self.errors = 0; self.timeouts = 0
+        processor = application.update_processor; original = processor.process_update
+
+        async def tracked(update, coroutine):
+            try: await original(update, coroutine)
+            finally:
+                future = self._done.pop(update.update_id, None) if isinstance(update, Update) else None
+                if future and not future.done(): future.set_result(None)
+        processor.process_update = tracked
+
+        async def on_error(update, context): self.errors += 1
+        application.add_error_handler(on_error)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Usuário{user_id}", "username": f"user{user_id}"}
+
+    async def _send(self, kind: str, payload: dict):
+        update_id = next(self._update_ids); payload["update_id"] = update_id
+        future = self._done[update_id] = asyncio.get_running_loop().create_future()
+        started = time.perf_counter(); await self.application.update_queue.put(Update.de_json(payload, self.application.bot))
+        try: await asyncio.wait_for(future, timeout=30)
+        except asyncio.TimeoutError: self.timeouts += 1; self._done.pop(update_id, None); return
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - started)
+
+    async def text(self, kind: str, user_id: int, text: str):
+        self.api.keyboards.pop(user_id, None)
+        chat = {"id": user_id, "type": "private", "first_name": f"Usuário{user_id}"}
+        await self._send(kind, {"message": {"message_id": 1, "date": int(time.time()), "chat": chat, "from": self._user(user_id), "text": text}})
+
+    async def click(self, user_id: int, prefix: str):
+        data = next((d for d in self.api.keyboards.get(user_id, ()) if d.startswith(prefix)), None)
+        if data is None: return
+        chat = {"id": user_id, "type": "private", "first_name": f"Usuário{user_id}"}
+        await self._send("callback", {"callback_query": {"id": str(next(self._update_ids)), "from": self._user(user_id), "chat_instance": str(user_id), "data": data,
+                                                         "message": {"message_id": 1000, "date": int(time.time()), "chat": chat, "text": "preview"}}})
+
+    async def session(self, user_id: int, actions: int, rng: random.Random):
+        names, weights = zip(*ACTIONS)
+        for action in rng.choices(names, weights=weights, k=actions):
+            if action == "gasto":
+                await self.text("gasto", user_id, f"{rng.choice(KNOWN + UNKNOWN)} {rng.randint(5, 300)},{rng.randint(0, 99):02d}")
+                await self.click(user_id, savie_bot.CALLBACK_CONFIRM_EXPENSE if rng.random() < 0.85 else savie_bot.CALLBACK_CANCEL)
+            elif action == "parcela":
+                await self.text("parcela", user_id, f"{rng.choice(ITEMS)} {rng.randint(300, 5000)} em {rng.randint(2, 12)}x")
+                await self.click(user_id, savie_bot.CALLBACK_CONFIRM_INSTALLMENT)
+            elif action == "botao": await self.text("botao", user_id, rng.choice(BUTTONS))
+            else: await self.text("conversa", user_id, rng.choice(CHATTER))
+
+async def monitor_loop_lag(lags: list, interval: float = 0.005):
+    while True:
+        expected = time.perf_counter() + interval; await asyncio.sleep(interval); lags.append(max(0.0, time.perf_counter() - expected))
+
+def histogram_summary(name: str, **labels) -> tuple[float, float, int]:
+    # (média, p95 pelo limite do bucket, amostras) de um histograma do savie_metrics.
+    histogram = metrics.registry.histograms.get(metrics._key(name, labels))
+    if not histogram or not histogram.count: return 0.0, 0.0, 0
+    return histogram.sum / histogram.count, histogram.quantile(0.95), histogram.count
+
+async def main():
+    args = sys.argv[1:]; json_path = None
+    if "--json" in args: json_path = args[args.index("--json") + 1]; del args[args.index("--json"):args.index("--json") + 2]
+    users = int(args[0]) if len(args) > 0 else 200
+    actions = int(args[1]) if len(args) > 1 else 10
+    seeded = int(args[2]) if len(args) > 2 else 200
+    ai_latency = (int(args[3]) if len(args) > 3 else 300) / 1000
+    telegram_latency = (int(args[4]) if len(args) > 4 else 20) / 1000
+    rng = random.Random(42)
+
+    logging.getLogger().setLevel(logging.WARNING); logging.getLogger("httpx").setLevel(logging.WARNING)
+    started = time.perf_counter(); expenses = seed(users, seeded, rng)
+    print(f"banco: {users} usuários, {expenses:,} gastos pré-existentes ({time.perf_counter() - started:.1f}s)")
+
+    provider = FakeLLMProvider(ai_latency); savie_bot.llm = savie_bot.categorizer.model = savie_bot.LLMClient(provider)
+    api = FakeTelegramAPI(latency=telegram_latency); runner = await serve(API_PORT, api=api)
+    application = savie_bot.build_application()
+    if application.job_queue:
+        for job in application.job_queue.jobs(): job.schedule_removal()  # o scheduler diário não entra na medição
+    test = LoadTest(application, api)
+    await application.initialize(); await application.post_init(application); await application.start()
+
+    metrics.registry.reset(); lags = []; monitor = asyncio.create_task(monitor_loop_lag(lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(test.session(u, actions, random.Random(u)) for u in range(1, users + 1)))
+    elapsed = time.perf_counter() - started; monitor.cancel()
+
+    all_latencies = [value for values in test.latencies.values() for value in values]
+    lock_mean, lock_p95, _ = histogram_summary("savie_update_lock_wait_seconds")
+    handler_stats = [(kind, *histogram_summary("savie_update_seconds", kind=kind)) for kind in ("message", "callback_query")]
+    write_mean, write_p95, writes = histogram_summary("savie_db_wait_seconds", op="write")
+    read_mean, read_p95, reads = histogram_summary("savie_db_wait_seconds", op="read")
+    print(f"updates={len(all_latencies)} tempo={elapsed:.2f}s vazão={len(all_latencies) / elapsed:.1f} updates/s "
+          f"erros={test.errors} timeouts={test.timeouts} chamadas_bot_api={len(api.calls)} chamadas_ia={provider.calls}")
+    for kind, values in sorted(test.latencies.items()) + [("total", all_latencies)]:
+        print(f"  {kind:9s} n={len(values):6d} p50={percentile(values, 0.50)*1000:7.1f}ms p95={percentile(values, 0.95)*1000:7.1f}ms p99={percentile(values, 0.99)*1000:7.1f}ms")
+    print(f"lag do event loop: p50={percentile(lags, 0.50)*1000:.1f}ms p99={percentile(lags, 0.99)*1000:.1f}ms máx={max(lags or [0])*1000:.1f}ms")
+    # A diferença entre a latência total e o tempo no handler é fila: espera por uma das CONCURRENT_UPDATES vagas.
+    print("tempo no handler: " + " | ".join(f"{kind} média={mean*1000:.1f}ms p95≤{p95*1000:.0f}ms" for kind, mean, p95, _ in handler_stats) + f" (CONCURRENT_UPDATES={savie_bot.CONCURRENT_UPDATES})")
+    print(f"lock por usuário: média={lock_mean*1000:.2f}ms p95≤{lock_p95*1000:.1f}ms")
+    print(f"fila do SQLite: escrita n={writes} média={write_mean*1000:.2f}ms p95≤{write_p95*1000:.1f}ms | leitura n={reads} média={read_mean*1000:.2f}ms p95≤{read_p95*1000:.1f}ms")
+
+    if json_path:
+        result = {"when": time.strftime("%Y-%m-%dT%H:%M:%S"), "users": users, "actions": actions, "seeded": expenses, "ai_ms": ai_latency * 1000,
+                  "telegram_ms": telegram_latency * 1000, "updates": len(all_latencies), "elapsed": round(elapsed, 3), "throughput": round(len(all_latencies) / elapsed, 2),
+                  "p50": percentile(all_latencies, 0.50), "p95": percentile(all_latencies, 0.95), "p99": percentile(all_latencies, 0.99),
+                  "loop_lag_p99": percentile(lags, 0.99), "loop_lag_max": max(lags or [0]), "lock_wait_mean": lock_mean,
+                  "db_write_wait_mean": write_mean, "db_read_wait_mean": read_mean, "errors": test.errors, "timeouts": test.timeouts}
+        with open(json_path, "a", encoding="utf-8") as out: out.write(json.dumps(result) + "\n")
+
+    await application.stop(); await application.post_stop(application)
+    await application.shutdown(); await application.post_shutdown(application); await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
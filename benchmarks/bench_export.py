@@ -0,0 +1,50 @@
+# Benchmark de exportação: o caminho antigo (fetchall + StringIO + BytesIO) contra o
+# export_csv em blocos para arquivo temporário, com N gastos de um mesmo usuário.
+# Mede tempo, pico de memória Python (tracemalloc) e tamanho/quantidade das partes.
+#
+# Uso: python benchmarks/bench_export.py [gastos] [MB por parte]
+
+import csv, io, os, sys, tempfile, time, tracemalloc
+from datetime import date, timedelta
+
+workdir = tempfile.mkdtemp(prefix="savie_bench_")
+os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+def legacy_export(savie, user_id: int) -> int:
+    cursor = savie.conn.cursor(); cursor.execute("SELECT date, description, category, amount_cents, installment_id FROM expenses WHERE user_id = ? ORDER BY date, id", (user_id,))
+    rows = cursor.fetchall(); output = io.StringIO(); writer = csv.writer(output)
+    writer.writerow(['Data', 'Descrição', 'Categoria', 'Valor', 'Parcelamento'])
+    for row in rows: writer.writerow([row[0], row[1], row[2], savie_bot.from_cents(row[3]), row[4]])
+    document = io.BytesIO(output.getvalue().encode('utf-8')); return len(document.getvalue())
+
+def measure(label: str, fn):
+    # Tempo medido sem tracemalloc (que distorce o custo por alocação); pico medido numa segunda execução.
+    started = time.perf_counter(); result = fn(); elapsed = time.perf_counter() - started
+    tracemalloc.start(); fn(); peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    print(f"{label:34s} {elapsed:7.2f}s  pico {peak / 2**20:8.1f} MB  {result}")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    part_bytes = int(float(sys.argv[2]) * 2**20) if len(sys.argv) > 2 else savie_bot.EXPORT_PART_BYTES
+    savie = savie_bot.savie; start = date.today() - timedelta(days=3650)
+    with savie.conn:
+        savie.conn.executemany("INSERT INTO expenses (user_id, amount_cents, description, category, date) VALUES (?, ?, ?, ?, ?)",
+                               ((1, 100 + i % 9000, f"Compra número {i} no mercado", "🍽️ Alimentação", start + timedelta(days=i % 3650)) for i in range(count)))
+    out = os.path.join(workdir, "out"); os.mkdir(out)
+
+    def streaming(compress: bool):
+        paths, rows = savie.export_csv('gastos', (1,), out, compress, part_bytes)
+        sizes = [os.path.getsize(p) for p in paths]
+        for p in paths: os.remove(p)
+        return f"{rows} linhas, {len(paths)} parte(s), {sum(sizes) / 2**20:.1f} MB"
+
+    measure(f"fetchall + StringIO ({count})", lambda: f"{legacy_export(savie, 1) / 2**20:.1f} MB")
+    measure("export_csv em blocos (csv)", lambda: streaming(False))
+    measure("export_csv em blocos (csv.gz)", lambda: streaming(True))
+    savie_bot.db.close()
+
+if __name__ == "__main__":
+    main()
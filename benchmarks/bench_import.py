@@ -0,0 +1,69 @@
+# Importação de extratos: gera um CSV de conta corrente (separador ";", valores "1.234,56", saídas negativas)
+# com N lançamentos ao longo de um ano e mede a prévia (leitura), a gravação (leitura com as linhas guardadas e
+# só o INSERT na thread escritora, que é o tempo em que as escritas dos outros usuários esperam) e a reimportação
+# do mesmo arquivo (tudo duplicado), com o pico de memória Python (tracemalloc) da prévia e da gravação (as linhas
+# prontas vão para um arquivo em blocos e o escritor as lê um bloco por vez). Como referência, o
+# caminho antigo: um add_expense (um commit) por lançamento, numa amostra extrapolada.
+#
+# Uso: python benchmarks/bench_import.py [lançamentos]
+
+import os, random, sys, tempfile, time, tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+WORKDIR = tempfile.mkdtemp(prefix="savie_import_")
+os.environ["DB_PATH"] = os.path.join(WORKDIR, "import.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+MERCHANTS = ["COMPRA CARTAO - IFOOD *RESTAURANTE", "UBER *TRIP", "SUPERMERCADO DIA", "POSTO SHELL", "DROGARIA SAO PAULO", "PAG*NETFLIX.COM",
+             "PIX ENVIADO - MARIA SILVA", "CINEMARK", "PADARIA PAO QUENTE", "ENEL DISTRIBUICAO", "AMAZON MARKETPLACE", "ACADEMIA SMART FIT"]
+
+def write_statement(path: str, rows: int, rng: random.Random):
+    start = date.today() - timedelta(days=365)
+    with open(path, "w", encoding="cp1252") as handle:
+        handle.write("Extrato Conta Corrente\nAgência: 1234 Conta: 56789-0\n\nData;Lançamento;Valor (R$);Saldo (R$)\n")
+        for i in range(rows):
+            day = start + timedelta(days=365 * i // rows)
+            if rng.random() < 0.05: description, cents = "TED RECEBIDA - SALARIO", rng.randint(100_000, 900_000)
+            else: description, cents = f"{rng.choice(MERCHANTS)} {rng.randint(1, 9999):04d}", -rng.randint(500, 50_000)
+            value = f"{abs(cents) // 100:,}".replace(",", ".") + f",{abs(cents) % 100:02d}"
+            handle.write(f"{day:%d/%m/%Y};{description};{'-' if cents < 0 else ''}{value};0,00\n")
+
+def measure(label: str, function, *args) -> dict:
+    started = time.perf_counter(); result = function(*args); elapsed = time.perf_counter() - started
+    print(f"{label:34s} {elapsed:6.2f}s  gastos={result['count']:6d}  duplicados={result['duplicates']:6d}  entradas={result['credits']:5d}")
+    return result
+
+def import_statement(user_id: int, path: str, matcher, fallback: str) -> dict:
+    # O caminho do bot: scan_statement numa conexão de leitura, insert_statement no escritor.
+    spill = os.path.join(WORKDIR, "linhas"); stats = savie_bot.savie.scan_statement(user_id, path, matcher, fallback, spill); started = time.perf_counter()
+    savie_bot.savie.insert_statement(user_id, spill, stats); stats['writer_seconds'] = time.perf_counter() - started
+    return stats
+
+def peak_memory(function, *args) -> float:
+    # Em separado: o tracemalloc deixa o Python várias vezes mais lento e distorceria os tempos.
+    tracemalloc.start(); function(*args); peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop(); return peak / 1024 / 1024
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    savie = savie_bot.savie; savie.register_user(1, "ana", "Ana"); savie.update_user_profile(1, "Ana Souza", "ana@example.com")
+    path = os.path.join(WORKDIR, "extrato.csv"); write_statement(path, rows, random.Random(7))
+    print(f"extrato com {rows} lançamentos, {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+    args = (1, path, savie_bot.matcher, savie_bot.categorizer.FALLBACK_CATEGORY)
+    measure("prévia", savie.scan_statement, *args); fresh = peak_memory(savie.scan_statement, *args)
+    writing = peak_memory(import_statement, 3, *args[1:])  # outro usuário: o 1 continua sem nada importado
+    result = measure("gravação (leitura + uma transação)", import_statement, *args)
+    print(f"{'':34s} escritor ocupado {result['writer_seconds']:.2f}s, {result['count'] / result['writer_seconds']:.0f} gastos/s, {len(result['categories'])} categorias")
+    measure("mesmo extrato de novo", import_statement, *args); repeated = peak_memory(savie.scan_statement, *args)
+    print(f"pico de memória Python: prévia {fresh:.1f} MB, gravação {writing:.1f} MB, prévia com tudo já importado {repeated:.1f} MB (chaves dos gastos existentes no período)")
+
+    sample = min(2000, rows); started = time.perf_counter()
+    for i in range(sample): savie.add_expense(2, Decimal("12.34"), f"UBER *TRIP {i}", "🚗 Transporte", date.today())
+    per_row = (time.perf_counter() - started) / sample
+    print(f"{'add_expense por lançamento':34s} {per_row * rows:6.2f}s  (estimado para {rows} a partir de {sample}: {1 / per_row:.0f} gastos/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Microbenchmark: categorização por palavra-chave com o loop antigo (SELECT na tabela
+# categories + split + teste de substring a cada mensagem) contra o KeywordMatcher compilado.
+#
+# Uso: python benchmarks/bench_keyword_matcher.py [categorias] [palavras_por_categoria] [mensagens]
+
+import os, random, sys, tempfile, time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+def legacy_match(conn, description: str):
+    desc_lower = description.lower(); cursor = conn.cursor()
+    cursor.execute('SELECT name, keywords, emoji FROM categories')
+    for cat in cursor.fetchall():
+        if any(keyword.strip() in desc_lower for keyword in cat['keywords'].split(',')): return f"{cat['emoji']} {cat['name']}"
+    return None
+
+def main():
+    categories = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_category = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+    rng = random.Random(7)
+    words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(5, 10))) for _ in range(categories * per_category)]
+    savie = savie_bot.savie
+    with savie.conn:
+        savie.conn.executemany("INSERT INTO categories (name, keywords, emoji) VALUES (?, ?, ?)",
+                               [(f"Bench {c}", ','.join(words[c * per_category:(c + 1) * per_category]), "🧪") for c in range(categories)])
+    corpus = [f"compra {rng.choice(words)} no centro" if rng.random() < 0.7 else f"gasto diverso {i}" for i in range(messages)]
+
+    started = time.perf_counter(); legacy = [legacy_match(savie.conn, text) for text in corpus]; legacy_time = time.perf_counter() - started
+    matcher = savie_bot.KeywordMatcher()
+    started = time.perf_counter(); matcher.build(*savie.get_keyword_catalog()); build_time = time.perf_counter() - started
+    started = time.perf_counter(); compiled = [matcher.match(text) for text in corpus]; compiled_time = time.perf_counter() - started
+
+    agreement = sum(a == b for a, b in zip(legacy, compiled)) / messages
+    print(f"palavras-chave={len(words)} mensagens={messages}")
+    print(f"loop antigo: {legacy_time / messages * 1e6:8.1f} µs/mensagem")
+    print(f"matcher:     {compiled_time / messages * 1e6:8.1f} µs/mensagem (build único em {build_time * 1000:.1f} ms) -> {legacy_time / compiled_time:.0f}x")
+    print(f"concordância entre os dois: {agreement:.1%}")
+
+if __name__ == "__main__":
+    main(); savie_bot.db.close()
@@ -0,0 +1,58 @@
+# Comportamento da categorização por IA com o provedor degradado, usando o provedor falso local.
+# Mensagens chegam a uma taxa fixa (laço aberto) com descrições inéditas (sem cache); no meio da
+# execução o provedor fica lento por alguns segundos. Compara a chamada direta ao modelo (como era o
+# GeminiModel: sem prazo, sem limite) com o LLMClient (semáforo, prazo, backoff e disjuntor), e depois
+# mede o LLMClient com 30% de erros de cota para ver as novas tentativas funcionando.
+#
+# Uso: python benchmarks/bench_llm.py [mensagens_por_segundo] [duração_s] [latência_degradada_s]
+
+import asyncio, logging, os, sys, tempfile, time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+from fake_llm import FakeLLMProvider  # noqa: E402
+
+class DirectModel:
+    """O caminho antigo: uma chamada por lote, direto no modelo, sem prazo nem limite de concorrência."""
+    available = True
+    def __init__(self, model): self.model = model
+    async def generate(self, prompt: str, purpose: str = "categorize") -> str:
+        return (await self.model.generate_content_async(prompt)).text
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples); return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+async def scenario(label: str, model, provider: FakeLLMProvider, rate: float, duration: float, degrade_at: float | None, degraded_latency: float):
+    service = savie_bot.CategorizationService(savie_bot.savie, savie_bot.db, savie_bot.matcher, model=model)
+    latencies, fallbacks = [], 0
+    async def message(i: int):
+        nonlocal fallbacks
+        started = time.perf_counter(); category = await service.categorize_expense(f"Loja {label} {i}")
+        latencies.append(time.perf_counter() - started); fallbacks += category == service.FALLBACK_CATEGORY
+    tasks, started = [], time.perf_counter()
+    for i in range(int(rate * duration)):
+        if degrade_at is not None and i == int(rate * degrade_at): provider.degrade(duration / 3, degraded_latency)
+        tasks.append(asyncio.create_task(message(i))); await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks); elapsed = time.perf_counter() - started
+    stats = getattr(model, 'stats', {})
+    print(f"{label:28s} n={len(latencies)} p50={percentile(latencies, 0.5)*1000:7.0f}ms p99={percentile(latencies, 0.99)*1000:7.0f}ms máx={max(latencies)*1000:7.0f}ms "
+          f"fallback={fallbacks / len(latencies):5.1%} chamadas_ao_provedor={provider.calls} pico_em_voo={provider.max_inflight} tempo={elapsed:.1f}s")
+    if stats: print(f"{'':28s} {stats}")
+
+async def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 12
+    degraded_latency = float(sys.argv[3]) if len(sys.argv) > 3 else 15
+    logging.getLogger("savie_bot").setLevel(logging.ERROR)
+    provider = FakeLLMProvider(0.2, jitter=0.3)
+    await scenario("direto, provedor lento", DirectModel(provider), provider, rate, duration, duration / 6, degraded_latency)
+    provider = FakeLLMProvider(0.2, jitter=0.3)
+    await scenario("LLMClient, provedor lento", savie_bot.LLMClient(provider, timeout=3, reset_timeout=2), provider, rate, duration, duration / 6, degraded_latency)
+    provider = FakeLLMProvider(0.2, jitter=0.3, quota_rate=0.3)
+    await scenario("LLMClient, 30% de 429", savie_bot.LLMClient(provider, timeout=5), provider, rate, duration / 2, None, 0)
+
+if __name__ == "__main__":
+    asyncio.run(main()); savie_bot.db.close()
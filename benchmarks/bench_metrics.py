@@ -0,0 +1,42 @@
+# Custo da instrumentação: chamada pura contra @timed e timer() ligados e desligados, e o
+# round-trip db.read(savie.ping) com e sem métricas no SQLiteExecutor.
+#
+# Uso: python benchmarks/bench_metrics.py [iterações]
+
+import asyncio, os, sys, tempfile, time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_bench_"), "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_metrics as metrics  # noqa: E402
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+def per_call(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations): fn()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+def with_timer():
+    with metrics.timer("bench_seconds", kind="cm"): pass
+
+def noop(): pass
+
+async def db_round_trips(iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations): await savie_bot.db.read(savie_bot.savie.ping)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    results = {}
+    for enabled in (False, True):
+        metrics.ENABLED = enabled; decorated = metrics.timed("bench_seconds", kind="decorator")(noop)
+        results[enabled] = (per_call(decorated, iterations), per_call(with_timer, iterations), asyncio.run(db_round_trips(iterations // 20)))
+    print(f"chamada pura:                {per_call(noop, iterations):8.0f} ns")
+    for enabled, (decorator, cm, db) in results.items():
+        state = "ligado " if enabled else "desligado"
+        print(f"@timed {state}:            {decorator:8.0f} ns   timer() {cm:6.0f} ns   db.read(ping) {db:6.1f} µs")
+    savie_bot.db.close()
+
+if __name__ == "__main__":
+    main()
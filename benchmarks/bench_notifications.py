@@ -0,0 +1,67 @@
+# Benchmark da fila de notificações contra o Bot API falso com flood control ligado:
+# disparo ingênuo (todos os send_message de uma vez, como um loop com gather) contra o
+# NotificationDispatcher. Mede vazão, 429 recebidos, mensagens perdidas e os intervalos
+# observados no servidor (pico global por segundo e menor intervalo num mesmo chat).
+#
+# Uso: python benchmarks/bench_notifications.py [mensagens] [chats]
+
+import asyncio, logging, os, sys, tempfile, time
+
+workdir = tempfile.mkdtemp(prefix="savie_bench_")
+os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+from fake_telegram_api import FakeTelegramAPI, serve  # noqa: E402
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+PORT = 8091; BLOCKED = {999_999}
+
+def new_bot() -> Bot:
+    return Bot("123:fake", base_url=f"http://127.0.0.1:{PORT}/bot", request=HTTPXRequest(connection_pool_size=64))
+
+def observed(api: FakeTelegramAPI) -> str:
+    times = sorted(t for t, _ in api.delivered); peak = 0; start = 0
+    for end, t in enumerate(times):
+        while t - times[start] >= 1.0: start += 1
+        peak = max(peak, end - start + 1)
+    by_chat: dict[int, list[float]] = {}
+    for t, chat in api.delivered: by_chat.setdefault(chat, []).append(t)
+    gaps = [b - a for ts in by_chat.values() for a, b in zip(sorted(ts), sorted(ts)[1:])]
+    return f"pico {peak}/s, menor intervalo no chat {min(gaps) if gaps else 0:.2f}s"
+
+async def naive(messages: list[tuple[int, str]]):
+    api = FakeTelegramAPI(enforce_limits=True, blocked_chats=BLOCKED); runner = await serve(PORT, api=api)
+    async with new_bot() as bot:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bot.send_message(chat_id=chat_id, text=text) for chat_id, text in messages), return_exceptions=True)
+    elapsed = time.perf_counter() - started; lost = sum(isinstance(r, Exception) for r in results)
+    print(f"ingênuo:     {elapsed:6.2f}s  entregues {len(api.delivered)}/{len(messages)}  perdidas {lost}  429={api.errors[429]}  {observed(api)}")
+    await runner.cleanup()
+
+async def dispatcher(messages: list[tuple[int, str]]):
+    api = FakeTelegramAPI(enforce_limits=True, flood_every=97, blocked_chats=BLOCKED); runner = await serve(PORT, api=api)
+    savie, db = savie_bot.savie, savie_bot.db
+    notifier = savie_bot.NotificationDispatcher(savie, db, poll_interval=0.2)
+    async with new_bot() as bot:
+        started = time.perf_counter(); notifier.start(bot)
+        await notifier.enqueue_many([notifier.message(chat_id, text, fallback_chat_id=-1 if chat_id in BLOCKED else None, fallback_text="PS: aviso alternativo") for chat_id, text in messages])
+        while (await db.read(savie.count_outbound_messages)).get('pending'): await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started; await notifier.stop()
+    print(f"dispatcher:  {elapsed:6.2f}s  entregues {len(api.delivered)}/{len(messages)}  falhas {notifier.stats['failed']}  429={api.errors[429]}  {observed(api)}")
+    print(f"             stats {notifier.stats}  fila {await db.read(savie.count_outbound_messages)}")
+    await runner.cleanup()
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    messages = [(1000 + i % chats, f"Notificação {i}") for i in range(count)] + [(next(iter(BLOCKED)), "Você foi incluído numa conta")]
+    await naive(messages)
+    await dispatcher(messages)
+    savie_bot.db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+# Microbenchmark do interpretador de gastos: o caminho antigo (re.search/re.sub sem compilar no
+# parse_expense_text, mais a busca de parcelas no handle_message) contra o parse_expense_text de
+# passada única com a expressão pré-compilada, sobre as mensagens do corpus do check_parser.
+# Nota: o cache interno do módulo re esconde parte do custo de compilar; com mais de 512 padrões
+# distintos em uso no processo (caso real do bot) o caminho antigo recompila.
+#
+# Uso: python benchmarks/bench_parser.py [iterações]
+
+import os, re, sys, time
+from decimal import Decimal, InvalidOperation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import savie_bot  # noqa: E402
+from check_parser import CORPUS  # noqa: E402
+
+def legacy_parse(text: str) -> dict | None:
+    match = re.search(r'(\d[\d.,]*)', text)
+    if not match: return None
+    amount_str = match.group(1).replace('.', '').replace(',', '.')
+    try: amount = Decimal(amount_str)
+    except InvalidOperation: return None
+    desc = re.sub(r'(\d[\d.,]*)', '', text, 1); desc = re.sub(r'\b(gastei|comprei|paguei|valor|preço|reais|r\$)\b', '', desc, flags=re.I)
+    parsed = {'amount': amount, 'description': ' '.join(desc.split()).strip().capitalize() or "Gasto não especificado"}
+    text_lower = text.lower()
+    if any(keyword in text_lower for keyword in ['x', 'vezes', 'parcela']):
+        installments = re.search(r'(\d+)\s*(x|vezes|parcela)', text_lower)
+        parsed['installments'] = int(installments.group(1)) if installments else None
+    return parsed
+
+def run(label: str, fn, messages: list[str], iterations: int):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages: fn(message)
+    elapsed = time.perf_counter() - started; calls = iterations * len(messages)
+    print(f"{label:34s} {calls / elapsed:10,.0f} mensagens/s  {elapsed / calls * 1e6:6.2f} µs/mensagem")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    messages = [text for text, *_ in CORPUS]
+    run("antigo (re sem compilar)", legacy_parse, messages, iterations)
+    run("antigo sem cache do re", lambda m: (re.purge(), legacy_parse(m)), messages, iterations // 10)
+    run("parse_expense_text (compilado)", savie_bot.parse_expense_text, messages, iterations)
+    run("canned_reply", savie_bot.canned_reply, messages, iterations)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Vazão da leitura de recibos: fotos de recibo geradas localmente (JPEG de câmera, 3000x4000) passam
+# pelo ReceiptReader com 1 e 2 processos e, como referência, pelo mesmo OCR rodando direto no event
+# loop. Mede fotos/s, latência e o lag do event loop enquanto as fotos são lidas; depois uma rajada
+# acima de OCR_MAX_PENDING (quantas são recusadas) e a mesma rajada repetida (cache por hash).
+# Sem o binário do tesseract instalado, mede só o preparo da imagem (decodificar, reduzir, cinza),
+# que é o que o pool faz antes do OCR.
+#
+# Uso: python benchmarks/bench_receipts.py [fotos]
+
+import asyncio, io, os, random, shutil, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+HAS_TESSERACT = shutil.which("tesseract") is not None
+STORES = ["SUPERMERCADO BOM PRECO", "DROGARIA SAO JOAO", "PADARIA PAO QUENTE", "POSTO SHELL", "RESTAURANTE SABOR"]
+
+def prepare_only(data: bytes) -> str:
+    image = savie_bot.prepare_receipt_image(data); return f"{image.width}x{image.height}"
+
+READER = savie_bot.read_receipt_image if HAS_TESSERACT else prepare_only
+
+def sample_receipt(rng: random.Random) -> bytes:
+    # Recibo branco sobre fundo cinza, levemente girado e com ruído, como uma foto de celular.
+    lines = [rng.choice(STORES), "CNPJ 12.345.678/0001-90", f"{rng.randint(1, 28):02d}/10/2026 14:{rng.randint(0, 59):02d}"]
+    total = 0
+    for item in range(rng.randint(4, 12)):
+        price = rng.randint(100, 5000); total += price; lines.append(f"ITEM {item + 1:02d} PRODUTO {rng.randint(100, 999)}   {price / 100:.2f}".replace(".", ","))
+    lines += [f"TOTAL R$ {total / 100:.2f}".replace(".", ","), "OBRIGADO PELA PREFERENCIA"]
+    font = ImageFont.load_default(size=64); paper = Image.new("L", (2200, 160 + 110 * len(lines)), 250); draw = ImageDraw.Draw(paper)
+    for i, line in enumerate(lines): draw.text((120, 80 + 110 * i), line, fill=20, font=font)
+    photo = Image.new("L", (3000, 4000), 90); photo.paste(paper.rotate(rng.uniform(-3, 3), expand=True, fillcolor=90), (300, 200))
+    noise = Image.effect_noise((3000, 4000), 12); photo = Image.blend(photo, noise, 0.15).convert("RGB")
+    buffer = io.BytesIO(); photo.save(buffer, "JPEG", quality=88); return buffer.getvalue()
+
+async def measure_lag(lags: list, interval: float = 0.005):
+    while True:
+        expected = time.perf_counter() + interval; await asyncio.sleep(interval); lags.append(max(0.0, time.perf_counter() - expected))
+
+async def run(label: str, photos: list[bytes], read, concurrency: int = 4):
+    lags, latencies = [], []; monitor = asyncio.create_task(measure_lag(lags)); queue = list(photos); await asyncio.sleep(0)
+    async def user():
+        while queue:
+            data = queue.pop(); started = time.perf_counter(); await read(data); latencies.append(time.perf_counter() - started)
+    started = time.perf_counter(); await asyncio.gather(*(user() for _ in range(concurrency))); elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.02); monitor.cancel()  # deixa o monitor registrar o atraso do último bloqueio
+    lags.sort()
+    print(f"{label:28s} {len(photos) / elapsed:6.2f} fotos/s  p50={statistics.median(latencies) * 1000:6.0f}ms  máx={max(latencies) * 1000:6.0f}ms  "
+          f"lag do loop p99={lags[int(len(lags) * 0.99)] * 1000 if lags else 0:6.1f}ms máx={max(lags or [0]) * 1000:6.0f}ms")
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    rng = random.Random(7); photos = [sample_receipt(rng) for _ in range(count)]
+    print(f"{count} fotos de {statistics.mean(map(len, photos)) / 1024:.0f} KB em média; "
+          f"{'OCR com tesseract' if HAS_TESSERACT else 'tesseract ausente: só o preparo da imagem'}")
+    if HAS_TESSERACT: print("texto lido:", savie_bot.parse_receipt_text(savie_bot.read_receipt_image(photos[0])))
+
+    async def inline(data: bytes): return READER(data)
+    await run("direto no event loop", photos, inline)
+    for workers in (1, 2):
+        reader = savie_bot.ReceiptReader(workers=workers, max_pending=64, reader=READER)
+        await reader.read(photos[0]); reader._cache.clear()  # sobe o processo antes de medir
+        await run(f"ReceiptReader, {workers} processo(s)", photos, reader.read); reader.close()
+
+    reader = savie_bot.ReceiptReader(workers=1, max_pending=savie_bot.OCR_MAX_PENDING, reader=READER); burst = photos * (3 * savie_bot.OCR_MAX_PENDING // len(photos) + 1)
+    burst = burst[:3 * savie_bot.OCR_MAX_PENDING]
+    results = await asyncio.gather(*(reader.read(data) for data in burst), return_exceptions=True)
+    rejected = sum(isinstance(result, savie_bot.ReceiptBusy) for result in results)
+    print(f"rajada de {len(burst)} fotos com OCR_MAX_PENDING={savie_bot.OCR_MAX_PENDING}: {rejected} recusadas, {reader.stats['coalesced']} repetidas em voo, {reader.stats['ocr_runs']} leituras")
+    started = time.perf_counter(); await asyncio.gather(*(reader.read(data) for data in photos[:savie_bot.OCR_MAX_PENDING]))
+    print(f"mesmas fotos de novo: {reader.stats['cache_hits']} acertos no cache em {(time.perf_counter() - started) * 1000:.1f}ms"); reader.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
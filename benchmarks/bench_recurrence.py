@@ -0,0 +1,84 @@
+# Benchmark do detector de recorrência em históricos sintéticos: assinaturas reais com variações de
+# descrição ("Netflix", "Netflix mensal", "NETFLIX.COM") e de valor (±3%) misturadas a gastos comuns.
+# Compara a consulta antiga (descrição exata, COUNT DISTINCT de meses) com o índice de recorrência em
+# precisão/recall e consultas por segundo, e mede o job em lote propose_subscriptions.
+#
+# Uso: python benchmarks/bench_recurrence.py [usuários] [meses]
+
+import os, random, sys, tempfile, time
+from datetime import date
+from decimal import Decimal
+
+workdir = tempfile.mkdtemp(prefix="savie_bench_")
+os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+SUBSCRIPTIONS = {"Netflix": 3990, "Spotify": 2190, "Academia Smart Fit": 11990, "Amazon Prime": 1490, "Internet Claro": 9990, "Plano de Saúde": 45000}
+VARIANTS = ["{}", "{} mensal", "{}.com", "Pagamento {}", "{} - assinatura"]
+EVERYDAY = ["Mercado", "Uber", "Padaria", "Restaurante", "Farmácia", "Gasolina", "Lanche", "Cinema", "Presente", "Roupa"]
+
+def legacy_find(savie, user_id: int, description: str, amount: Decimal, today: date) -> bool:
+    cursor = savie.conn.cursor(); amount_min = savie_bot.to_cents(amount * Decimal('0.95')); amount_max = savie_bot.to_cents(amount * Decimal('1.05'))
+    cursor.execute("SELECT 1 FROM recurring_expenses WHERE user_id = ? AND description = ?", (user_id, description))
+    if cursor.fetchone(): return False
+    cursor.execute("SELECT COUNT(DISTINCT strftime('%Y-%m', date)) FROM expenses WHERE user_id = ? AND description = ? AND amount_cents BETWEEN ? AND ? AND date >= ?",
+                   (user_id, description, amount_min, amount_max, savie_bot.add_months(today, -3)))
+    return cursor.fetchone()[0] >= 2
+
+def synthesize(users: int, months: int, today: date, rng: random.Random):
+    expenses, truth, probes = [], set(), []
+    first = savie_bot.add_months(today.replace(day=1), -(months - 1))
+    for user_id in range(1, users + 1):
+        subs = rng.sample(sorted(SUBSCRIPTIONS), rng.randint(0, 3))
+        for name in subs:
+            truth.add((user_id, name)); day = rng.randint(1, 28); start = rng.randint(0, months - 3)
+            for m in range(start, months):
+                when = savie_bot.add_months(first, m).replace(day=min(day, today.day) if m == months - 1 else day)
+                desc = rng.choice(VARIANTS).format(name); cents = round(SUBSCRIPTIONS[name] * rng.uniform(0.97, 1.03))
+                expenses.append((user_id, cents, desc, "🎉 Lazer", when))
+                if m == months - 1: probes.append((user_id, desc, cents, name))
+        for m in range(months):
+            month_start = savie_bot.add_months(first, m)
+            for _ in range(rng.randint(10, 20)):
+                when = month_start.replace(day=rng.randint(1, today.day if m == months - 1 else 28)); desc = rng.choice(EVERYDAY)
+                expenses.append((user_id, rng.randint(1000, 30000), desc, "📦 Outros", when))
+                if m == months - 1: probes.append((user_id, desc, expenses[-1][1], None))
+    expenses.sort(key=lambda e: e[4]); return expenses, truth, probes
+
+def score(label: str, predictions: list[bool], labels: list[bool], elapsed: float):
+    tp = sum(p and l for p, l in zip(predictions, labels)); fp = sum(p and not l for p, l in zip(predictions, labels)); fn = sum(l and not p for p, l in zip(predictions, labels))
+    precision = tp / (tp + fp) if tp + fp else 0; recall = tp / (tp + fn) if tp + fn else 0
+    print(f"{label:30s} precisão {precision:6.1%}  recall {recall:6.1%}  {len(predictions) / elapsed:10,.0f} consultas/s")
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    months = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    savie = savie_bot.savie; today = date.today(); rng = random.Random(42)
+    expenses, truth, probes = synthesize(users, months, today, rng)
+
+    started = time.perf_counter()
+    with savie.conn:
+        savie.conn.executemany("INSERT INTO expenses (user_id, amount_cents, description, category, date) VALUES (?, ?, ?, ?, ?)", expenses)
+    plain = time.perf_counter() - started
+    started = time.perf_counter()
+    with savie.conn: savie.index_recurrence([(u, d, c, k, w) for u, c, d, k, w in expenses])
+    indexed = time.perf_counter() - started
+    print(f"{len(expenses):,} gastos de {users} usuários em {months} meses; INSERT {plain:.2f}s + manutenção do índice {indexed:.2f}s "
+          f"({indexed / len(expenses) * 1e6:.1f} µs/gasto)")
+
+    labels = [name is not None for _, _, _, name in probes]
+    started = time.perf_counter(); legacy = [legacy_find(savie, u, d, savie_bot.from_cents(c), today) for u, d, c, _ in probes]
+    score("consulta antiga (exata)", legacy, labels, time.perf_counter() - started)
+    started = time.perf_counter(); indexed = [savie.find_recurring_pattern(u, d, savie_bot.from_cents(c), today) for u, d, c, _ in probes]
+    score("índice de recorrência", indexed, labels, time.perf_counter() - started)
+
+    started = time.perf_counter(); proposals = savie.propose_subscriptions(today); elapsed = time.perf_counter() - started
+    proposed = {(p['user_id'], next((name for name in SUBSCRIPTIONS if savie_bot.description_fingerprint(name) == savie_bot.description_fingerprint(p['desc'])), p['desc'])) for p in proposals}
+    eligible = {(u, name) for u, name in truth}; hits = len(proposed & eligible)
+    print(f"propose_subscriptions: {len(proposals)} propostas em {elapsed:.3f}s; {hits}/{len(eligible)} assinaturas reais encontradas, {len(proposed - eligible)} falsas")
+    savie_bot.db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Relatórios: um usuário com três anos de gastos e o /tendencia (13 meses por categoria) montado de três jeitos:
+# 1) somando os gastos crus linha a linha em Decimal, o jeito ingênuo; 2) pela matriz compacta dos totais mensais
+# (get_monthly_series + render_trend_report), o caminho frio; 3) pelo cache, o toque repetido sem gasto novo.
+# Depois, o custo dos triggers TEMP que versionam o cache numa gravação em lote (executemany de N gastos).
+#
+# Uso: python benchmarks/bench_reports.py [gastos por mês] [repetições]
+
+import asyncio, os, random, sys, tempfile, time
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+WORKDIR = tempfile.mkdtemp(prefix="savie_reports_")
+os.environ["DB_PATH"] = os.path.join(WORKDIR, "reports.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+CATEGORIES = ["🍽️ Alimentação", "🚗 Transporte", "🏠 Moradia", "🎉 Lazer", "🛍️ Compras", "💊 Saúde", "📚 Educação", "💡 Contas", "✈️ Viagem", "🐶 Pets"]
+INSERT = "INSERT INTO expenses (user_id, amount_cents, description, category, date, is_installment, installment_id) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+def expenses(user_id: int, months: int, per_month: int, rng: random.Random) -> list[tuple]:
+    first = date.today().replace(day=1)
+    return [(user_id, rng.randint(500, 30_000), f"Gasto {rng.randint(1, 500)}", rng.choice(CATEGORIES), savie_bot.add_months(first, -m).replace(day=rng.randint(1, 28)).isoformat(), False, None)
+            for m in range(months) for _ in range(per_month)]
+
+def naive_trend(user_id: int) -> dict:
+    # Referência: todos os gastos da janela, um Decimal por linha num dicionário categoria -> mês.
+    first = savie_bot.add_months(date.today().replace(day=1), -savie_bot.TREND_MONTHS).isoformat(); totals = defaultdict(lambda: defaultdict(Decimal))
+    for row in savie_bot.savie.conn.execute("SELECT category, date, amount_cents FROM expenses WHERE user_id = ? AND date >= ?", (user_id, first)):
+        totals[row['category']][str(row['date'])[:7]] += savie_bot.from_cents(row['amount_cents'])
+    return totals
+
+def timed(label: str, repeat: int, function, *args):
+    started = time.perf_counter()
+    for _ in range(repeat): function(*args)
+    print(f"{label:46s} {(time.perf_counter() - started) / repeat * 1000:8.3f}ms")
+
+async def cached(repeat: int):
+    await savie_bot.cached_report(1, "tendencia", savie_bot.trend_report); reads = savie_bot.savie.reports.stats['misses']; started = time.perf_counter()
+    for _ in range(repeat): await savie_bot.cached_report(1, "tendencia", savie_bot.trend_report)
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{'cache (toque repetido)':46s} {elapsed * 1000:8.3f}ms  consultas ao banco: {savie_bot.savie.reports.stats['misses'] - reads}")
+
+def main():
+    per_month = int(sys.argv[1]) if len(sys.argv) > 1 else 300; repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    savie = savie_bot.savie; savie.register_user(1, "ana", "Ana"); rows = expenses(1, 36, per_month, random.Random(3))
+    with savie.conn: savie.conn.executemany(INSERT, rows)
+    print(f"{len(rows)} gastos em 36 meses, {len(CATEGORIES)} categorias")
+    timed("linha a linha em Decimal (só as somas)", repeat, naive_trend, 1)
+    timed("matriz dos totais mensais + texto", repeat, savie_bot.trend_report, 1)
+    asyncio.run(cached(repeat * 100))
+
+    rows = expenses(2, 12, 5000, random.Random(4))
+    for watched in (True, False):
+        if not watched: [savie.conn.execute(f"DROP TRIGGER temp.trg_monthly_totals_{event}_reports") for event in ("insert", "update", "delete")]
+        started = time.perf_counter()
+        with savie.conn: savie.conn.executemany(INSERT, rows)
+        elapsed = time.perf_counter() - started; savie.conn.execute("DELETE FROM expenses WHERE user_id = 2"); savie.conn.commit()
+        print(f"{'gravação em lote ' + ('com' if watched else 'sem') + ' os triggers de versão':46s} {elapsed:8.2f}s  ({len(rows) / elapsed:.0f} gastos/s)")
+
+if __name__ == "__main__":
+    main()
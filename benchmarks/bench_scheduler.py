@@ -0,0 +1,44 @@
+# Benchmark do scheduler de assinaturas: loop antigo (um SELECT por assinatura + um commit por
+# gasto) contra o INSERT ... SELECT ... WHERE NOT EXISTS em uma transação, com N assinaturas.
+#
+# Uso: python benchmarks/bench_scheduler.py [assinaturas]
+
+import os, shutil, sys, tempfile, time
+from datetime import date
+
+workdir = tempfile.mkdtemp(prefix="savie_bench_")
+os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+def legacy_process_due_subscriptions(savie, today: date):
+    cursor = savie.conn.cursor(); cursor.execute("SELECT * FROM recurring_expenses WHERE day_of_month = ?", (today.day,))
+    first_day = today.replace(day=1); next_month = savie_bot.add_months(first_day, 1)
+    for sub in cursor.fetchall():
+        cursor.execute("SELECT 1 FROM expenses WHERE user_id = ? AND description = ? AND date >= ? AND date < ?", (sub['user_id'], sub['description'], first_day, next_month))
+        if not cursor.fetchone(): savie.add_expense(sub['user_id'], None, sub['description'], sub['category'], today, amount_cents=sub['amount_cents'])
+
+def timed(label: str, fn):
+    started = time.perf_counter(); result = fn(); elapsed = time.perf_counter() - started
+    print(f"{label:38s} {elapsed:8.2f}s  ({result})"); return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    savie = savie_bot.savie; today = date.today()
+    with savie.conn:
+        savie.conn.executemany("INSERT INTO recurring_expenses (user_id, description, amount_cents, category, day_of_month) VALUES (?, ?, ?, ?, ?)",
+                               [(i // 5, f"Assinatura {i % 5}", 1990, "🎉 Lazer", today.day) for i in range(count)])
+    snapshot = os.path.join(workdir, "snapshot.db"); savie.conn.execute("VACUUM INTO ?", (snapshot,))
+
+    timed(f"set-based ({count} assinaturas)", lambda: savie.process_due_subscriptions(today))
+    timed("set-based, segunda execução no dia", lambda: savie.process_due_subscriptions(today))
+
+    savie_bot.db.close(); savie.close(); shutil.copy(snapshot, os.environ["DB_PATH"])
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(os.environ["DB_PATH"] + suffix): os.remove(os.environ["DB_PATH"] + suffix)
+    legacy = savie_bot.SavieBot(os.environ["DB_PATH"])
+    timed(f"loop antigo ({count} assinaturas)", lambda: legacy_process_due_subscriptions(legacy, today) or legacy.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Cold start: tempo de import do savie_bot e tempo até o primeiro update respondido.
+# O import é medido em processos novos (como numa máquina do Fly acordando) contra a referência do
+# import antigo, que também carregava o google.generativeai. O primeiro update sobe o bot de verdade
+# (python savie_bot.py, modo webhook) contra o Bot API falso e mede do spawn do processo até /ready
+# responder 200 e até a resposta ao /start chegar no Bot API, com banco novo, banco já existente
+# e com GOOGLE_API_KEY (modelo pré-carregado em segundo plano).
+#
+# Uso: python benchmarks/bench_startup.py [rodadas]
+
+import asyncio, hashlib, os, statistics, subprocess, sys, tempfile, time
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_telegram_api import FakeTelegramAPI, serve  # noqa: E402
+
+API_PORT, BOT_PORT = 18091, 18092
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); {}; print(time.perf_counter() - started)"
+
+def import_time(statement: str, env: dict) -> float:
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", IMPORT_SNIPPET.format(statement)], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def top_imports(env: dict, limit: int = 6) -> list[tuple[int, str]]:
+    # Módulos de primeiro nível que mais pesam no import, pelo -X importtime (tempo acumulado, µs).
+    stderr = subprocess.run([sys.executable, "-W", "ignore", "-X", "importtime", "-c", "import savie_bot"], cwd=ROOT, env=env, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        _, cumulative, name = line.split("|"); name = name[1:]
+        if name.startswith("  ") and not name.startswith("   "): rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+async def first_update(env: dict, api: FakeTelegramAPI, user_id: int) -> tuple[float, float]:
+    update = {"update_id": user_id, "message": {"message_id": 1, "date": int(time.time()), "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+                                                "chat": {"id": user_id, "type": "private"}, "from": {"id": user_id, "is_bot": False, "first_name": "Ana"}}}
+    started = time.perf_counter(); process = subprocess.Popen([sys.executable, "-W", "ignore", "savie_bot.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.get(f"http://127.0.0.1:{BOT_PORT}/ready") as response:
+                        if response.status == 200: break
+                except aiohttp.ClientError: pass
+                if process.poll() is not None: raise RuntimeError(f"o bot saiu com código {process.returncode}")
+                await asyncio.sleep(0.005)
+            ready = time.perf_counter() - started
+            async with session.post(f"http://127.0.0.1:{BOT_PORT}/telegram", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": env["WEBHOOK_SECRET"]}) as response: response.raise_for_status()
+            while not any(method == "sendMessage" and int(params.get("chat_id", 0)) == user_id for method, params in api.calls): await asyncio.sleep(0.002)
+            return ready, time.perf_counter() - started
+    finally:
+        process.terminate(); process.wait()
+
+async def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    workdir = tempfile.mkdtemp(prefix="savie_startup_")
+    env = {key: value for key, value in os.environ.items() if key not in ("GOOGLE_API_KEY", "WEBHOOK_URL")}
+    env.update({"DB_PATH": os.path.join(workdir, "startup.db"), "BOT_TOKEN": "123:fake", "TELEGRAM_API_URL": f"http://127.0.0.1:{API_PORT}",
+                "BOT_MODE": "webhook", "PORT": str(BOT_PORT), "WEBHOOK_SECRET": hashlib.sha256(b"startup").hexdigest()})
+
+    lazy = [import_time("import savie_bot", env) for _ in range(rounds)]
+    eager = [import_time("import savie_bot, google.generativeai", env) for _ in range(rounds)]
+    print(f"import savie_bot:                          mediana={statistics.median(lazy) * 1000:6.0f}ms  mín={min(lazy) * 1000:6.0f}ms")
+    print(f"import savie_bot + google.generativeai:    mediana={statistics.median(eager) * 1000:6.0f}ms  mín={min(eager) * 1000:6.0f}ms  (import antigo)")
+    print("módulos que mais pesam: " + ", ".join(f"{name} {cumulative / 1000:.0f}ms" for cumulative, name in top_imports(env)))
+    print(f"banco criado pelo import: {'sim' if os.path.exists(env['DB_PATH']) else 'não'}")
+
+    api = FakeTelegramAPI(); runner = await serve(API_PORT, api=api); user_ids = iter(range(1, 10_000))
+    scenarios = [("banco novo", lambda: [os.remove(os.path.join(workdir, name)) for name in os.listdir(workdir)], {}),
+                 ("banco existente", lambda: None, {}),
+                 ("com GOOGLE_API_KEY", lambda: None, {"GOOGLE_API_KEY": "chave-falsa"})]
+    try:
+        for label, prepare, extra in scenarios:
+            results = []
+            for _ in range(rounds): prepare(); results.append(await first_update({**env, **extra}, api, next(user_ids)))
+            ready, reply = zip(*results)
+            print(f"{label:20s} até /ready: mediana={statistics.median(ready) * 1000:6.0f}ms  até a resposta do /start: mediana={statistics.median(reply) * 1000:6.0f}ms  máx={max(reply) * 1000:6.0f}ms")
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+# Armazenamento do SQLite, em três partes:
+# 1) Latência de escrita (add_expense, um commit por gasto) com os pragmas padrão do SQLite (synchronous=FULL,
+#    cache de 2 MB, sem mmap) e com os do bot, com leitores consultando o mesmo banco em paralelo.
+# 2) Latência de escrita durante um snapshot pela API de backup: cópia inteira de uma vez na thread escritora
+#    contra a cópia em passos de SNAPSHOT_STEP_PAGES com as escritas rodando entre os passos (db.drain).
+# 3) Tamanho dos arquivos: usuários com quatro anos de gastos; move o que passou de ARCHIVE_AFTER_MONTHS para o
+#    arquivo morto e mostra o banco antes, depois da movimentação e depois do incremental_vacuum. Confere os totais
+#    mensais depois de arquivar e depois de apagar os dados de um usuário que tinha gastos no arquivo morto.
+# O diretório deve estar no mesmo tipo de disco que o volume de produção (o fsync do synchronous=FULL pesa lá).
+#
+# Uso: python benchmarks/bench_storage.py [usuários] [diretório]
+
+import asyncio, os, random, shutil, sqlite3, statistics, sys, tempfile, threading, time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+
+SQLITE_DEFAULTS = ("PRAGMA synchronous = FULL", "PRAGMA cache_size = -2000", "PRAGMA mmap_size = 0", "PRAGMA journal_size_limit = -1", "PRAGMA temp_store = DEFAULT")
+CATEGORIES = ["🍽️ Alimentação", "🚗 Transporte", "🏠 Moradia", "🎉 Lazer", "🛍️ Compras"]
+
+def megabytes(path: str) -> float:
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p)) / 1024 / 1024
+
+def open_bot(directory: str, name: str, users: int = 50) -> "savie_bot.SavieBot":
+    bot = savie_bot.SavieBot(os.path.join(directory, f"{name}.db"))
+    with bot.conn: bot.conn.executemany("INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)", [(u, f"u{u}", "U") for u in range(1, users + 1)])
+    return bot
+
+def fill(bot: "savie_bot.SavieBot", users: int, days: int, per_day: int, rng: random.Random):
+    start = date.today() - timedelta(days=days)
+    with bot.conn:
+        for day in range(days):
+            rows = [(u, rng.randint(500, 30_000), f"Gasto {rng.randint(1, 500)}", rng.choice(CATEGORIES), (start + timedelta(days=day)).isoformat(), False, None)
+                    for u in range(1, users + 1) for _ in range(per_day)]
+            bot.conn.executemany("INSERT INTO expenses (user_id, amount_cents, description, category, date, is_installment, installment_id) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+def latency_line(label: str, latencies: list[float]) -> str:
+    latencies = sorted(latencies)
+    return (f"{label:44s} p50={statistics.median(latencies) * 1000:7.2f}ms  p99={latencies[int(len(latencies) * 0.99)] * 1000:7.2f}ms  "
+            f"máx={latencies[-1] * 1000:7.1f}ms  ({len(latencies) / sum(latencies):.0f} escritas/s)")
+
+def write_latency(bot: "savie_bot.SavieBot", writes: int, readers: int, tuned: bool) -> list[float]:
+    stop = threading.Event()
+    def reader(seed: int):
+        conn = bot.connect_reader() if tuned else sqlite3.connect(f"file:{bot.db_path}?mode=ro", uri=True); rng = random.Random(seed)
+        while not stop.is_set():
+            conn.execute("SELECT category, SUM(amount_cents) FROM expenses WHERE user_id = ? AND date >= ? GROUP BY category", (rng.randint(1, 50), (date.today() - timedelta(days=90)).isoformat())).fetchall()
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]; [t.start() for t in threads]
+    latencies, rng = [], random.Random(1)
+    try:
+        for _ in range(writes):
+            started = time.perf_counter(); bot.add_expense(rng.randint(1, 50), Decimal("12.34"), "Padaria", "🍽️ Alimentação", date.today()); latencies.append(time.perf_counter() - started)
+    finally:
+        stop.set(); [t.join() for t in threads]
+    return latencies
+
+async def snapshot_latency(directory: str, users: int, stepped: bool) -> tuple:
+    bot = open_bot(directory, f"snapshot_{'passos' if stepped else 'inteiro'}", users); fill(bot, users, 365, 6, random.Random(3))
+    executor = savie_bot.SQLiteExecutor(bot); latencies, done = [], asyncio.Event()
+    async def writer():
+        rng = random.Random(2)
+        while not done.is_set():
+            started = time.perf_counter(); await executor.write(bot.add_expense, rng.randint(1, users), Decimal("9.90"), "Café", "🍽️ Alimentação", date.today())
+            latencies.append(time.perf_counter() - started); await asyncio.sleep(0.002)
+    task = asyncio.create_task(writer()); await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    if stepped: paths = await executor.write(bot.snapshot, os.path.join(directory, "snapshots"), pages=savie_bot.SNAPSHOT_STEP_PAGES, between_steps=executor.drain)
+    else: paths = await executor.write(bot.snapshot, os.path.join(directory, "snapshots"), pages=-1)
+    elapsed = time.perf_counter() - started; done.set(); await task
+    copy = sqlite3.connect(paths[0]); copied = copy.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]; copy.close()
+    live = bot.conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]; executor.close()
+    return latencies, elapsed, megabytes(bot.db_path), copied, live
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    directory = tempfile.mkdtemp(prefix="savie_storage_", dir=sys.argv[2] if len(sys.argv) > 2 else None)
+    try:
+        print("1) latência de escrita com 4 leitores em paralelo")
+        for tuned in (False, True):
+            bot = open_bot(directory, "tunado" if tuned else "padrao"); fill(bot, 50, 180, 4, random.Random(5))
+            if not tuned: [bot.conn.execute(pragma) for pragma in SQLITE_DEFAULTS]
+            print(latency_line("pragmas do bot" if tuned else "pragmas padrão do SQLite", write_latency(bot, 2000, 4, tuned)))
+
+        print("2) escritas durante um snapshot")
+        for stepped in (False, True):
+            latencies, elapsed, size, copied, live = asyncio.run(snapshot_latency(directory, users, stepped))
+            label = f"snapshot em passos de {savie_bot.SNAPSHOT_STEP_PAGES} páginas" if stepped else "snapshot de uma vez"
+            print(latency_line(label, latencies) + f"  cópia de {size:.0f} MB em {elapsed:.2f}s, {copied} de {live} gastos")
+
+        print("3) tamanho em disco")
+        bot = open_bot(directory, "arquivo", users); fill(bot, users, 4 * 365, 3, random.Random(9)); bot.checkpoint('TRUNCATE')
+        before = megabytes(bot.db_path); cutoff = savie_bot.add_months(date.today().replace(day=1), -savie_bot.ARCHIVE_AFTER_MONTHS)
+        started, moved = time.perf_counter(), 0
+        while batch := bot.archive_expenses(cutoff): moved += batch
+        archived_in = time.perf_counter() - started; bot.checkpoint('TRUNCATE'); after_move = megabytes(bot.db_path)
+        started = time.perf_counter()
+        while bot.incremental_vacuum(): pass
+        vacuumed_in = time.perf_counter() - started; bot.checkpoint('TRUNCATE')
+        print(f"banco com {moved + bot.conn.execute('SELECT COUNT(*) FROM main.expenses').fetchone()[0]} gastos: {before:.1f} MB; {moved} movidos para o arquivo morto em {archived_in:.1f}s "
+              f"-> {after_move:.1f} MB sem vacuum, {megabytes(bot.db_path):.1f} MB depois do incremental_vacuum ({vacuumed_in:.2f}s); arquivo morto {megabytes(bot.archive_path):.1f} MB")
+        print(f"totais mensais conferem depois de arquivar: {'sim' if not bot.verify_monthly_totals() else 'NÃO'}")
+        bot.delete_all_user_data(1); left = bot.conn.execute("SELECT COUNT(*) FROM monthly_category_totals WHERE user_id = 1").fetchone()[0]
+        print(f"totais mensais conferem depois de apagar os dados de um usuário com gastos arquivados: {'sim' if not bot.verify_monthly_totals() and not left else 'NÃO'}")
+    finally: shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Corpus do interpretador de gastos: cada linha é (mensagem, valor, parcelas, data, descrição),
+# com "hoje" fixo em 17/10/2026 para as datas relativas. None em valor significa "não é um gasto".
+# Também confere as respostas prontas (sem IA) para cumprimentos e agradecimentos e o texto de
+# recibos como o tesseract devolve (parse_receipt_text) e extratos CSV/OFX (statement_expenses).
+#
+# Uso: python benchmarks/check_parser.py   (código de saída 1 se algum caso divergir)
+
+import os, sys, tempfile
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+
+TODAY = date(2026, 10, 17)
+D = Decimal
+
+CORPUS = [
+    # Valores simples, vírgula e ponto decimal
+    ("Pizza 45,90", D("45.90"), None, None, "Pizza"),
+    ("Pizza 45.90", D("45.90"), None, None, "Pizza"),
+    ("Café 10,5", D("10.5"), None, None, "Café"),
+    ("Uber 25", D("25"), None, None, "Uber"),
+    ("25 uber", D("25"), None, None, "Uber"),
+    ("Lanche 7,00", D("7.00"), None, None, "Lanche"),
+    ("padaria 0,99", D("0.99"), None, None, "Padaria"),
+    ("Estacionamento 12.5", D("12.5"), None, None, "Estacionamento"),
+    # Moeda e separador de milhar
+    ("R$ 1.234,56 mercado", D("1234.56"), None, None, "Mercado"),
+    ("Mercado R$1.234,56", D("1234.56"), None, None, "Mercado"),
+    ("r$ 30 cinema", D("30"), None, None, "Cinema"),
+    ("Aluguel 1.500", D("1500"), None, None, "Aluguel"),
+    ("Aluguel 1.500,00", D("1500.00"), None, None, "Aluguel"),
+    ("1,500 aluguel", D("1500"), None, None, "Aluguel"),
+    ("Hotel 1,234.56", D("1234.56"), None, None, "Hotel"),
+    ("Carro 45.000", D("45000"), None, None, "Carro"),
+    ("Casa 1.200.000", D("1200000"), None, None, "Casa"),
+    ("Mercado 1234,56", D("1234.56"), None, None, "Mercado"),
+    # Multiplicadores
+    ("Carro 1,5k", D("1500"), None, None, "Carro"),
+    ("Viagem 2k", D("2000"), None, None, "Viagem"),
+    ("Viagem 2.5K", D("2500"), None, None, "Viagem"),
+    ("Reforma 3 mil", D("3000"), None, None, "Reforma"),
+    ("Moto 12mil", D("12000"), None, None, "Moto"),
+    # Palavras de ligação
+    ("Gastei 50 reais no almoço", D("50"), None, None, "No almoço"),
+    ("paguei 120 de luz", D("120"), None, None, "De luz"),
+    ("Comprei um livro por 39,90", D("39.90"), None, None, "Um livro por"),
+    ("valor 15 sorvete", D("15"), None, None, "Sorvete"),
+    ("1 real chiclete", D("1"), None, None, "Chiclete"),
+    # Vários números: vale o que parece dinheiro, senão o primeiro que não é quantidade
+    ("2 pizzas 80", D("80"), None, None, "2 pizzas"),
+    ("iPhone 15 5000", D("5000"), None, None, "Iphone 15"),
+    ("Ração 10kg 89,90", D("89.90"), None, None, "Ração 10kg"),
+    ("3 cervejas R$ 24", D("24"), None, None, "3 cervejas"),
+    ("Cinema 2 ingressos 60,00", D("60.00"), None, None, "Cinema 2 ingressos"),
+    ("Xbox 2000", D("2000"), None, None, "Xbox"),
+    ("Coca 2l 12", D("12"), None, None, "Coca 2l"),
+    ("Almoço 45 com 3 amigos", D("45"), None, None, "Almoço com 3 amigos"),
+    ("Pizza 80 2 pessoas", D("80"), None, None, "Pizza 2 pessoas"),
+    ("Uber 25 para 2 pessoas", D("25"), None, None, "Uber para 2 pessoas"),
+    ("Mercado 150 dia 3", D("150"), None, None, "Mercado dia 3"),
+    # Parcelas
+    ("TV 3000 em 10x", D("3000"), 10, None, "Tv"),
+    ("TV 3000 10x", D("3000"), 10, None, "Tv"),
+    ("TV 3000 em 10 x", D("3000"), 10, None, "Tv"),
+    ("Notebook 2 mil em 12 vezes", D("2000"), 12, None, "Notebook"),
+    ("Geladeira 2.499,90 em 5 parcelas", D("2499.90"), 5, None, "Geladeira"),
+    ("10x de 300 Geladeira", D("3000"), 10, None, "Geladeira"),
+    ("Sofá 12x de R$ 150,00", D("1800.00"), 12, None, "Sofá"),
+    ("3 parcelas de R$ 50 curso", D("150"), 3, None, "Curso"),
+    ("Curso 1 parcela 200", D("200"), 1, None, "Curso"),
+    ("TV em 10x", D("0"), 10, None, "Tv"),
+    ("10xícaras 30", D("30"), None, None, "10xícaras"),
+    ("Xarope 18", D("18"), None, None, "Xarope"),
+    # Datas
+    ("Uber 25 ontem", D("25"), None, date(2026, 10, 16), "Uber"),
+    ("ontem uber 25", D("25"), None, date(2026, 10, 16), "Uber"),
+    ("Feira 60 anteontem", D("60"), None, date(2026, 10, 15), "Feira"),
+    ("Almoço 35 hoje", D("35"), None, date(2026, 10, 17), "Almoço"),
+    ("Mercado 15/10 150,00", D("150.00"), None, date(2026, 10, 15), "Mercado"),
+    ("Mercado 15/12 150,00", D("150.00"), None, date(2025, 12, 15), "Mercado"),
+    ("Padaria 12/03/25 8,50", D("8.50"), None, date(2025, 3, 12), "Padaria"),
+    ("Padaria 12/03/2025 8,50", D("8.50"), None, date(2025, 3, 12), "Padaria"),
+    ("Farmácia 31/02 40", D("40"), None, None, "Farmácia"),
+    ("Notebook 3000 em 10x 01/10", D("3000"), 10, date(2026, 10, 1), "Notebook"),
+    # Não são gastos
+    ("Obrigado!", None, None, None, None),
+    ("bom dia", None, None, None, None),
+    ("quanto gastei esse mês?", None, None, None, None),
+    ("", None, None, None, None),
+    ("15/10", None, None, None, None),
+    ("ontem", None, None, None, None),
+    # Sem descrição
+    ("50", D("50"), None, None, "Gasto não especificado"),
+    ("R$ 50", D("50"), None, None, "Gasto não especificado"),
+]
+
+CANNED = [("Obrigado!", "Por nada! 😊"), ("obrigada, Savie", "Por nada! 😊"), ("Valeu", "Por nada! 😊"), ("Oi", savie_bot.CANNED_REPLIES["oi"]),
+          ("Bom dia!", savie_bot.CANNED_REPLIES["oi"]), ("Olá, Savie", savie_bot.CANNED_REPLIES["oi"]), ("ok", "Combinado! 👍"), ("Show de bola", "Combinado! 👍"),
+          ("Tá bom", "Combinado! 👍"), ("Tchau", "Até mais! 👋"), ("quanto gastei esse mês?", None), ("me ajuda com o orçamento", None)]
+
+# (texto do OCR, valor, data, descrição); None em valor significa "sem total".
+RECEIPTS = [
+    ("SUPERMERCADO BOM PRECO LTDA\nCNPJ 12.345.678/0001-90\n17/10/2026 14:32:10\nARROZ 5KG 25,90\nFEIJAO 8,49\nSUBTOTAL 34,39\nTOTAL R$ 34,39\nDINHEIRO 50,00\nTROCO 15,61",
+     D("34.39"), date(2026, 10, 17), "Supermercado bom preco ltda"),
+    ("CNPJ: 11.222.333/0001-44\nDROGARIA SAO JOAO\nCUPOM FISCAL\n15/10/26\nDIPIRONA 12.50\nVALOR A PAGAR 12.50", D("12.50"), date(2026, 10, 15), "Drogaria sao joao"),
+    ("POSTO SHELL\nQTD. TOTAL DE ITENS 1\nTOTAL 1.234,56\nVALOR TOTAL DOS TRIBUTOS 200,10\n01/01/2027", D("1234.56"), None, "Posto shell"),
+    ("12345\n\nTOTAL 9,90", D("9.90"), None, "Recibo"),
+    ("PADARIA\nPAO FRANCES 12,00\nOBRIGADO", None, None, None),
+]
+
+# (conteúdo do arquivo, saídas esperadas como (data, centavos, descrição), entradas ignoradas); None = não é extrato.
+STATEMENTS = [
+    ("Data,Valor,Identificador,Descrição\n01/10/2026,-45.90,a1,Compra no débito - Padaria Pão Quente\n02/10/2026,3500.00,a2,Transferência recebida\n03/10/2026,-120.00,a3,Pagamento de boleto - Enel\n".encode(),
+     [(date(2026, 10, 1), 4590, "Compra no débito - Padaria Pão Quente"), (date(2026, 10, 3), 12000, "Pagamento de boleto - Enel")], 1),
+    (b"date,title,amount\n2026-10-05,Uber *Trip,23.45\n2026-10-06,Pagamento recebido,-500.00\n2026-10-06,Ifood *Restaurante,58.10\n",
+     [(date(2026, 10, 5), 2345, "Uber *Trip"), (date(2026, 10, 6), 5810, "Ifood *Restaurante")], 1),
+    ("Extrato de Conta Corrente\nAgência;1234;Conta;56789-0\n\nData Lançamento;Histórico;Débito;Crédito;Saldo\n07/10/2026;SUPERMERCADO DIA;1.234,56;;10.000,00\n"
+     "08/10/2026;SALÁRIO;;5.000,00;15.000,00\n08/10/26;TARIFA;0,00;;\ndata inválida;X;1,00;;\n".encode("cp1252"),
+     [(date(2026, 10, 7), 123456, "SUPERMERCADO DIA")], 2),
+    (b"OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST><STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20261009120000[-3:BRT]<TRNAMT>-89,90<FITID>1<MEMO>Farmacia Sao Joao"
+     b"<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20261010<TRNAMT>200.00<MEMO>Pix recebido</STMTTRN></BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>",
+     [(date(2026, 10, 9), 8990, "Farmacia Sao Joao")], 1),
+    (b'<?xml version="1.0"?>\n<?OFX OFXHEADER="200"?>\n<OFX>\n<STMTTRN>\n<DTPOSTED>20261011</DTPOSTED>\n<TRNAMT>-15.00</TRNAMT>\n<NAME>Cinema &amp; Pipoca</NAME>\n</STMTTRN>\n</OFX>\n',
+     [(date(2026, 10, 11), 1500, "Cinema & Pipoca")], 0),
+    (b"nome,email\nAna,ana@example.com\n", None, None),
+]
+
+def read_statement_case(content: bytes):
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as handle: handle.write(content)
+    stats = {'invalid': 0, 'credits': 0}
+    try: return list(savie_bot.statement_expenses(handle.name, stats)), stats['credits']
+    except ValueError: return None, None
+    finally: os.remove(handle.name)
+
+def main() -> int:
+    failures = 0
+    for text, amount, installments, when, description in CORPUS:
+        parsed = savie_bot.parse_expense_text(text, TODAY)
+        got = None if parsed is None else (parsed['amount'], parsed['installments'], parsed['date'], parsed['description'])
+        expected = None if amount is None else (amount, installments, when, description)
+        if got != expected: failures += 1; print(f"FALHOU {text!r}\n  esperado {expected}\n  obtido   {got}")
+    for text, reply in CANNED:
+        got = savie_bot.canned_reply(text)
+        if got != reply: failures += 1; print(f"FALHOU resposta pronta {text!r}: esperado {reply!r}, obtido {got!r}")
+    for text, amount, when, description in RECEIPTS:
+        parsed = savie_bot.parse_receipt_text(text, TODAY)
+        got = None if parsed is None else (parsed['amount'], parsed['date'], parsed['description'])
+        expected = None if amount is None else (amount, when, description)
+        if got != expected: failures += 1; print(f"FALHOU recibo {text.splitlines()[0]!r}\n  esperado {expected}\n  obtido   {got}")
+    for content, expenses, credits in STATEMENTS:
+        got = read_statement_case(content)
+        if got != (expenses, credits): failures += 1; print(f"FALHOU extrato {content[:40]!r}\n  esperado {(expenses, credits)}\n  obtido   {got}")
+    print(f"{len(CORPUS)} mensagens, {len(CANNED)} respostas prontas, {len(RECEIPTS)} recibos e {len(STATEMENTS)} extratos verificados, {failures} divergências.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
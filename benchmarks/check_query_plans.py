@@ -0,0 +1,68 @@
+# Verifica com EXPLAIN QUERY PLAN que toda consulta emitida pelo SavieBot usa índice.
+# Exercita os métodos do SavieBot num banco temporário, captura o SQL real (com os
+# valores já expandidos) via set_trace_callback e falha se algum plano fizer SCAN
+# de tabela inteira fora da lista de leituras completas intencionais.
+#
+# Uso: python benchmarks/check_query_plans.py   (código de saída 1 se houver SCAN)
+
+import os, re, sys, tempfile
+from datetime import date
+from decimal import Decimal
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="savie_plans_"), "plans.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import savie_bot  # noqa: E402
+savie_bot.init_services()
+
+# Leituras que precisam mesmo da tabela toda: catálogo de palavras-chave (carregado uma vez),
+# exportação do admin e o backfill/verificação dos totais mensais e do índice de recorrência.
+FULL_SCAN_STATEMENTS = (re.compile(r"FROM categories", re.I), re.compile(r"FROM user_keywords\s*$", re.I), re.compile(r"FROM users WHERE full_name IS NOT NULL", re.I),
+                        re.compile(r"^WITH fresh AS", re.I), re.compile(r"^DELETE FROM monthly_category_totals$", re.I), re.compile(r"^INSERT INTO monthly_category_totals .* FROM (all_)?expenses GROUP BY", re.I),
+                        re.compile(r"^DELETE FROM recurrence_index$", re.I), re.compile(r"FROM expenses WHERE installment_id IS NULL ORDER BY date, id$", re.I), re.compile(r"FROM recurring_expenses$", re.I))
+
+def exercise(savie: "savie_bot.SavieBot"):
+    today = date.today(); pending = {'desc': 'Netflix', 'amount': Decimal('39.90'), 'category': '🎉 Lazer'}
+    savie.register_user(1, "ana", "Ana"); savie.update_user_profile(1, "Ana Souza", "ana@example.com"); savie.get_user_profile(1)
+    savie.get_keyword_catalog(); savie.get_keyword_catalog_version(); savie.add_user_keyword(1, "padaria do ze", "🍽️ Alimentação"); savie.get_categories()
+    savie.store_cached_categories([("loja x", "🛍️ Compras")], ["loja x"]); savie.get_cached_category("loja x")
+    savie.add_expense(1, Decimal("39.90"), "Netflix", "🎉 Lazer", today); savie.add_installment_purchase(1, Decimal("1000"), "TV", "🛍️ Compras", 3, today)
+    savie.get_monthly_summary(1); savie.get_monthly_series(1); savie.get_spending_analytics(1, "🎉 Lazer"); savie.find_recurring_pattern(1, "Netflix", Decimal("39.90")); savie.propose_subscriptions(); savie.rebuild_recurrence_index()
+    savie.add_recurring_expense(1, today.day, pending); savie.process_due_subscriptions(); savie.get_active_installments(1); savie.materialize_due_installments(savie_bot.add_months(today, 2))
+    savie.start_no_spend_challenge(1, "🍽️ Alimentação", 7); savie.check_challenge_violation(1, "🍽️ Alimentação"); savie.check_completed_challenges()
+    statement = os.path.join(os.path.dirname(os.environ["DB_PATH"]), "extrato.csv")
+    with open(statement, "w") as handle: handle.write(f"Data;Descrição;Valor\n{today:%d/%m/%Y};Netflix;-39,90\n{today:%d/%m/%Y};Loja X;-10,00\n{today:%d/%m/%Y};Posto Y;-80,00\n")
+    spill = f"{statement}.linhas"; scanned = savie.scan_statement(1, statement, savie_bot.matcher, "📦 Outros", spill); savie.insert_statement(1, spill, scanned)
+    savie.add_expense(1, Decimal("12.00"), "Padaria", "🍽️ Alimentação", date(2020, 1, 15)); savie.archive_expenses(savie_bot.add_months(today, -savie_bot.ARCHIVE_AFTER_MONTHS)); savie.archive_expenses(date(2020, 1, 1))
+    savie.checkpoint(); savie.incremental_vacuum(); savie.storage_stats()
+    last = savie.get_last_expense(1); savie.delete_expense_by_id(last['id'], 1); [savie.export_csv(name, params, os.path.dirname(os.environ["DB_PATH"])) for name, params in (('usuarios', ()), ('gastos', (1,)), ('parcelas', (1,)))]; savie.delete_all_user_data(1)
+    savie.verify_monthly_totals(); savie.rebuild_monthly_totals()
+    pending_id = savie.create_pending_action(1, "confirm_exp", pending); savie.take_pending_action(pending_id, 1, "confirm_exp"); savie.discard_pending_action(pending_id, 1)
+    savie.save_conversation_states({1: ('{"state":"x"}', 1.0), 2: (None, 1.0)}); savie.get_conversation_state(1); savie.purge_expired_state()
+    savie.enqueue_outbound_messages([{'chat_id': 1, 'text': 'oi', 'fallback_chat_id': -1, 'fallback_text': 'PS'}, {'chat_id': 2, 'text': 'oi'}, {'chat_id': 3, 'text': 'oi'}])
+    first, second, third = savie.claim_outbound_messages(3, 0); savie.complete_outbound_message(first['id']); savie.retry_outbound_message(second['id'], 0, "timeout")
+    savie.fail_outbound_message(third['id'], "Forbidden"); savie.release_outbound_messages([second['id']]); savie.count_outbound_messages(); savie.purge_expired_state()
+    savie.register_user(2, "Bia_S", "Bia"); bill_id = savie.create_shared_bill(1, "ana", -100, "Pizza", Decimal("90"), ["bia_s", "carlos", "ana"])
+    bill, participants = savie.get_bill_status(bill_id); savie.update_bill_summary_message(bill_id, 10); savie.mark_bill_paid(participants[0]['id'], 2); savie.mark_bill_paid(participants[0]['id'], 2)
+
+def main() -> int:
+    savie = savie_bot.savie; statements = []
+    savie.conn.set_trace_callback(statements.append)
+    exercise(savie)
+    savie.conn.set_trace_callback(None)
+
+    failures, checked = [], 0
+    for sql in dict.fromkeys(s.strip() for s in statements):
+        if not re.match(r"(SELECT|UPDATE|DELETE|INSERT|WITH)\b", sql, re.I) or sql.upper().startswith("INSERT INTO") and " SELECT " not in sql.upper(): continue
+        if any(p.search(sql) for p in FULL_SCAN_STATEMENTS): continue
+        checked += 1
+        plan = [row[3] for row in savie.conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        # SCAN de uma view (CO-ROUTINE) só percorre as linhas que as consultas internas, verificadas à parte, já buscaram.
+        views = {match[1] for detail in plan if (match := re.match(r"CO-ROUTINE ([\w.]+)", detail))}
+        scans = [detail for detail in plan if (match := re.match(r"SCAN ([\w.]+)(?:$| (?!USING))", detail)) and match[1] not in views]
+        if scans: failures.append((sql, plan))
+    for sql, plan in failures: print(f"FALHA: {sql}\n   plano: {plan}")
+    print(f"{checked} consultas verificadas, {len(failures)} sem índice.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    code = main(); savie_bot.db.close(); sys.exit(code)
@@ -0,0 +1,47 @@
+# Provedor de IA falso, local, no formato do genai.GenerativeModel: generate_content_async (e o
+# generate_content síncrono) devolvem um objeto com .text. Injeta latência, erros de cota (429),
+# falhas (500) e chamadas que travam; degrade() deixa o provedor lento ou fora do ar por um tempo.
+# Prompts de categorização (linhas "1. ...") recebem um array JSON do tamanho do lote.
+
+import asyncio, json, random, time
+from google.api_core import exceptions as google_exceptions
+
+class FakeResponse:
+    def __init__(self, text: str): self.text = text
+
+class FakeLLMProvider:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.0, quota_rate: float = 0.0, error_rate: float = 0.0, hang_rate: float = 0.0,
+                 category: str = "Compras", seed: int = 42):
+        self.latency, self.jitter, self.quota_rate, self.error_rate, self.hang_rate, self.category = latency, jitter, quota_rate, error_rate, hang_rate, category
+        self._rng = random.Random(seed); self._degraded_until = 0.0; self._degraded_latency = None; self._down = False
+        self.calls = 0; self.inflight = 0; self.max_inflight = 0
+
+    def degrade(self, seconds: float, latency: float | None = None):
+        # latency=None: fora do ar (503 imediato); com latência: cada chamada iniciada na janela demora isso.
+        self._degraded_until = time.monotonic() + seconds; self._degraded_latency = latency; self._down = latency is None
+
+    def answer(self, prompt: str) -> str:
+        count = sum(1 for line in prompt.splitlines() if line[:1].isdigit() and '. ' in line[:5])
+        return json.dumps([self.category] * count) if count else "Combinado!"
+
+    def _plan(self) -> tuple[float, Exception | None]:
+        self.calls += 1; roll = self._rng.random(); latency = self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter))
+        if time.monotonic() < self._degraded_until:
+            if self._down: return 0.01, google_exceptions.ServiceUnavailable("fora do ar")
+            latency = self._degraded_latency
+        if roll < self.hang_rate: return 3600.0, None
+        if roll < self.hang_rate + self.quota_rate: return latency / 10, google_exceptions.ResourceExhausted("quota excedida")
+        if roll < self.hang_rate + self.quota_rate + self.error_rate: return latency, google_exceptions.InternalServerError("erro interno")
+        return latency, None
+
+    async def generate_content_async(self, prompt: str) -> FakeResponse:
+        latency, error = self._plan(); self.inflight += 1; self.max_inflight = max(self.max_inflight, self.inflight)
+        try: await asyncio.sleep(latency)
+        finally: self.inflight -= 1
+        if error: raise error
+        return FakeResponse(self.answer(prompt))
+
+    def generate_content(self, prompt: str) -> FakeResponse:
+        latency, error = self._plan(); time.sleep(min(latency, 60))
+        if error: raise error
+        return FakeResponse(self.answer(prompt))
@@ -0,0 +1,100 @@
+# Bot API falso do Telegram, local, para testar o bot sem rede.
+# Responde a qualquer método com um resultado plausível (Message para send*/edit*,
+# True para o resto) e guarda as chamadas recebidas.
+# Com enforce_limits, os send* imitam o flood control do Telegram (30/s no total, 1/s por chat
+# privado, 20/min por grupo) respondendo 429 com retry_after; flood_every injeta um 429 a cada N
+# envios e blocked_chats responde 403 como um usuário que bloqueou o bot.
+# keyboards guarda, por chat, os callback_data do último teclado inline enviado ou editado
+# (o bench_e2e usa para "clicar" nos botões como um usuário faria). files guarda o conteúdo de cada
+# file_id, servido pelo getFile e por /file/bot<token>/<caminho> como o download de fotos.
+#
+# Uso: python benchmarks/fake_telegram_api.py [porta] [--limits] [--flood-every N]
+#      BOT_TOKEN=123:fake TELEGRAM_API_URL=http://127.0.0.1:8081 python savie_bot.py
+
+import asyncio, collections, itertools, json, sys, time
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Savie", "username": "savie_bot", "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+class FakeTelegramAPI:
+    def __init__(self, latency: float = 0.0, enforce_limits: bool = False, flood_every: int = 0, retry_after: int = 1, blocked_chats: set[int] | None = None):
+        self.latency = latency; self.calls: list[tuple[str, dict]] = []; self._message_ids = itertools.count(1000)
+        self.enforce_limits, self.flood_every, self.retry_after, self.blocked_chats = enforce_limits, flood_every, retry_after, blocked_chats or set()
+        self._sends = 0; self._global_sends: collections.deque = collections.deque(); self._chat_sends: dict[int, collections.deque] = {}
+        self.delivered: list[tuple[float, int]] = []; self.errors = {429: 0, 403: 0}; self.keyboards: dict[int, list[str]] = {}
+        self.files: dict[str, bytes] = {}
+
+    def _error(self, code: int, description: str, **parameters) -> web.Response:
+        self.errors[code] += 1
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters: body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    def _check_send(self, chat_id: int) -> web.Response | None:
+        self._sends += 1; now = time.monotonic()
+        if chat_id in self.blocked_chats: return self._error(403, "Forbidden: bot was blocked by the user")
+        if self.flood_every and self._sends % self.flood_every == 0: return self._error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        if not self.enforce_limits: return None
+        window, limit = (1.0, 1) if chat_id > 0 else (60.0, 20)
+        chat = self._chat_sends.setdefault(chat_id, collections.deque())
+        while self._global_sends and now - self._global_sends[0] >= 1.0: self._global_sends.popleft()
+        while chat and now - chat[0] >= window: chat.popleft()
+        if len(self._global_sends) >= 30 or len(chat) >= limit: return self._error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        self._global_sends.append(now); chat.append(now); return None
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json": return await request.json()
+        form = await request.post()
+        return {key: value if isinstance(value, str) else f"<arquivo {value.filename}>" for key, value in form.items()}
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id", 0) or 0)
+        if params.get("reply_markup"):
+            markup = params["reply_markup"] if isinstance(params["reply_markup"], dict) else json.loads(params["reply_markup"])
+            if "inline_keyboard" in markup: self.keyboards[chat_id] = [button["callback_data"] for row in markup["inline_keyboard"] for button in row if "callback_data" in button]
+        return {"message_id": int(params.get("message_id") or next(self._message_ids)), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}, "from": BOT_USER, "text": params.get("text", "")}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]; params = await self._params(request)
+        self.calls.append((method, params))
+        if self.latency: await asyncio.sleep(self.latency)
+        if method == "getMe": result = BOT_USER
+        elif method == "getFile":
+            file_id = params.get("file_id", "")
+            if file_id not in self.files: return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}, status=400)
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.files[file_id]), "file_path": f"photos/{file_id}.jpg"}
+        elif method == "getUpdates": await asyncio.sleep(1); result = []
+        elif method.startswith("send"):
+            error = self._check_send(int(params.get("chat_id", 0) or 0))
+            if error: return error
+            result = self._message(params); self.delivered.append((time.monotonic(), result["chat"]["id"]))
+        elif method.startswith("edit"): result = self._message(params)
+        else: result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(self, request: web.Request) -> web.Response:
+        data = self.files.get(request.match_info["path"].removeprefix("photos/").removesuffix(".jpg"))
+        return web.Response(body=data, content_type="image/jpeg") if data is not None else web.Response(status=404)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        counts = {}
+        for method, _ in self.calls: counts[method] = counts.get(method, 0) + 1
+        return web.json_response({"total": len(self.calls), "by_method": counts, "delivered": len(self.delivered), "errors": self.errors, "last": self.calls[-20:]})
+
+    def build(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        app.router.add_get("/_stats", self.stats)
+        return app
+
+async def serve(port: int, latency: float = 0.0, api: FakeTelegramAPI | None = None) -> web.AppRunner:
+    runner = web.AppRunner((api or FakeTelegramAPI(latency)).build()); await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start(); return runner
+
+if __name__ == "__main__":
+    args = sys.argv[1:]; flood_every = int(args[args.index("--flood-every") + 1]) if "--flood-every" in args else 0
+    port = int(args[0]) if args and args[0].isdigit() else 8081
+    web.run_app(FakeTelegramAPI(enforce_limits="--limits" in args, flood_every=flood_every).build(), host="127.0.0.1", port=port)
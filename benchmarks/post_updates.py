@@ -0,0 +1,20 @@
+# Envia updates gravados do Telegram (um JSON por linha) para o webhook local do bot.
+#
+# Uso: python benchmarks/post_updates.py [arquivo.jsonl] [url] [secret]
+#      (padrões: benchmarks/sample_updates.jsonl, http://127.0.0.1:8080/telegram, WEBHOOK_SECRET/derivado do BOT_TOKEN)
+
+import asyncio, hashlib, json, os, sys
+import aiohttp
+
+async def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_updates.jsonl")
+    url = sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:8080/telegram"
+    secret = sys.argv[3] if len(sys.argv) > 3 else os.getenv("WEBHOOK_SECRET") or hashlib.sha256(os.environ["BOT_TOKEN"].encode()).hexdigest()
+    async with aiohttp.ClientSession() as session:
+        with open(path, encoding="utf-8") as updates:
+            for line in filter(str.strip, updates):
+                async with session.post(url, json=json.loads(line), headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as response:
+                    print(response.status, line[:80].strip())
+
+if __name__ == "__main__":
+    asyncio.run(main())
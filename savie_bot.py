@@ -1,14 +1,24 @@
 # Savie - Seu Assistente Financeiro Pessoal
 # Versão 12.5 - FINAL COM CORREÇÃO DE PARCELAMENTO
 
-import logging, os, re, sqlite3, json, asyncio, locale, io, csv
+import logging, os, re, sqlite3, json, asyncio, locale, io, csv, queue, threading, time, unicodedata, hashlib, hmac, signal, gzip, shutil, tempfile, math, random, multiprocessing, html, pickle, contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from datetime import datetime, date, timedelta
 from calendar import monthrange
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal, ROUND_HALF_UP
+from collections import OrderedDict, Counter
+from itertools import groupby, islice, chain
+from array import array
 from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton)
-from telegram.ext import (Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters)
-from telegram.constants import ParseMode
-import google.generativeai as genai
+from telegram.ext import (Application, BasePersistence, BaseUpdateProcessor, PersistenceInput, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters)
+from telegram.constants import ChatAction, ParseMode
+from telegram.helpers import escape_markdown
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from aiohttp import web
+from telegram.request import HTTPXRequest
+import savie_metrics as metrics
 
 # --- Configurações Iniciais ---
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -24,63 +34,798 @@ except locale.Error:
 
 # --- Constantes e Chaves de API ---
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Ex.: um Bot API falso local para testes
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" ou "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # URL pública; se definida, o webhook é registrado no Telegram ao iniciar
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or (hashlib.sha256(BOT_TOKEN.encode()).hexdigest() if BOT_TOKEN else None)
+PORT = int(os.getenv("PORT", "8080"))
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL_HOURS", "24")) * 60 * 60
+PENDING_ACTION_TTL = int(os.getenv("PENDING_ACTION_TTL_MINUTES", "30")) * 60
+SUGGESTION_TTL = 24 * 60 * 60
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "1"))
+# Com várias instâncias atendendo o webhook, o user_data é relido do banco antes de cada update.
+PERSISTENCE_SHARED = os.getenv("PERSISTENCE_SHARED", "1" if BOT_MODE == "webhook" else "0") == "1"
 DB_PATH = os.getenv("DB_PATH", "savie_bot.db")
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+# Pragmas por conexão. Em WAL, synchronous=NORMAL só faz fsync no checkpoint: uma queda de energia pode perder a
+# última transação, nunca corromper o banco. O mmap é compartilhado pelo page cache do sistema entre as conexões.
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_MB = int(os.getenv("DB_CACHE_MB", "8"))  # por conexão: 1 escritora + DB_READ_WORKERS leitoras
+DB_MMAP_MB = int(os.getenv("DB_MMAP_MB", "128"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_WAL_LIMIT_MB = int(os.getenv("DB_WAL_LIMIT_MB", "64"))  # tamanho a que o -wal volta depois de um checkpoint
+DB_CHECKPOINT_INTERVAL = int(os.getenv("DB_CHECKPOINT_INTERVAL", "300"))  # checkpoint PASSIVE periódico; TRUNCATE na manutenção diária
+FOREIGN_WRITES_INTERVAL = float(os.getenv("FOREIGN_WRITES_INTERVAL", "2"))  # segundos entre conferências de commits de outros processos
+DB_VACUUM_STEP_PAGES = 2000  # páginas livres devolvidas ao disco por passo do incremental_vacuum
+# Gastos mais antigos que o horizonte vão para um banco anexado (ARCHIVE_AFTER_MONTHS=0 desliga a movimentação).
+DB_ARCHIVE_PATH = os.getenv("DB_ARCHIVE_PATH")  # padrão: <DB_PATH sem extensão>_archive.db
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "24"))
+# Snapshots online pela API de backup do sqlite3, em passos curtos. Sem SNAPSHOT_DIR, não há snapshots.
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "2"))
+SNAPSHOT_STEP_PAGES = 256  # ~1 MB por passo: é o máximo que uma escrita espera durante o snapshot
+SNAPSHOT_MAX_RESTARTS = 20
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # se definido, /metrics exige "Authorization: Bearer <token>"; no webhook, só com ele /metrics fica na PORT pública
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))  # /metrics, /healthz e /ready num servidor próprio, fora da PORT do webhook (0 desliga)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 ADMIN_ID = 1812811739  # ID de Administrador configurado.
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+CATEGORY_CACHE_TTL = int(os.getenv("CATEGORY_CACHE_TTL_DAYS", "30")) * 24 * 60 * 60
+CATEGORY_CACHE_MAX = int(os.getenv("CATEGORY_CACHE_MAX", "5000"))
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "8"))
+AI_BATCH_WINDOW = int(os.getenv("AI_BATCH_WINDOW_MS", "50")) / 1000
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "8"))  # chamadas simultâneas ao modelo, somando todos os usos
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "10"))  # prazo total de uma chamada, com fila e novas tentativas
+AI_REPLY_TIMEOUT = float(os.getenv("AI_REPLY_TIMEOUT", "4"))  # resposta de conversa: melhor um "Ok!" rápido
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_BACKOFF_BASE, AI_BACKOFF_MAX = 0.5, 8.0
+AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "5"))  # falhas seguidas que abrem o disjuntor
+AI_BREAKER_RESET = float(os.getenv("AI_BREAKER_RESET", "30"))  # segundos de disjuntor aberto antes de uma chamada de teste
+KEYWORD_REFRESH_INTERVAL = int(os.getenv("KEYWORD_REFRESH_INTERVAL", "30"))
+# Limites de envio do Telegram: ~30 mensagens/s no total, 1/s por chat privado e 20/min por grupo.
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "30"))
+NOTIFY_PRIVATE_INTERVAL = 1.0
+NOTIFY_GROUP_INTERVAL = 3.0
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "16"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_LEASE = 5 * 60  # tempo que uma mensagem reservada fica invisível para as outras instâncias
+NOTIFY_FAILED_TTL = 7 * 24 * 60 * 60
+EXPORT_CHUNK_ROWS = 1000
+RECURRENCE_MIN_MONTHS = 3  # meses distintos para o job em lote propor uma assinatura
+RECURRENCE_MAX_BUCKETS = 3  # faixas de valor ativas além das quais a descrição é gasto comum
+RECURRENCE_NOISE = frozenset("mensal mensalidade assinatura plano pagamento pgto conta fatura de do da dos das com br www app".split())
+EXPORT_PART_BYTES = int(os.getenv("EXPORT_PART_MB", "45")) * 1024 * 1024  # bots enviam documentos de até 50 MB
+BILL_SUMMARY_DEBOUNCE = float(os.getenv("BILL_SUMMARY_DEBOUNCE", "3"))  # cliques de "Já paguei" viram uma edição do resumo por janela
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "5000"))  # relatórios renderizados (usuário, relatório, mês)
+TREND_MONTHS = 12
+TREND_WINDOW = 3  # meses da média móvel
+TREND_TOP_CATEGORIES = 8
+MONTH_ABBR = "jan fev mar abr mai jun jul ago set out nov dez".split()
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+# Fotos de recibos: cada processo de OCR (Python + tesseract) ocupa ~100 MB da VM de 1 GB.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", "8"))  # fotos lendo ou na fila; além disso o bot pede para reenviar depois
+OCR_MAX_BYTES = int(os.getenv("OCR_MAX_MB", "10")) * 1024 * 1024
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "1600"))  # lado maior depois da redução, ainda legível para o tesseract
+OCR_MAX_PIXELS = 40_000_000  # acima disso o Pillow recusa a imagem (bomba de descompressão)
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "20"))
+OCR_LANG = os.getenv("OCR_LANG", "por")
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+OCR_TASKS_PER_CHILD = 100  # o processo de OCR é reciclado e devolve a memória que o tesseract/Pillow retiveram
+# Extratos bancários (CSV/OFX): lidos em streaming de um arquivo temporário, em blocos de EXPORT_CHUNK_ROWS.
+STATEMENT_MAX_BYTES = int(os.getenv("STATEMENT_MAX_MB", "20")) * 1024 * 1024  # limite de download de arquivos pela Bot API
+STATEMENT_SIGN_SAMPLE = 500  # lançamentos lidos antes de decidir qual sinal é saída num CSV com uma só coluna de valor
+STATEMENT_HEADER_LINES = 20  # linhas de preâmbulo (agência, conta, período) toleradas antes do cabeçalho
+STATEMENT_DESC_MAX = 100
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-else:
+if not GOOGLE_API_KEY:
     logger.warning("Chave de API do Google não encontrada. A IA está desativada.")
 
+SCHEMA_VERSION = 11
+
 # --- Constantes de Callback e Estado ---
 CALLBACK_CONFIRM_EXPENSE = "confirm_exp"; CALLBACK_CONFIRM_INSTALLMENT = "confirm_inst"; CALLBACK_CANCEL = "cancel_op"
 CALLBACK_DELETE_MENU_LAST = "del_menu_last"; CALLBACK_DELETE_MENU_ALL = "del_menu_all"; CALLBACK_DELETE_CONFIRM_LAST = "del_conf_last"; CALLBACK_DELETE_CONFIRM_ALL = "del_conf_all"
-CALLBACK_ADD_RECURRING = "add_recur"; CALLBACK_CHALLENGE_ACCEPT = "chall_accept"; CALLBACK_PAY_BILL = "pay_bill"
+CALLBACK_ADD_RECURRING = "add_recur"; CALLBACK_CHALLENGE_ACCEPT = "chall_accept"; CALLBACK_PAY_BILL = "pay_bill"; CALLBACK_CONFIRM_IMPORT = "confirm_imp"
 STATE_ASKING_NAME = "state_ask_name"
 STATE_ASKING_EMAIL = "state_ask_email"
 
+ASCII_PUNCTUATION = str.maketrans({chr(code): ' ' for code in range(128) if not chr(code).isalnum()})
+
+def normalize_text(text: str) -> str:
+    # Minúsculas, sem acentos e sem pontuação: "Açaí  da Praça!" -> "acai da praca"
+    if text.isascii(): return ' '.join(text.lower().translate(ASCII_PUNCTUATION).split())  # atalho: nada a decompor
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.split())
+
+def description_fingerprint(text: str) -> str:
+    # Impressão digital para recorrência: "Netflix mensal", "NETFLIX.COM" e "Pagamento Netflix 03/25" -> "netflix"
+    words = normalize_text(text).split()
+    return ' '.join(sorted({w for w in words if not w.isdigit() and w not in RECURRENCE_NOISE})) or ' '.join(words)
+
+def amount_bucket(cents: int) -> int:
+    # Faixas logarítmicas de ~10%: valores próximos caem na mesma faixa ou numa vizinha.
+    return round(math.log(max(cents, 1), 1.1))
+
+def month_index(day: date) -> int:
+    return day.year * 12 + day.month - 1
+
+def to_cents(amount: Decimal) -> int:
+    return int((amount * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def from_cents(cents: int | None) -> Decimal:
+    return Decimal(cents or 0) / 100
+
+def split_cents(total_cents: int, parts: int) -> list[int]:
+    # Divide sem perder centavos: as primeiras parcelas absorvem o resto (1000 em 3 -> 334, 333, 333).
+    base, remainder = divmod(total_cents, parts); return [base + (1 if i < remainder else 0) for i in range(parts)]
+
+def encode_state(data: dict) -> str:
+    # JSON compacto; Decimal vira {"$d": "10.50"} para voltar exato.
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=lambda o: {'$d': str(o)} if isinstance(o, Decimal) else str(o))
+
+def decode_state(raw: str) -> dict:
+    return json.loads(raw, object_hook=lambda o: Decimal(o['$d']) if len(o) == 1 and '$d' in o else o)
+
 def add_months(source_date: date, months: int) -> date:
     month = source_date.month - 1 + months; year = source_date.year + month // 12; month = month % 12 + 1
     day = min(source_date.day, monthrange(year, month)[1]); return date(year, month, day)
 
+def installments_due(start_date: date, count: int, today: date) -> int:
+    # Parcelas vencidas até hoje, por aritmética de meses: a parcela i vence em add_months(start_date, i).
+    months = (today.year - start_date.year) * 12 + today.month - start_date.month
+    if months >= 0 and add_months(start_date, months) <= today: months += 1
+    return max(0, min(count, months))
+
+# --- Interpretação de Mensagens ---
+# Uma única expressão compilada reconhece, numa passada da esquerda para a direita, os pedaços de um
+# gasto: parcelas ("em 10x", "12 vezes", "3 parcelas de 50"), datas ("ontem", "15/03", "15/03/2025"),
+# valores ("R$ 1.234,56", "45.90", "1,5k", "2 mil") e palavras de ligação. O que sobra é a descrição.
+EXPENSE_TOKENS = re.compile(r"""
+    (?=[\dreaohgcpv])(?<!\w)  # atalho: todo pedaço começa no início de uma palavra, com dígito ou com a inicial de uma palavra-chave
+    (?:(?P<installments>(?<![\w.,])(?:em\s+)?(?P<count>\d{1,3})\s*(?:x|vezes|parcelas?)(?![^\W\d_])(?:\s+de(?=\s*(?:r\$\s*)?\d))?)
+  | (?P<date>(?<![\w.,/])(?P<day>\d{1,2})/(?P<month>\d{1,2})(?:/(?P<year>\d{4}|\d{2}))?(?![\w/]))
+  | (?P<relative>(?:anteontem|ontem|hoje)(?!\w))
+  | (?P<amount>(?P<currency>r\$\s*)?(?<![\w.,])(?:(?P<br>\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?)|(?P<us>\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?)|(?P<plain>\d+(?:[.,]\d{1,2})?))
+               (?:\s*(?P<multiplier>k|mil)(?!\w))?(?![^\W_]))
+  | (?P<filler>(?:gastei|comprei|paguei|valor|preço|reais|real|r\$)(?!\w)))
+""", re.IGNORECASE | re.VERBOSE)
+RELATIVE_DAYS = {'hoje': 0, 'ontem': 1, 'anteontem': 2}
+# Depois de um número inteiro, uma palavra fora desta lista ("2 pizzas") ou outro número ("iPhone 15 5000") fazem dele
+# uma quantidade ou parte do nome, que perde para qualquer outro valor; seguido delas, continua candidato a preço.
+AMOUNT_FOLLOWERS = frozenset("reais real com para pra pro p de do da dos das no na nos nas em e ou por pelo pela dia hoje ontem anteontem".split())
+AMOUNT_NEXT = re.compile(r"\s*(?:(?P<digit>\d)|(?P<word>[^\W\d_]+))")
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+# Mensagens curtas que não precisam da IA: texto normalizado (sem "savie") -> resposta pronta.
+CANNED_REPLIES = {
+    **dict.fromkeys(["oi", "ola", "oie", "eai", "e ai", "opa", "bom dia", "boa tarde", "boa noite", "oi bom dia", "ola bom dia", "oi boa tarde", "oi boa noite"],
+                    "Olá! 👋 Me envie um gasto, como Café 10,50, ou use os botões abaixo."),
+    **dict.fromkeys(["obrigado", "obrigada", "muito obrigado", "muito obrigada", "obg", "brigado", "brigada", "valeu", "vlw", "valeu mesmo", "obrigado pela ajuda", "obrigada pela ajuda"],
+                    "Por nada! 😊"),
+    **dict.fromkeys(["ok", "okay", "blz", "beleza", "certo", "combinado", "show", "show de bola", "top", "perfeito", "entendi", "entendido", "otimo", "legal", "massa", "joia", "tranquilo", "fechado", "sim", "ta bom", "ta certo"],
+                    "Combinado! 👍"),
+    **dict.fromkeys(["tchau", "ate mais", "ate logo", "ate amanha", "falou", "flw", "boa noite tchau"], "Até mais! 👋"),
+}
+
+def parse_expense_text(text: str, today: date | None = None) -> dict | None:
+    """Extrai valor, parcelas, data e descrição de uma mensagem livre. None se não houver valor nem parcelas."""
+    amount = rank = installments = when = None; per_installment = after_installments = False
+    description, last, slot, amount_text = [], 0, None, None
+    for match in EXPENSE_TOKENS.finditer(text):
+        description.append(text[last:match.start()]); last = match.end(); kind = match.lastgroup
+        if kind == 'installments':
+            installments = int(match['count']); after_installments = match['installments'][-2:].lower() == 'de'; continue
+        if kind in ('date', 'relative'): today = today or date.today()
+        if kind == 'date':
+            year = int(match['year'] or today.year); year += 2000 if year < 100 else 0
+            try: when = date(year, int(match['month']), int(match['day']))
+            except ValueError: when = None
+            if when and not match['year'] and when > today: when = add_months(when, -12)  # "15/12" em janeiro é do ano passado
+        elif kind == 'relative': when = today - timedelta(days=RELATIVE_DAYS[match['relative'].lower()])
+        elif kind == 'amount':
+            # Entre vários números vale o que parece dinheiro (R$, centavos, milhar, "k"), depois o inteiro solto e por último o que
+            # é quantidade ("2 pizzas 80"); empate fica com o primeiro ("Almoço 45 com 3 amigos", "Mercado 150 dia 3").
+            candidate_rank = 2
+            if match['plain'] and match['plain'].isdigit() and not (match['currency'] or match['multiplier']):
+                following = AMOUNT_NEXT.match(text, match.end())
+                candidate_rank = 0 if following and (following['digit'] or following['word'].lower() not in AMOUNT_FOLLOWERS) else 1
+            if rank is not None and candidate_rank <= rank: description.append(match.group())
+            else:
+                number = match['br'].replace('.', '').replace(',', '.') if match['br'] else match['us'].replace(',', '') if match['us'] else match['plain'].replace(',', '.')
+                if slot is not None: description[slot] = amount_text
+                amount, rank, amount_text, per_installment = Decimal(number) * (1000 if match['multiplier'] else 1), candidate_rank, match.group(), after_installments
+                slot = len(description); description.append(' ')
+        after_installments = False
+    description.append(text[last:])
+    if amount is None and installments is None: return None
+    if amount is not None and per_installment and installments: amount *= installments
+    desc = ' '.join(''.join(description).split()).strip(' -,;:').capitalize()
+    return {'amount': amount if amount is not None else Decimal(0), 'description': desc or "Gasto não especificado", 'installments': installments, 'date': when}
+
+def canned_reply(text: str) -> str | None:
+    return CANNED_REPLIES.get(' '.join(word for word in normalize_text(text).split() if word != 'savie'))
+
+# Recibos lidos por OCR: a linha do total ("TOTAL R$ 152,30", "VALOR A PAGAR 80,00"; SUBTOTAL não conta),
+# a primeira data e o nome da loja (primeira linha com palavras que não seja cabeçalho fiscal).
+RECEIPT_TOTAL = re.compile(r"(?<![^\W\d_])(?:total|a\s+pagar)(?![^\W\d_]).*?(?P<amount>\d{1,3}(?:\.\d{3})+,\d{2}|\d+[.,]\d{2})\s*$", re.IGNORECASE | re.MULTILINE)
+RECEIPT_DATE = re.compile(r"(?<!\d)(\d{2})[/.-](\d{2})[/.-](\d{4}|\d{2})(?!\d)")
+RECEIPT_WORD = re.compile(r"[^\W\d_]{2,}")
+RECEIPT_HEADER = re.compile(r"cnpj|cpf|cupom|nfc-?e|nota|fiscal|extrato|documento|danfe|consumidor|inscri", re.IGNORECASE)
+
+def parse_receipt_text(text: str, today: date | None = None) -> dict | None:
+    """Monta "loja total data" a partir do texto do recibo e passa pelo parse_expense_text. None se não houver total."""
+    total = RECEIPT_TOTAL.search(text)
+    if not total: return None
+    merchant = next((words for line in text[:total.start()].splitlines()[:8] if not RECEIPT_HEADER.search(line) and sum(map(len, words := RECEIPT_WORD.findall(line))) >= 4), ["Recibo"])
+    when = RECEIPT_DATE.search(text)
+    parsed = parse_expense_text(f"{' '.join(merchant[:5])} {total['amount']} {'/'.join(when.groups()) if when else ''}", today)
+    if parsed['date'] and parsed['date'] > (today or date.today()): parsed['date'] = None  # data futura é erro de leitura
+    return parsed
+
+# Extratos bancários: CSV (separador e colunas reconhecidos pelo cabeçalho, com preâmbulo opcional) ou OFX
+# (SGML 1.x ou XML 2.x), lidos do disco um lançamento por vez como (data, centavos com sinal, descrição).
+STATEMENT_COLUMNS = {
+    'date': ('data', 'date', 'dt', 'data lancamento', 'data movimento', 'data da compra', 'data transacao'),
+    'description': ('descricao', 'historico', 'lancamento', 'estabelecimento', 'description', 'title', 'titulo', 'memo', 'detalhes'),
+    'amount': ('valor', 'amount', 'value', 'quantia'),
+    'debit': ('debito', 'saida', 'saidas', 'debit'),
+    'credit': ('credito', 'entrada', 'entradas', 'credit'),
+}
+STATEMENT_DATE = re.compile(r"\s*(\d{1,4})[/.-](\d{1,2})[/.-](\d{2,4})\b")
+STATEMENT_NUMBER = re.compile(r"\d[\d.,]*")
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def parse_statement_amount(text: str) -> int | None:
+    """Centavos com sinal: "-1.234,56", "1,234.56", "R$ 45,90", "(12,00)", "80,00 D". None se não for um valor."""
+    text = text.upper().replace('R$', '').replace('\xa0', '').replace(' ', '')
+    negative = text[:1] in ('-', '(') or text[-1:] in ('-', ')', 'D')
+    digits = text.strip('+-()DC')
+    if not STATEMENT_NUMBER.fullmatch(digits): return None
+    # O último separador é o decimal se tiver até 2 dígitos depois dele ou se os dois tipos aparecerem ("1.234" é milhar).
+    comma, dot = digits.rfind(','), digits.rfind('.'); separator = max(comma, dot)
+    if separator >= 0 and (len(digits) - separator - 1 <= 2 or min(comma, dot) >= 0): whole, fraction = digits[:separator], digits[separator + 1:]
+    else: whole, fraction = digits, ''
+    cents = int(whole.replace(',', '').replace('.', '') or 0) * 100 + int((fraction + '00')[:2])
+    return -cents if negative else cents
+
+def parse_statement_date(text: str) -> date | None:
+    """dd/mm/aaaa, dd-mm-aa, aaaa-mm-dd ou aaaammdd (OFX, com ou sem hora). None se não for uma data válida."""
+    text = text.strip(); found = STATEMENT_DATE.match(text)
+    if found:
+        first, month, last = found.groups(); year, day = (first, last) if len(first) == 4 else (last, first)
+    elif text[:8].isdigit(): year, month, day = text[:4], text[4:6], text[6:8]
+    else: return None
+    year, month, day = int(year), int(month), int(day); year += 2000 if year < 100 else 0
+    if month > 12 >= day: month, day = day, month  # mm/dd/aaaa de exportações em inglês
+    try: return date(year, month, day)
+    except ValueError: return None
+
+def statement_columns(header: list[str]) -> dict[str, int] | None:
+    # Nome exato tem prioridade sobre prefixo ("Data Lançamento", "Valor (R$)"); cada coluna serve a um campo só.
+    names = [normalize_text(name) for name in header]; columns = {}
+    for field, aliases in STATEMENT_COLUMNS.items():
+        for exact in (True, False):
+            index = next((i for i, name in enumerate(names) if i not in columns.values() and any(name == alias if exact else name.startswith(alias + ' ') for alias in aliases)), None)
+            if index is not None: columns[field] = index; break
+    return columns if 'date' in columns and 'description' in columns and ('amount' in columns or 'debit' in columns) else None
+
+def statement_description(text: str) -> str:
+    return ' '.join(html.unescape(text).split())[:STATEMENT_DESC_MAX] or "Lançamento do extrato"
+
+def _csv_amount(row: list[str], columns: dict) -> int | None:
+    if 'amount' in columns and row[columns['amount']].strip(): return parse_statement_amount(row[columns['amount']])
+    debit, credit = (parse_statement_amount(row[columns[field]]) if field in columns and row[columns[field]].strip() else None for field in ('debit', 'credit'))
+    if debit: return -abs(debit)
+    return abs(credit) if credit is not None else debit
+
+def _csv_statement(handle, stats: dict):
+    preamble = list(islice(handle, STATEMENT_HEADER_LINES))
+    found = next(((index, delimiter, columns) for index, line in enumerate(preamble) for delimiter in ';,\t|'
+                  if (columns := statement_columns(next(csv.reader([line], delimiter=delimiter), [])))), None)
+    if not found: raise ValueError("cabeçalho do CSV não reconhecido")
+    index, delimiter, columns = found; stats['signed'] = 'debit' in columns  # débito/crédito em colunas separadas dizem o sentido
+    for row in csv.reader(chain(preamble[index + 1:], handle), delimiter=delimiter):
+        if not any(field.strip() for field in row): continue
+        try: day, cents, description = parse_statement_date(row[columns['date']]), _csv_amount(row, columns), row[columns['description']]
+        except IndexError: day = cents = None
+        if day is None or cents is None: stats['invalid'] += 1; continue
+        yield day, cents, statement_description(description)
+
+def _ofx_transaction(fields: dict, stats: dict):
+    day, cents = parse_statement_date(fields.get('DTPOSTED', '')), parse_statement_amount(fields.get('TRNAMT', ''))
+    if day is None or cents is None: stats['invalid'] += 1; return
+    yield day, cents, statement_description(fields.get('MEMO') or fields.get('NAME') or '')
+
+def _ofx_statement(handle, stats: dict):
+    # Lido em blocos: só as tags completas de cada bloco são processadas, o resto segue para o próximo.
+    stats['signed'] = True; transaction, carry = None, ''  # no OFX, saídas são sempre negativas
+    while True:
+        block = handle.read(65536); text = carry + block; cut = text.rfind('<') if block else len(text)
+        if cut <= 0 and block: carry = text; continue
+        text, carry = text[:cut], text[cut:]
+        for closing, tag, value in OFX_TAG.findall(text):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if transaction is not None: yield from _ofx_transaction(transaction, stats)
+                transaction = None if closing else {}
+            elif transaction is not None and not closing: transaction.setdefault(tag, value.strip())
+        if not block: break
+    if transaction is not None: yield from _ofx_transaction(transaction, stats)
+
+def read_statement(path: str, stats: dict):
+    """Lançamentos de um extrato CSV ou OFX em disco, um por vez. Linhas ilegíveis vão para stats['invalid'];
+    ValueError se o arquivo não parecer um extrato."""
+    with open(path, 'rb') as raw: sample = raw.read(65536)
+    try: sample.decode('utf-8'); encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e: encoding = 'utf-8-sig' if e.start >= len(sample) - 3 else 'cp1252'  # bancos ainda exportam em Windows-1252
+    head = sample[:4096].upper()
+    with open(path, encoding=encoding, errors='replace', newline='') as handle:
+        yield from (_ofx_statement if b'OFXHEADER' in head or b'<OFX>' in head else _csv_statement)(handle, stats)
+
+def statement_expenses(path: str, stats: dict):
+    """Só as saídas do extrato, com valor positivo. Num CSV com uma coluna de valor, saída é o sinal da maioria dos
+    primeiros STATEMENT_SIGN_SAMPLE lançamentos (extrato de conta: negativos; fatura de cartão: compras positivas)."""
+    rows = read_statement(path, stats); head = list(islice(rows, STATEMENT_SIGN_SAMPLE))
+    sign = -1 if stats.get('signed') or 2 * sum(cents < 0 for _, cents, _ in head) > len(head) else 1
+    for day, cents, description in chain(head, rows):
+        if cents * sign > 0: yield day, abs(cents), description
+        else: stats['credits'] += 1
+
+# --- Camada de Acesso Assíncrono ao Banco ---
+class SQLiteExecutor:
+    """Tira o SQLite do event loop: uma thread escritora dona da conexão de escrita
+    (escritas serializadas por uma fila) e um pool de conexões somente-leitura."""
+    _STOP = object()
+
+    def __init__(self, savie: "SavieBot", read_workers: int = DB_READ_WORKERS):
+        self.savie = savie
+        self._write_queue = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="savie-db-writer", daemon=True)
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="savie-db-reader", initializer=self._init_reader)
+        self._writer.start()
+
+    def _init_reader(self):
+        self.savie._local.conn = self.savie.connect_reader()
+
+    def _writer_loop(self):
+        while True:
+            item = self._write_queue.get()
+            if item is self._STOP: break
+            self._run(item)
+
+    def _run(self, item):
+        fn, loop, future = item
+        try: result, error = fn(), None
+        except BaseException as e: result, error = None, e
+        try: self.savie.publish_report_changes()  # antes de responder: quem escreveu já vê o relatório novo
+        except Exception as e: logger.error(f"Falha ao publicar as versões dos relatórios: {e}", exc_info=True); self.savie.reports.invalidate_all()
+        loop.call_soon_threadsafe(self._resolve, future, result, error)
+
+    def drain(self):
+        # Chamado pela própria thread escritora no meio de uma tarefa longa feita em passos (snapshot): roda as escritas
+        # que chegaram até agora, para que esperem no máximo um passo.
+        while True:
+            try: item = self._write_queue.get_nowait()
+            except queue.Empty: return
+            if item is self._STOP: self._write_queue.put(item); return
+            self._run(item)
+
+    @staticmethod
+    def _measured(op: str, fn, enqueued: float):
+        # Separa a espera na fila/pool do tempo de execução da consulta, por método do SavieBot.
+        started = time.perf_counter(); metrics.observe("savie_db_wait_seconds", started - enqueued, op=op)
+        with metrics.timer("savie_db_seconds", op=op, method=fn.func.__name__): return fn()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result, error):
+        if future.cancelled(): return
+        if error is not None: future.set_exception(error)
+        else: future.set_result(result)
+
+    async def write(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop(); future = loop.create_future(); call = partial(fn, *args, **kwargs)
+        if metrics.ENABLED: call = partial(self._measured, "write", call, time.perf_counter())
+        self._write_queue.put((call, loop, future))
+        return await future
+
+    async def read(self, fn, *args, **kwargs):
+        call = partial(fn, *args, **kwargs)
+        if metrics.ENABLED: call = partial(self._measured, "read", call, time.perf_counter())
+        return await asyncio.get_running_loop().run_in_executor(self._readers, call)
+
+    def close(self):
+        self._write_queue.put(self._STOP); self._writer.join()
+        self._readers.shutdown(wait=True)
+
+# --- Caches de Perfis e Relatórios ---
+class ProfileCache:
+    """LRU limitado de perfis com cadastro completo. Acessado pelo event loop e pelas threads do banco,
+    por isso o lock; a geração evita que uma leitura antiga repovoe o cache depois de uma invalidação."""
+    def __init__(self, maxsize: int = PROFILE_CACHE_SIZE):
+        self.maxsize = maxsize; self._data: OrderedDict = OrderedDict(); self._lock = threading.Lock(); self.generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get(self, user_id: int):
+        with self._lock:
+            profile = self._data.get(user_id)
+            if profile is None: self.stats['misses'] += 1; return None
+            self._data.move_to_end(user_id); self.stats['hits'] += 1; return profile
+
+    def put(self, user_id: int, profile, generation: int):
+        with self._lock:
+            if generation != self.generation: return
+            self._data[user_id] = profile; self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False); self.stats['evictions'] += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.generation += 1; self.stats['invalidations'] += 1; self._data.pop(user_id, None)
+
+class ReportCache:
+    """Relatórios já renderizados por (usuário, relatório, mês), guardados com a versão dos totais do usuário em que foram
+    montados. As versões ficam em memória e sobem quando os totais daquele usuário mudam (SavieBot.watch_report_data),
+    então conferir o cache não lê o banco. A época cobre commits de outros processos (SavieBot.check_foreign_writes,
+    conferido por foreign_writes_job), que não sabemos de quem são."""
+    def __init__(self, maxsize: int = REPORT_CACHE_SIZE):
+        self.maxsize = maxsize; self._data: OrderedDict = OrderedDict(); self._versions: dict[int, int] = {}; self._lock = threading.Lock(); self.epoch = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def version(self, user_id: int) -> tuple[int, int]:
+        return self.epoch, self._versions.get(user_id, 0)
+
+    def get(self, user_id: int, kind: str, year_month: str, version: tuple):
+        with self._lock:
+            entry = self._data.get((user_id, kind, year_month))
+            if entry is None or entry[0] != version: self.stats['misses'] += 1; return None
+            self._data.move_to_end((user_id, kind, year_month)); self.stats['hits'] += 1; return entry[1]
+
+    def put(self, user_id: int, kind: str, year_month: str, version: tuple, report: str):
+        # A versão é lida antes da consulta: se os gastos mudaram no meio, o relatório nasce velho e não entra.
+        with self._lock:
+            if version != (self.epoch, self._versions.get(user_id, 0)): return
+            self._data[(user_id, kind, year_month)] = (version, report); self._data.move_to_end((user_id, kind, year_month))
+            while len(self._data) > self.maxsize: self._data.popitem(last=False); self.stats['evictions'] += 1
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids: self._versions[user_id] = self._versions.get(user_id, 0) + 1; self.stats['invalidations'] += 1
+
+    def invalidate_all(self):
+        with self._lock: self.epoch += 1; self._data.clear(); self.stats['invalidations'] += 1
+
 # --- Classe Principal do Bot ---
 class SavieBot:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, archive_path: str | None = DB_ARCHIVE_PATH):
         logger.info(f"--- INICIANDO CONEXÃO COM BANCO DE DADOS ---")
         logger.info(f"Caminho do DB fornecido: {db_path}")
+        self.db_path = db_path; self.archive_path = archive_path or f"{os.path.splitext(db_path)[0]}_archive.db"
+        self._local = threading.local()
+        self.profiles = ProfileCache(); self.reports = ReportCache()
         try:
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._write_conn = sqlite3.connect(db_path, check_same_thread=False)
             self.conn.row_factory = sqlite3.Row
-            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')  # só vale num banco novo; os antigos precisam de /compactar
+            self.conn.execute('PRAGMA journal_mode=WAL'); self.configure_connection(self.conn, writer=True)
             logger.info("Conexão com SQLite estabelecida com sucesso.")
             logger.info("Iniciando a configuração do banco de dados (chamando setup_database)...")
             self.setup_database()
+            self.attach_archive(self.conn, writer=True); self.watch_report_data(self.conn)
+            if self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                logger.warning("Banco sem auto_vacuum incremental: a manutenção diária não devolve páginas ao disco até o /compactar (VACUUM completo, uma única vez).")
             logger.info("Configuração do banco de dados (setup_database) CONCLUÍDA.")
         except Exception as e:
             logger.critical(f"--- ERRO CRÍTICO AO INICIAR O BANCO DE DADOS ---: {e}", exc_info=True)
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Threads do pool de leitura usam sua própria conexão somente-leitura; o resto usa a de escrita.
+        return getattr(self._local, 'conn', None) or self._write_conn
+
+    def close(self):
+        # Depois do SQLiteExecutor.close: a thread escritora já parou e não usa mais as duas conexões.
+        self._probe.close(); self._write_conn.close()
+
+    # --- Armazenamento: pragmas, arquivo morto, checkpoints, vacuum e snapshots ---
+    @staticmethod
+    def configure_connection(conn: sqlite3.Connection, writer: bool = False):
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}'); conn.execute(f'PRAGMA cache_size = {-DB_CACHE_MB * 1024}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_MB * 1024 * 1024}'); conn.execute('PRAGMA temp_store = MEMORY')
+        if writer: conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}'); conn.execute(f'PRAGMA journal_size_limit = {DB_WAL_LIMIT_MB * 1024 * 1024}')
+
+    def connect_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row; self.configure_connection(conn); self.attach_archive(conn)
+        return conn
+
+    def attach_archive(self, conn: sqlite3.Connection, writer: bool = False):
+        # O arquivo morto é outro banco, anexado como "archive" em toda conexão. A view all_expenses (temporária: views do
+        # banco principal não podem citar outro banco) junta os dois para quem precisa do histórico completo.
+        if writer:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,)); conn.execute('PRAGMA archive.journal_mode=WAL')
+            conn.execute(f'PRAGMA archive.synchronous = {DB_SYNCHRONOUS}')
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS archive.expenses (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, amount_cents INTEGER NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, date DATE NOT NULL, created_at TIMESTAMP, is_installment BOOLEAN, installment_id INTEGER)')
+                conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_archive_expenses_user_date ON expenses (user_id, date)')
+        else: conn.execute("ATTACH DATABASE ? AS archive", (f"file:{self.archive_path}?mode=ro",))
+        columns = "id, user_id, amount_cents, description, category, date, created_at, is_installment, installment_id"
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS all_expenses AS SELECT {columns} FROM main.expenses UNION ALL SELECT {columns} FROM archive.expenses")
+
+    # --- Versões dos relatórios ---
+    def watch_report_data(self, conn: sqlite3.Connection):
+        # Triggers TEMP (só desta conexão, fora do schema: outras ferramentas gravam no banco sem conhecer a função) anotam
+        # de quem mudaram os totais mensais, de onde saem todos os relatórios. As anotações só viram versão nova em
+        # publish_report_changes, depois do commit; antes disso um leitor ainda veria os totais antigos.
+        self._changed_users: set[int] = set(); conn.create_function('savie_totals_changed', 1, self._changed_users.add)
+        for event, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+            calls = ' '.join(f"SELECT savie_totals_changed({row}.user_id);" for row in rows)
+            conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS trg_monthly_totals_{event.lower()}_reports AFTER {event} ON main.monthly_category_totals BEGIN {calls} END")
+        self._data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        # Sonda dos commits de outros processos (check_foreign_writes, a cada FOREIGN_WRITES_INTERVAL): uma conexão só para o
+        # PRAGMA data_version, que lê o cabeçalho do WAL e nenhuma página. Ela também vê os commits do nosso escritor,
+        # que os absorve em publish_report_changes para que não derrubem o cache.
+        self._probe = sqlite3.connect(self.db_path, check_same_thread=False); self._probe_lock = threading.Lock()
+        self._probe_version = self._probe.execute('PRAGMA data_version').fetchone()[0]; self.foreign_writes = 0
+
+    def publish_report_changes(self):
+        # Na thread escritora, depois de cada escrita: versões novas para quem teve os totais mudados; a sonda absorve o
+        # nosso commit; e commits de outras conexões até aqui (o data_version da conexão de escrita não muda com os
+        # próprios commits) derrubam o cache todo, já que não há como saber de quem eram os gastos. Os que vierem depois
+        # da absorção a sonda acusa na próxima conferência. O lock faz das duas etapas uma só para check_foreign_writes.
+        if self._changed_users: changed = list(self._changed_users); self._changed_users.clear(); self.reports.invalidate(changed)
+        with self._probe_lock:
+            self._probe_version = self._probe.execute('PRAGMA data_version').fetchone()[0]
+            data_version = self._write_conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version: self._data_version = data_version; self._foreign_write()
+
+    def check_foreign_writes(self) -> int:
+        # Fora do event loop, por foreign_writes_job. Devolve o contador de commits de fora: enquanto ele não muda, nenhum
+        # outro processo gravou. Um commit nosso ainda não absorvido também conta; só custa
+        # um cache vazio ou uma releitura.
+        with self._probe_lock:
+            version = self._probe.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._probe_version: self._probe_version = version; self._foreign_write()
+            return self.foreign_writes
+
+    def _foreign_write(self):
+        self.foreign_writes += 1; self.reports.invalidate_all()
+
+    def archive_expenses(self, before: date, batch_rows: int = EXPORT_CHUNK_ROWS) -> int:
+        """Move um lote de gastos com data anterior a `before` para o arquivo morto. Devolve quantos moveu (0 = acabou).
+        Transações em bancos anexados com WAL não são atômicas entre si, então são duas: copiar (idempotente) e só depois
+        apagar o que já está no arquivo. Uma queda no meio deixa cópias repetidas, que a próxima rodada limpa; nunca perde gastos."""
+        columns = "id, user_id, amount_cents, description, category, date, created_at, is_installment, installment_id"
+        rows = self.conn.execute(f"SELECT {columns} FROM main.expenses WHERE date < ? ORDER BY date LIMIT ?", (before.isoformat(), batch_rows)).fetchall()
+        if not rows: return 0
+        with self.conn: self.conn.executemany(f"INSERT OR IGNORE INTO archive.expenses ({columns}) VALUES ({', '.join('?' * 9)})", rows)
+        # O trigger de DELETE desconta os totais mensais; eles continuam valendo para o histórico e são devolvidos na mesma transação.
+        totals = Counter(); counts = Counter()
+        for row in rows: key = (row['user_id'], str(row['date'])[:7], row['category']); totals[key] += row['amount_cents']; counts[key] += 1
+        with self.conn:
+            self.conn.executemany("DELETE FROM main.expenses WHERE id = ? AND EXISTS (SELECT 1 FROM archive.expenses a WHERE a.id = ?)", [(row['id'], row['id']) for row in rows])
+            self.conn.executemany("INSERT INTO monthly_category_totals (user_id, year_month, category, total_cents, count) VALUES (?, ?, ?, ?, ?) "
+                                  "ON CONFLICT (user_id, year_month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count",
+                                  [(*key, cents, counts[key]) for key, cents in totals.items()])
+        return len(rows)
+
+    def checkpoint(self, mode: str = 'PASSIVE') -> tuple[int, int, int]:
+        # PASSIVE copia o que puder sem esperar leitores; TRUNCATE espera (até o busy_timeout) e zera o -wal.
+        return tuple(self.conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone())
+
+    def incremental_vacuum(self, pages: int = DB_VACUUM_STEP_PAGES) -> int:
+        # Devolve até `pages` páginas livres ao sistema de arquivos; o resto fica para o próximo passo.
+        free = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free: self.conn.execute(f'PRAGMA incremental_vacuum({min(free, pages)})').fetchall()
+        return max(0, free - pages)
+
+    def enable_incremental_vacuum(self) -> float | None:
+        # O VACUUM completo que grava o auto_vacuum = INCREMENTAL num banco antigo: reescreve o arquivo todo e segura a
+        # thread escritora até o fim, por isso só pelo /compactar. Devolve os segundos gastos, ou None se já estava ativo.
+        if self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2: return None
+        started = time.perf_counter(); self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL'); self.conn.execute('VACUUM')
+        return time.perf_counter() - started
+
+    def storage_stats(self) -> dict:
+        # Só tamanhos de arquivo, sem consultar o banco: serve ao /metrics sem disputar a conexão de escrita.
+        return {name: os.path.getsize(path) if os.path.exists(path) else 0 for name, path in
+                (('db_bytes', self.db_path), ('wal_bytes', f"{self.db_path}-wal"), ('archive_bytes', self.archive_path), ('archive_wal_bytes', f"{self.archive_path}-wal"))}
+
+    def snapshot(self, directory: str, keep: int = SNAPSHOT_KEEP, pages: int = SNAPSHOT_STEP_PAGES, between_steps=None) -> list[str]:
+        """Cópia online do banco e do arquivo morto pela API de backup, a partir da conexão de escrita e em passos de `pages`
+        páginas. Roda na thread escritora (db.write) com between_steps=db.drain: as escritas que chegam durante a cópia rodam
+        entre um passo e outro, pela mesma conexão, e o SQLite as leva para a cópia sem recomeçar. Escritas de outra conexão
+        (um sqlite3 aberto à mão no volume) fazem o backup recomeçar; depois de SNAPSHOT_MAX_RESTARTS, desiste."""
+        os.makedirs(directory, exist_ok=True); stamp = datetime.now().strftime('%Y%m%d-%H%M%S'); paths = []
+        for name, prefix in (('main', 'savie'), ('archive', 'savie_archive')):
+            path = os.path.join(directory, f"{prefix}_{stamp}.db"); partial_path = f"{path}.partial"; progress = {'remaining': None, 'restarts': 0}
+            def step(status, remaining, total):
+                if progress['remaining'] is not None and remaining > progress['remaining']:
+                    progress['restarts'] += 1
+                    if progress['restarts'] > SNAPSHOT_MAX_RESTARTS: raise InterruptedError(f"snapshot de {name} recomeçou {progress['restarts']} vezes")
+                progress['remaining'] = remaining
+                if between_steps: between_steps()
+            target = sqlite3.connect(partial_path)
+            try: self._write_conn.backup(target, pages=pages, progress=step, name=name)
+            except BaseException:
+                target.close(); os.remove(partial_path); raise
+            target.close(); os.replace(partial_path, path); paths.append(path)
+        for prefix in ('savie_archive_', 'savie_'):
+            old = sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith('.db') and (prefix == 'savie_archive_' or not name.startswith('savie_archive_')))
+            for name in old[:-keep]: os.remove(os.path.join(directory, name))
+        return paths
+
     def setup_database(self):
-        logger.info("Dentro de setup_database. Tentando executar CREATE TABLE...")
+        logger.info("Dentro de setup_database. Verificando migrações pendentes...")
         try:
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute('''CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, full_name TEXT, email TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-                cursor.execute('CREATE TABLE IF NOT EXISTS expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, amount DECIMAL(10,2) NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, date DATE NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_installment BOOLEAN DEFAULT FALSE, installment_id INTEGER, FOREIGN KEY (user_id) REFERENCES users (user_id))')
-                cursor.execute('CREATE TABLE IF NOT EXISTS installments (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, total_amount DECIMAL(10,2) NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, total_installments INTEGER NOT NULL, start_date DATE NOT NULL, FOREIGN KEY (user_id) REFERENCES users (user_id))')
-                cursor.execute('CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, keywords TEXT NOT NULL, emoji TEXT NOT NULL)')
-                cursor.execute('CREATE TABLE IF NOT EXISTS recurring_expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, description TEXT NOT NULL, amount DECIMAL(10,2) NOT NULL, category TEXT NOT NULL, day_of_month INTEGER NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users (user_id), UNIQUE(user_id, description))')
-                cursor.execute('CREATE TABLE IF NOT EXISTS challenges (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, challenge_type TEXT NOT NULL, target_category TEXT, start_date DATE NOT NULL, end_date DATE NOT NULL, status TEXT NOT NULL, FOREIGN KEY (user_id) REFERENCES users (user_id))')
-                cursor.execute('CREATE TABLE IF NOT EXISTS shared_bills (id INTEGER PRIMARY KEY AUTOINCREMENT, creator_user_id INTEGER NOT NULL, creator_username TEXT, group_chat_id INTEGER NOT NULL, summary_message_id INTEGER, description TEXT NOT NULL, total_amount DECIMAL(10,2) NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, status TEXT DEFAULT "open")')
-                cursor.execute('CREATE TABLE IF NOT EXISTS bill_participants (id INTEGER PRIMARY KEY AUTOINCREMENT, bill_id INTEGER NOT NULL, participant_user_id INTEGER, participant_username TEXT NOT NULL, amount_due DECIMAL(10,2) NOT NULL, status TEXT DEFAULT "pending", FOREIGN KEY (bill_id) REFERENCES shared_bills (id) ON DELETE CASCADE)')
-            self.conn.commit()
-            logger.info("Comandos CREATE TABLE executados e commitados com sucesso!")
+            self.run_migrations()
             logger.info("Iniciando populate_default_categories...")
             self.populate_default_categories()
             logger.info("populate_default_categories concluído.")
         except Exception as e:
             logger.error(f"--- ERRO DENTRO DE setup_database ---: {e}", exc_info=True)
 
+    # --- Migrações de Schema (versionadas por PRAGMA user_version) ---
+    def run_migrations(self):
+        current = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        for version in range(current + 1, SCHEMA_VERSION + 1):
+            logger.info(f"Aplicando migração v{version}...")
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                getattr(self, f'_migrate_v{version}')(self.conn.cursor())
+                self.conn.execute(f'PRAGMA user_version = {version}')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback(); raise
+        if current < SCHEMA_VERSION: logger.info(f"Schema migrado de v{current} para v{SCHEMA_VERSION}.")
+
+    def _migrate_v1(self, cursor: sqlite3.Cursor):
+        # Schema original. Usa IF NOT EXISTS porque bancos antigos já têm essas tabelas com user_version = 0.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, full_name TEXT, email TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        cursor.execute('CREATE TABLE IF NOT EXISTS expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, amount DECIMAL(10,2) NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, date DATE NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_installment BOOLEAN DEFAULT FALSE, installment_id INTEGER, FOREIGN KEY (user_id) REFERENCES users (user_id))')
+        cursor.execute('CREATE TABLE IF NOT EXISTS installments (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, total_amount DECIMAL(10,2) NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, total_installments INTEGER NOT NULL, start_date DATE NOT NULL, FOREIGN KEY (user_id) REFERENCES users (user_id))')
+        cursor.execute('CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, keywords TEXT NOT NULL, emoji TEXT NOT NULL)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS recurring_expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, description TEXT NOT NULL, amount DECIMAL(10,2) NOT NULL, category TEXT NOT NULL, day_of_month INTEGER NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users (user_id), UNIQUE(user_id, description))')
+        cursor.execute('CREATE TABLE IF NOT EXISTS challenges (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, challenge_type TEXT NOT NULL, target_category TEXT, start_date DATE NOT NULL, end_date DATE NOT NULL, status TEXT NOT NULL, FOREIGN KEY (user_id) REFERENCES users (user_id))')
+        cursor.execute('CREATE TABLE IF NOT EXISTS shared_bills (id INTEGER PRIMARY KEY AUTOINCREMENT, creator_user_id INTEGER NOT NULL, creator_username TEXT, group_chat_id INTEGER NOT NULL, summary_message_id INTEGER, description TEXT NOT NULL, total_amount DECIMAL(10,2) NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, status TEXT DEFAULT "open")')
+        cursor.execute('CREATE TABLE IF NOT EXISTS bill_participants (id INTEGER PRIMARY KEY AUTOINCREMENT, bill_id INTEGER NOT NULL, participant_user_id INTEGER, participant_username TEXT NOT NULL, amount_due DECIMAL(10,2) NOT NULL, status TEXT DEFAULT "pending", FOREIGN KEY (bill_id) REFERENCES shared_bills (id) ON DELETE CASCADE)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS category_cache (description_key TEXT PRIMARY KEY, category TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_cache_last_used ON category_cache (last_used)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS user_keywords (user_id INTEGER NOT NULL, keyword TEXT NOT NULL, category TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (user_id, keyword))')
+        # Versão do catálogo de palavras-chave: qualquer mudança em categories/user_keywords faz o matcher se reconstruir.
+        cursor.execute('CREATE TABLE IF NOT EXISTS catalog_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)')
+        cursor.execute("INSERT OR IGNORE INTO catalog_versions (name, version) VALUES ('keywords', 0)")
+        for table in ('categories', 'user_keywords'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version AFTER {event} ON {table} BEGIN UPDATE catalog_versions SET version = version + 1 WHERE name = 'keywords'; END")
+
+    def _migrate_v2(self, cursor: sqlite3.Cursor):
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_installment ON expenses (installment_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_description_date ON expenses (user_id, description, date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date ON expenses (user_id, category, date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_installments_user_start ON installments (user_id, start_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recurring_day ON recurring_expenses (day_of_month)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_challenges_status_end ON challenges (status, end_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_challenges_user_status ON challenges (user_id, status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bill_participants_bill ON bill_participants (bill_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_cache_created ON category_cache (created_at)')
+
+    def _migrate_v3(self, cursor: sqlite3.Cursor):
+        # Valores monetários passam de texto DECIMAL para centavos inteiros. O SQLite não altera o tipo de uma
+        # coluna, então cada tabela é recriada e copiada; a conversão usa Decimal (sem passar por float).
+        self.conn.create_function('to_cents', 1, lambda value: None if value is None else to_cents(Decimal(str(value))), deterministic=True)
+        rebuilds = {
+            'expenses': ('CREATE TABLE expenses_new (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, amount_cents INTEGER NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, date DATE NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_installment BOOLEAN DEFAULT FALSE, installment_id INTEGER, FOREIGN KEY (user_id) REFERENCES users (user_id))',
+                         'id, user_id, to_cents(amount), description, category, date, created_at, is_installment, installment_id'),
+            'installments': ('CREATE TABLE installments_new (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, total_amount_cents INTEGER NOT NULL, description TEXT NOT NULL, category TEXT NOT NULL, total_installments INTEGER NOT NULL, start_date DATE NOT NULL, FOREIGN KEY (user_id) REFERENCES users (user_id))',
+                             'id, user_id, to_cents(total_amount), description, category, total_installments, start_date'),
+            'recurring_expenses': ('CREATE TABLE recurring_expenses_new (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, description TEXT NOT NULL, amount_cents INTEGER NOT NULL, category TEXT NOT NULL, day_of_month INTEGER NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users (user_id), UNIQUE(user_id, description))',
+                                   'id, user_id, description, to_cents(amount), category, day_of_month, created_at'),
+            'shared_bills': ('CREATE TABLE shared_bills_new (id INTEGER PRIMARY KEY AUTOINCREMENT, creator_user_id INTEGER NOT NULL, creator_username TEXT, group_chat_id INTEGER NOT NULL, summary_message_id INTEGER, description TEXT NOT NULL, total_amount_cents INTEGER NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, status TEXT DEFAULT "open")',
+                             'id, creator_user_id, creator_username, group_chat_id, summary_message_id, description, to_cents(total_amount), created_at, status'),
+            'bill_participants': ('CREATE TABLE bill_participants_new (id INTEGER PRIMARY KEY AUTOINCREMENT, bill_id INTEGER NOT NULL, participant_user_id INTEGER, participant_username TEXT NOT NULL, amount_due_cents INTEGER NOT NULL, status TEXT DEFAULT "pending", FOREIGN KEY (bill_id) REFERENCES shared_bills (id) ON DELETE CASCADE)',
+                                  'id, bill_id, participant_user_id, participant_username, to_cents(amount_due), status'),
+        }
+        for table, (create_sql, select_columns) in rebuilds.items():
+            indexes = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)).fetchall()
+            cursor.execute(create_sql)
+            cursor.execute(f'INSERT INTO {table}_new SELECT {select_columns} FROM {table}')
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+            for index in indexes: cursor.execute(index[0])
+
+    def _migrate_v4(self, cursor: sqlite3.Cursor):
+        # Totais mensais por categoria mantidos por triggers: resumos e o radar leem O(meses) linhas em vez de O(gastos).
+        cursor.execute('CREATE TABLE IF NOT EXISTS monthly_category_totals (user_id INTEGER NOT NULL, year_month TEXT NOT NULL, category TEXT NOT NULL, total_cents INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (user_id, year_month, category))')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_monthly_totals_user_category ON monthly_category_totals (user_id, category, year_month)')
+        add = "INSERT INTO monthly_category_totals (user_id, year_month, category, total_cents, count) VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.category, NEW.amount_cents, 1) ON CONFLICT (user_id, year_month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;"
+        remove = ("UPDATE monthly_category_totals SET total_cents = total_cents - OLD.amount_cents, count = count - 1 WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7) AND category = OLD.category; "
+                  "DELETE FROM monthly_category_totals WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7) AND category = OLD.category AND count <= 0;")
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_expenses_insert_totals AFTER INSERT ON expenses BEGIN {add} END')
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_expenses_delete_totals AFTER DELETE ON expenses BEGIN {remove} END')
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS trg_expenses_update_totals AFTER UPDATE OF user_id, amount_cents, category, date ON expenses BEGIN {remove} {add} END')
+        self.rebuild_monthly_totals(cursor, source='expenses')  # nas migrações o arquivo morto ainda não está anexado
+
+    def rebuild_monthly_totals(self, cursor: sqlite3.Cursor = None, source: str = 'all_expenses') -> int:
+        # Backfill completo. Dentro de uma migração usa o cursor (e a transação) dela; sozinho, faz seu próprio commit.
+        own_transaction = cursor is None; cursor = cursor or self.conn.cursor()
+        cursor.execute('DELETE FROM monthly_category_totals')
+        cursor.execute(f"INSERT INTO monthly_category_totals (user_id, year_month, category, total_cents, count) SELECT user_id, substr(date, 1, 7), category, SUM(amount_cents), COUNT(*) FROM {source} GROUP BY user_id, substr(date, 1, 7), category")
+        rows = cursor.rowcount
+        if own_transaction: self.conn.commit()
+        return rows
+
+    def verify_monthly_totals(self) -> list:
+        # Compara a tabela de totais com a agregação completa dos gastos (inclusive os arquivados); devolve as linhas divergentes.
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            WITH fresh AS (SELECT user_id, substr(date, 1, 7) AS year_month, category, SUM(amount_cents) AS total_cents, COUNT(*) AS count FROM all_expenses GROUP BY 1, 2, 3)
+            SELECT f.user_id, f.year_month, f.category, f.total_cents AS expected, m.total_cents AS stored FROM fresh f
+                LEFT JOIN monthly_category_totals m ON m.user_id = f.user_id AND m.year_month = f.year_month AND m.category = f.category
+                WHERE m.total_cents IS NOT f.total_cents OR m.count IS NOT f.count
+            UNION ALL
+            SELECT m.user_id, m.year_month, m.category, NULL, m.total_cents FROM monthly_category_totals m
+                WHERE NOT EXISTS (SELECT 1 FROM fresh f WHERE f.user_id = m.user_id AND f.year_month = m.year_month AND f.category = m.category)
+        """)
+        return cursor.fetchall()
+
+    def _migrate_v5(self, cursor: sqlite3.Cursor):
+        # Estado de conversa (user_data do PTB) e confirmações pendentes saem da memória do processo.
+        cursor.execute('CREATE TABLE IF NOT EXISTS conversation_state (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS pending_actions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL, expires_at REAL NOT NULL)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_actions_expires ON pending_actions (expires_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_actions_user ON pending_actions (user_id)')
+
+    def _migrate_v6(self, cursor: sqlite3.Cursor):
+        # Registro de execuções do scheduler: rodar de novo no mesmo dia não refaz o trabalho.
+        cursor.execute('CREATE TABLE IF NOT EXISTS scheduler_runs (task TEXT NOT NULL, run_date DATE NOT NULL, rows_affected INTEGER NOT NULL, completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (task, run_date))')
+
+    def _migrate_v7(self, cursor: sqlite3.Cursor):
+        # Fila de saída de notificações: sobrevive a reinícios e é consumida por qualquer instância.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS outbound_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, text TEXT NOT NULL, parse_mode TEXT, reply_markup TEXT,
+                          fallback_chat_id INTEGER, fallback_text TEXT, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL)''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbound_messages_due ON outbound_messages (status, next_attempt_at)')
+
+    def _migrate_v8(self, cursor: sqlite3.Cursor):
+        # Parcelamento vira agenda: só as parcelas vencidas existem em expenses. materialized_count diz quantas já
+        # foram lançadas e next_due_date (NULL quando todas foram) é o que o scheduler consulta.
+        cursor.execute('ALTER TABLE installments ADD COLUMN materialized_count INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('ALTER TABLE installments ADD COLUMN next_due_date DATE')
+        today = date.today()
+        cursor.execute("DELETE FROM expenses WHERE installment_id IS NOT NULL AND date > ?", (today,))
+        rows = cursor.execute("SELECT i.id, i.start_date, i.total_installments, (SELECT COUNT(*) FROM expenses e WHERE e.installment_id = i.id) AS materialized FROM installments i").fetchall()
+        cursor.executemany("UPDATE installments SET materialized_count = ?, next_due_date = ? WHERE id = ?",
+                           [(row[3], add_months(date.fromisoformat(row[1]), row[3]) if row[3] < row[2] else None, row[0]) for row in rows])
+        # As parcelas antigas foram gravadas com total/parcelas arredondado (100,00 em 3x somava 99,99); passam a ter os
+        # valores de split_cents, os mesmos das que o scheduler lançar daqui em diante. A parcela sai do mês da data.
+        legacy = cursor.execute("SELECT e.id, e.date, i.start_date, i.total_amount_cents, i.total_installments FROM expenses e JOIN installments i ON i.id = e.installment_id").fetchall(); fixed = []
+        for expense_id, day, start, total_cents, count in legacy:
+            number = month_index(date.fromisoformat(str(day)[:10])) - month_index(date.fromisoformat(str(start)[:10]))
+            if 0 <= number < count: fixed.append((split_cents(total_cents, count)[number], expense_id))
+        cursor.executemany("UPDATE expenses SET amount_cents = ? WHERE id = ? AND amount_cents != ?", [(cents, expense_id, cents) for cents, expense_id in fixed])
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_installments_next_due ON installments (next_due_date) WHERE next_due_date IS NOT NULL')
+
+    def _migrate_v9(self, cursor: sqlite3.Cursor):
+        # Índice de recorrência: por (usuário, impressão digital, faixa de valor) guarda os dois últimos meses vistos
+        # (índice ano*12+mês), quantos meses distintos e o último gasto. Detectar padrão vira uma leitura por chave.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS recurrence_index (user_id INTEGER NOT NULL, fingerprint TEXT NOT NULL, amount_bucket INTEGER NOT NULL, description TEXT NOT NULL, amount_cents INTEGER NOT NULL,
+                          category TEXT NOT NULL, day_of_month INTEGER NOT NULL, last_month INTEGER NOT NULL, prev_month INTEGER, month_count INTEGER NOT NULL, subscribed INTEGER NOT NULL DEFAULT 0, proposed_month INTEGER,
+                          PRIMARY KEY (user_id, fingerprint, amount_bucket))''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recurrence_index_last_month ON recurrence_index (last_month)')
+        self.rebuild_recurrence_index(cursor)
+
+    def _migrate_v10(self, cursor: sqlite3.Cursor):
+        # /rachar resolve as menções (@fulano, sem distinção de maiúsculas) num único IN (...) sobre este índice.
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (username COLLATE NOCASE)')
+
+    def _migrate_v11(self, cursor: sqlite3.Cursor):
+        # A movimentação para o arquivo morto busca os gastos mais antigos de todos os usuários.
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date)')
+
     def populate_default_categories(self):
         with self.conn:
             cursor = self.conn.cursor(); cursor.execute("SELECT COUNT(*) FROM categories")
@@ -90,68 +835,209 @@ class SavieBot:
         self.conn.commit()
 
     def register_user(self, user_id: int, username: str, first_name: str):
+        # Upsert único; o WHERE faz o UPDATE não tocar na linha quando nada mudou.
         with self.conn:
-            self.conn.execute('INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)', (user_id, username, first_name))
-            self.conn.execute('UPDATE users SET username = ?, first_name = ? WHERE user_id = ?', (username, first_name, user_id))
-        self.conn.commit()
+            changed = self.conn.execute('INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, first_name = excluded.first_name '
+                                        'WHERE users.username IS NOT excluded.username OR users.first_name IS NOT excluded.first_name', (user_id, username, first_name)).rowcount
+        if changed: self.profiles.invalidate(user_id)
 
     def get_user_profile(self, user_id: int):
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT full_name, email FROM users WHERE user_id = ?", (user_id,))
-            return cursor.fetchone()
+        return self.profiles.get(user_id) or self.load_user_profile(user_id)
+
+    def load_user_profile(self, user_id: int):
+        generation = self.profiles.generation
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT username, first_name, full_name, email FROM users WHERE user_id = ?", (user_id,))
+        profile = cursor.fetchone()
+        # Só perfis completos entram no cache: cadastro incompleto ainda vai mudar (e pode mudar em outra instância).
+        if profile and profile['full_name'] and profile['email']: self.profiles.put(user_id, profile, generation)
+        return profile
 
     def update_user_profile(self, user_id: int, full_name: str, email: str):
         with self.conn:
             self.conn.execute("UPDATE users SET full_name = ?, email = ? WHERE user_id = ?", (full_name, email, user_id))
-            self.conn.commit()
-
-    def parse_expense_text(self, text: str) -> dict | None:
-        match = re.search(r'(\d[\d.,]*)', text);
-        if not match: return None
-        amount_str = match.group(1).replace('.', '').replace(',', '.');
-        try: amount = Decimal(amount_str)
-        except InvalidOperation: return None
-        desc = re.sub(r'(\d[\d.,]*)', '', text, 1); desc = re.sub(r'\b(gastei|comprei|paguei|valor|preço|reais|r\$)\b', '', desc, flags=re.I);
-        desc = ' '.join(desc.split()).strip().capitalize(); return {'amount': amount, 'description': desc or "Gasto não especificado"}
-
-    def categorize_expense(self, description: str) -> str:
-        desc_lower = description.lower(); cursor = self.conn.cursor()
-        cursor.execute('SELECT name, keywords, emoji FROM categories')
-        all_categories = cursor.fetchall()
-        for cat in all_categories:
-            if any(keyword.strip() in desc_lower for keyword in cat['keywords'].split(',')): logger.info(f"Gasto '{description}' categorizado por palavra-chave como '{cat['name']}'."); return f"{cat['emoji']} {cat['name']}"
-        if GOOGLE_API_KEY:
-            logger.info(f"Nenhuma palavra-chave encontrada para '{description}'. Usando IA...")
-            category_names = [cat['name'] for cat in all_categories]
-            try:
-                prompt = f"Você é um assistente de finanças. Sua tarefa é categorizar a despesa em uma das seguintes categorias: {', '.join(category_names)}. Responda APENAS com um objeto JSON no formato: {{\"categoria\": \"Nome da Categoria\"}}\n\nDescrição da despesa: \"{description}\""
-                model = genai.GenerativeModel('gemini-1.5-flash-latest'); response = model.generate_content(prompt); json_text = response.text.strip().replace("```json", "").replace("```", ""); ai_result = json.loads(json_text)
-                ai_category_name = ai_result.get("categoria")
-                for cat in all_categories:
-                    if cat['name'] == ai_category_name: logger.info(f"IA categorizou '{description}' como '{ai_category_name}'."); return f"{cat['emoji']} {cat['name']}"
-            except Exception as e: logger.error(f"Erro ao categorizar com IA: {e}")
-        logger.warning(f"Não foi possível categorizar '{description}'. Usando 'Outros'."); return "📦 Outros"
+        self.profiles.invalidate(user_id)
+
+    def get_keyword_catalog_version(self) -> int:
+        cursor = self.conn.cursor(); cursor.execute("SELECT version FROM catalog_versions WHERE name = 'keywords'"); return cursor.fetchone()[0]
+
+    def get_keyword_catalog(self) -> tuple:
+        cursor = self.conn.cursor(); cursor.execute("SELECT version FROM catalog_versions WHERE name = 'keywords'"); version = cursor.fetchone()[0]
+        cursor.execute('SELECT name, keywords, emoji FROM categories ORDER BY id'); categories = cursor.fetchall()
+        cursor.execute('SELECT user_id, keyword, category FROM user_keywords'); learned = cursor.fetchall()
+        return categories, learned, version
+
+    def add_user_keyword(self, user_id: int, keyword: str, category: str) -> int:
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO user_keywords (user_id, keyword, category) VALUES (?, ?, ?)", (user_id, keyword, category))
+            return self.conn.execute("SELECT version FROM catalog_versions WHERE name = 'keywords'").fetchone()[0]
+
+    def get_categories(self) -> list:
+        cursor = self.conn.cursor(); cursor.execute('SELECT name, emoji FROM categories ORDER BY id'); return cursor.fetchall()
+
+    def get_cached_category(self, description_key: str, ttl: float = CATEGORY_CACHE_TTL) -> str | None:
+        cursor = self.conn.cursor(); cursor.execute("SELECT category FROM category_cache WHERE description_key = ? AND created_at >= ?", (description_key, time.time() - ttl))
+        row = cursor.fetchone(); return row['category'] if row else None
+
+    def store_cached_categories(self, entries: list, touched_keys: list = (), ttl: float = CATEGORY_CACHE_TTL, max_entries: int = CATEGORY_CACHE_MAX):
+        # Os "touches" dos acertos são aplicados aqui, em lote: o LRU só precisa estar correto na hora de despejar.
+        now = time.time()
+        with self.conn:
+            self.conn.executemany("UPDATE category_cache SET last_used = ? WHERE description_key = ?", [(now, key) for key in touched_keys])
+            self.conn.executemany("INSERT OR REPLACE INTO category_cache (description_key, category, created_at, last_used) VALUES (?, ?, ?, ?)", [(key, cat, now, now) for key, cat in entries])
+            self.conn.execute("DELETE FROM category_cache WHERE created_at < ?", (now - ttl,))
+            self.conn.execute("DELETE FROM category_cache WHERE description_key IN (SELECT description_key FROM category_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (max_entries,))
+
+    def add_expense(self, user_id: int, amount: Decimal, desc: str, cat: str, p_date: date, inst_id: int = None, amount_cents: int = None):
+        if amount_cents is None: amount_cents = to_cents(amount)
+        with self.conn:
+            self.conn.execute('INSERT INTO expenses (user_id, amount_cents, description, category, date, is_installment, installment_id) VALUES (?, ?, ?, ?, ?, ?, ?)',(user_id, amount_cents, desc, cat, p_date, inst_id is not None, inst_id))
+            if inst_id is None: self.index_recurrence([(user_id, desc, amount_cents, cat, p_date)])
 
-    def add_expense(self, user_id: int, amount: Decimal, desc: str, cat: str, p_date: date, inst_id: int = None):
-        with self.conn: self.conn.execute('INSERT INTO expenses (user_id, amount, description, category, date, is_installment, installment_id) VALUES (?, ?, ?, ?, ?, ?, ?)',(user_id, str(amount), desc, cat, p_date, inst_id is not None, inst_id)); self.conn.commit()
+    # Upsert de um gasto no índice de recorrência. No DO UPDATE as colunas ainda têm os valores antigos; gastos
+    # retroativos só contam se caírem num mês novo, e exclusões não são descontadas (o índice é uma heurística).
+    RECURRENCE_UPSERT = """
+        INSERT INTO recurrence_index (user_id, fingerprint, amount_bucket, description, amount_cents, category, day_of_month, last_month, prev_month, month_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, 1)
+        ON CONFLICT (user_id, fingerprint, amount_bucket) DO UPDATE SET
+            prev_month = CASE WHEN excluded.last_month > last_month THEN last_month
+                              WHEN excluded.last_month < last_month AND excluded.last_month > IFNULL(prev_month, -1) THEN excluded.last_month ELSE prev_month END,
+            month_count = month_count + (excluded.last_month NOT IN (last_month, IFNULL(prev_month, -1))),
+            description = IIF(excluded.last_month >= last_month, excluded.description, description),
+            amount_cents = IIF(excluded.last_month >= last_month, excluded.amount_cents, amount_cents),
+            category = IIF(excluded.last_month >= last_month, excluded.category, category),
+            day_of_month = IIF(excluded.last_month >= last_month, excluded.day_of_month, day_of_month),
+            last_month = MAX(last_month, excluded.last_month)
+    """
+
+    def index_recurrence(self, expenses: list[tuple]):
+        # expenses: (user_id, description, amount_cents, category, date). Chamar dentro da transação que insere os gastos.
+        self.conn.executemany(self.RECURRENCE_UPSERT, [self.recurrence_row(*expense) for expense in expenses])
+
+    @staticmethod
+    def recurrence_row(user_id: int, desc: str, cents: int, cat: str, day) -> tuple:
+        # Parâmetros de RECURRENCE_UPSERT; separado para que a importação de extratos os calcule fora do escritor.
+        day = day if isinstance(day, date) else date.fromisoformat(str(day))
+        return (user_id, description_fingerprint(desc), amount_bucket(cents), desc, cents, cat, day.day, month_index(day))
+
+    def rebuild_recurrence_index(self, cursor: sqlite3.Cursor = None) -> int:
+        # Reconstrói a partir de expenses em ordem de data (cursor em blocos) e marca o que já virou assinatura.
+        owns_transaction = cursor is None; cursor = cursor or self.conn.cursor(); rows = 0
+        cursor.execute("DELETE FROM recurrence_index")
+        source = self.conn.execute("SELECT user_id, description, amount_cents, category, date FROM expenses WHERE installment_id IS NULL ORDER BY date, id")
+        while chunk := source.fetchmany(EXPORT_CHUNK_ROWS): self.index_recurrence([tuple(row) for row in chunk]); rows += len(chunk)
+        subscribed = self.conn.execute("SELECT user_id, description FROM recurring_expenses").fetchall()
+        cursor.executemany("UPDATE recurrence_index SET subscribed = 1 WHERE user_id = ? AND fingerprint = ?", [(row[0], description_fingerprint(row[1])) for row in subscribed])
+        if owns_transaction: self.conn.commit()
+        return rows
+
+    def scan_statement(self, user_id: int, path: str, matcher: "KeywordMatcher", fallback: str, spill: str | None = None) -> dict:
+        """Lê, deduplica e categoriza um extrato numa conexão de leitura: a prévia, e com `spill` as linhas prontas (já com os
+        parâmetros do índice de recorrência) num arquivo, um bloco por vez, para insert_statement, a única parte no escritor."""
+        # Em blocos de EXPORT_CHUNK_ROWS: duplicados saem pela chave (data, centavos, descrição normalizada) contra os gastos
+        # já gravados naqueles dias, inclusive no arquivo morto (contados, para que duas compras iguais no mesmo dia continuem
+        # sendo duas); categoria pelo matcher e, no que sobrar, pelo cache da IA numa consulta por bloco.
+        stats = {'invalid': 0, 'credits': 0, 'duplicates': 0, 'count': 0, 'total_cents': 0, 'first': None, 'last': None, 'categories': {}}
+        existing: dict[str, Counter] = {}; rows = statement_expenses(path, stats)
+        with open(spill, 'wb') if spill else contextlib.nullcontext() as handle:
+            self._scan_chunks(user_id, rows, matcher, fallback, stats, existing, handle)
+        return stats
+
+    def _scan_chunks(self, user_id: int, rows, matcher: "KeywordMatcher", fallback: str, stats: dict, existing: dict[str, Counter], handle):
+        while chunk := list(islice(rows, EXPORT_CHUNK_ROWS)):
+            self._existing_statement_keys(user_id, {day.isoformat() for day, _, _ in chunk}, existing); fresh = []
+            for day, cents, description in chunk:
+                seen, key = existing[day.isoformat()], normalize_text(description)
+                if seen[(cents, key)]: seen[(cents, key)] -= 1; stats['duplicates'] += 1
+                else: fresh.append((day.isoformat(), cents, description, key, matcher.match(description, user_id, key)))
+            unmatched = list({key for *_, key, category in fresh if category is None})
+            cached = dict(self.conn.execute(f"SELECT description_key, category FROM category_cache WHERE description_key IN ({','.join('?' * len(unmatched))}) AND created_at >= ?",
+                                            (*unmatched, time.time() - CATEGORY_CACHE_TTL)).fetchall()) if unmatched else {}
+            fresh = [(day, cents, description, key, category or cached.get(key, fallback)) for day, cents, description, key, category in fresh]
+            for day, cents, _, _, category in fresh:
+                totals = stats['categories'].setdefault(category, [0, 0]); totals[0] += 1; totals[1] += cents
+                stats['first'], stats['last'] = min(stats['first'] or day, day), max(stats['last'] or day, day)
+            stats['count'] += len(fresh); stats['total_cents'] += sum(row[1] for row in fresh)
+            if handle and fresh: pickle.dump([(*row, self.recurrence_row(user_id, row[2], row[1], row[4], row[0])) for row in fresh], handle, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _spilled_chunks(handle):
+        # Os blocos que _scan_chunks gravou com pickle.dump, um depois do outro, até o fim do arquivo.
+        while handle.peek(1): yield pickle.load(handle)
+
+    def _existing_statement_keys(self, user_id: int, days: set[str], existing: dict[str, Counter]):
+        # Conta (centavos, descrição normalizada) dos gastos já gravados nos dias ainda não vistos, em `existing`.
+        days = sorted(days - existing.keys())
+        for day in days: existing[day] = Counter()
+        if days:
+            for row in self.conn.execute(f"SELECT date, amount_cents, description FROM all_expenses WHERE user_id = ? AND date IN ({','.join('?' * len(days))})", (user_id, *days)):
+                existing[str(row[0])[:10]][(row[1], normalize_text(row[2]))] += 1
+
+    def insert_statement(self, user_id: int, spill: str, stats: dict) -> dict:
+        """Grava numa transação as linhas que scan_statement deixou em `spill` (dia, centavos, descrição, chave, categoria,
+        recorrência), lidas um bloco por vez. Só refaz a deduplicação, contra o que foi gravado entre a prévia e a
+        confirmação; `stats` sai com o que entrou de fato."""
+        existing: dict[str, Counter] = {}
+        with self.conn, open(spill, 'rb') as handle:
+            for chunk in self._spilled_chunks(handle):
+                self._existing_statement_keys(user_id, {row[0] for row in chunk}, existing); fresh = []
+                for day, cents, description, key, category, recurrence in chunk:
+                    seen = existing[day]
+                    if not seen[(cents, key)]: fresh.append((day, cents, description, category, recurrence)); continue
+                    seen[(cents, key)] -= 1; totals = stats['categories'][category]; totals[0] -= 1; totals[1] -= cents
+                    stats['duplicates'] += 1; stats['count'] -= 1; stats['total_cents'] -= cents
+                    if not totals[0]: del stats['categories'][category]
+                self.conn.executemany('INSERT INTO expenses (user_id, amount_cents, description, category, date, is_installment, installment_id) VALUES (?, ?, ?, ?, ?, 0, NULL)',
+                                      [(user_id, cents, description, category, day) for day, cents, description, category, _ in fresh])
+                self.conn.executemany(self.RECURRENCE_UPSERT, [row[4] for row in fresh])
+        return stats
 
     def add_installment_purchase(self, user_id: int, total_amount: Decimal, desc: str, cat: str, count: int, start_date: date):
-        inst_amount = total_amount / Decimal(count)
+        # Grava só a agenda; as parcelas já vencidas (normalmente a primeira) são lançadas na mesma transação.
         with self.conn:
-            cursor = self.conn.cursor(); cursor.execute('INSERT INTO installments (user_id, total_amount, description, category, total_installments, start_date) VALUES (?, ?, ?, ?, ?, ?)',(user_id, str(total_amount), desc, cat, count, start_date)); installment_id = cursor.lastrowid
-            for i in range(count): self.add_expense(user_id, inst_amount, f"{desc} ({i+1}/{count})", cat, add_months(start_date, i), installment_id)
-        self.conn.commit()
+            installment_id = self.conn.execute('INSERT INTO installments (user_id, total_amount_cents, description, category, total_installments, start_date, next_due_date) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                               (user_id, to_cents(total_amount), desc, cat, count, start_date, start_date)).lastrowid
+            self._materialize_installments("id = ?", (installment_id,), date.today())
+        return installment_id
+
+    def materialize_due_installments(self, today: date = None) -> int:
+        today = today or date.today()
+        with self.conn: inserted = self._materialize_installments("next_due_date <= ?", (today,), today)
+        if inserted: logger.info(f"Scheduler: {inserted} parcelas lançadas para {today}.")
+        return inserted
+
+    def _materialize_installments(self, where: str, params: tuple, today: date) -> int:
+        # Lança as parcelas vencidas e ainda não lançadas num único executemany e avança a agenda. Chamar dentro de transação.
+        expenses, progress = [], []
+        for row in self.conn.execute(f"SELECT id, user_id, total_amount_cents, description, category, total_installments, start_date, materialized_count FROM installments WHERE {where}", params).fetchall():
+            start, count = date.fromisoformat(str(row['start_date'])), row['total_installments']; due = max(installments_due(start, count, today), row['materialized_count'])
+            parts = split_cents(row['total_amount_cents'], count)
+            expenses += [(row['user_id'], parts[i], f"{row['description']} ({i+1}/{count})", row['category'], add_months(start, i), True, row['id']) for i in range(row['materialized_count'], due)]
+            progress.append((due, add_months(start, due) if due < count else None, row['id']))
+        self.conn.executemany('INSERT INTO expenses (user_id, amount_cents, description, category, date, is_installment, installment_id) VALUES (?, ?, ?, ?, ?, ?, ?)', expenses)
+        self.conn.executemany('UPDATE installments SET materialized_count = ?, next_due_date = ? WHERE id = ?', progress)
+        return len(expenses)
 
     def get_monthly_summary(self, user_id: int):
-        first_day = date.today().replace(day=1); cursor = self.conn.cursor()
-        cursor.execute("SELECT SUM(amount) FROM expenses WHERE user_id = ? AND date >= ?", (user_id, first_day)); total = cursor.fetchone()[0]
+        year_month = date.today().strftime('%Y-%m'); cursor = self.conn.cursor()
+        cursor.execute("SELECT category, total_cents FROM monthly_category_totals WHERE user_id = ? AND year_month = ? ORDER BY total_cents DESC", (user_id, year_month))
+        by_category = [{'category': row['category'], 'cat_total': from_cents(row['total_cents'])} for row in cursor.fetchall()]
+        total = sum(row['cat_total'] for row in by_category)
         if not total: return None
-        cursor.execute("SELECT category, SUM(amount) as cat_total FROM expenses WHERE user_id = ? AND date >= ? GROUP BY category ORDER BY cat_total DESC", (user_id, first_day)); by_category = cursor.fetchall()
-        return {'total': Decimal(total), 'by_category': by_category}
+        return {'total': total, 'by_category': by_category}
+
+    def get_monthly_series(self, user_id: int, months: int = TREND_MONTHS, today: date = None) -> tuple[list[str], list[str], array]:
+        """Totais dos últimos `months` meses (o atual por último) numa matriz categoria × mês de centavos, em linhas de `months`."""
+        first = add_months((today or date.today()).replace(day=1), 1 - months); keys = [add_months(first, i).strftime('%Y-%m') for i in range(months)]
+        rows = self.conn.execute("SELECT category, year_month, total_cents FROM monthly_category_totals WHERE user_id = ? AND year_month >= ?", (user_id, keys[0])).fetchall()
+        column = {key: i for i, key in enumerate(keys)}; line = {category: i for i, category in enumerate(dict.fromkeys(row[0] for row in rows))}
+        grid = array('q', bytes(8 * months * len(line)))
+        for category, year_month, cents in rows:
+            if year_month in column: grid[line[category] * months + column[year_month]] = cents
+        return keys, list(line), grid
 
     def get_last_expense(self, user_id: int):
-        cursor = self.conn.cursor(); query = "SELECT id, description, amount, category, date FROM expenses WHERE user_id = ? ORDER BY id DESC LIMIT 1"
+        cursor = self.conn.cursor(); query = "SELECT id, description, amount_cents, category, date FROM expenses WHERE user_id = ? ORDER BY id DESC LIMIT 1"
         cursor.execute(query, (user_id,)); return cursor.fetchone()
 
     def delete_expense_by_id(self, expense_id: int, user_id: int):
@@ -159,27 +1045,71 @@ class SavieBot:
 
     def delete_all_user_data(self, user_id: int):
         with self.conn:
-            self.conn.execute("DELETE FROM installments WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM recurring_expenses WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM challenges WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM expenses WHERE user_id = ?", (user_id,)); self.conn.commit()
+            self.conn.execute("DELETE FROM installments WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM recurring_expenses WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM challenges WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM expenses WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM archive.expenses WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM monthly_category_totals WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM user_keywords WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM pending_actions WHERE user_id = ?", (user_id,)); self.conn.execute("DELETE FROM recurrence_index WHERE user_id = ?", (user_id,)); self.conn.commit()
 
     def get_spending_analytics(self, user_id: int, category: str):
-        cursor = self.conn.cursor(); query_current = "SELECT SUM(amount) FROM expenses WHERE user_id = ? AND category = ? AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now', 'localtime')"; cursor.execute(query_current, (user_id, category)); current_month_total = cursor.fetchone()[0] or 0; query_avg = "SELECT AVG(monthly_total) FROM (SELECT SUM(amount) as monthly_total FROM expenses WHERE user_id = ? AND category = ? AND strftime('%Y-%m', date) != strftime('%Y-%m', 'now', 'localtime') GROUP BY strftime('%Y-%m', date))"; cursor.execute(query_avg, (user_id, category)); historical_avg = cursor.fetchone()[0]
-        return {"current_total": Decimal(current_month_total), "historical_avg": Decimal(historical_avg) if historical_avg else Decimal(0)}
+        year_month = date.today().strftime('%Y-%m'); cursor = self.conn.cursor()
+        cursor.execute("SELECT total_cents FROM monthly_category_totals WHERE user_id = ? AND year_month = ? AND category = ?", (user_id, year_month, category)); row = cursor.fetchone(); current_month_total = row[0] if row else 0
+        cursor.execute("SELECT AVG(total_cents) FROM monthly_category_totals WHERE user_id = ? AND category = ? AND year_month < ?", (user_id, category, year_month)); historical_avg = cursor.fetchone()[0]
+        return {"current_total": from_cents(current_month_total), "historical_avg": from_cents(historical_avg).quantize(Decimal('0.01')) if historical_avg else Decimal(0)}
+
+    @staticmethod
+    def _is_recurring(rows: list, current: int) -> bool:
+        # rows: faixas ativas (últimos três meses) de uma impressão digital. Assinatura = valor concentrado em poucas faixas
+        # vizinhas e visto em dois meses distintos; descrições espalhadas por muitas faixas (mercado, uber) são gasto comum.
+        if not rows or len(rows) > RECURRENCE_MAX_BUCKETS or any(row['subscribed'] for row in rows): return False
+        if max(row['amount_bucket'] for row in rows) - min(row['amount_bucket'] for row in rows) > 2: return False
+        return len({month for row in rows for month in (row['last_month'], row['prev_month']) if month is not None and month >= current - 2}) >= 2
 
-    def find_recurring_pattern(self, user_id: int, description: str, amount: Decimal):
-        cursor = self.conn.cursor(); amount_min = amount * Decimal('0.95'); amount_max = amount * Decimal('1.05'); cursor.execute("SELECT 1 FROM recurring_expenses WHERE user_id = ? AND description = ?", (user_id, description))
-        if cursor.fetchone(): return False
-        query = "SELECT COUNT(DISTINCT strftime('%Y-%m', date)) FROM expenses WHERE user_id = ? AND description = ? AND amount BETWEEN ? AND ? AND date >= date('now', '-3 months', 'localtime')"
-        cursor.execute(query, (user_id, description, str(amount_min), str(amount_max))); months_count = cursor.fetchone()[0]
-        return months_count >= 2
+    def find_recurring_pattern(self, user_id: int, description: str, amount: Decimal, today: date = None) -> bool:
+        # Leitura por prefixo da chave (usuário, impressão digital); o valor atual precisa cair perto das faixas vistas.
+        cents = to_cents(amount); bucket = amount_bucket(cents); current = month_index(today or date.today())
+        cursor = self.conn.cursor(); cursor.execute("SELECT amount_bucket, last_month, prev_month, subscribed FROM recurrence_index WHERE user_id = ? AND fingerprint = ? AND last_month >= ?",
+                                                    (user_id, description_fingerprint(description), current - 2))
+        rows = cursor.fetchall()
+        return any(abs(row['amount_bucket'] - bucket) <= 1 for row in rows) and self._is_recurring(rows, current)
 
     def add_recurring_expense(self, user_id: int, day_of_month: int, pending_expense: dict):
-        with self.conn: self.conn.execute("INSERT OR IGNORE INTO recurring_expenses (user_id, description, amount, category, day_of_month) VALUES (?, ?, ?, ?, ?)", (user_id, pending_expense['desc'], str(pending_expense['amount']), pending_expense['category'], day_of_month)); self.conn.commit()
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO recurring_expenses (user_id, description, amount_cents, category, day_of_month) VALUES (?, ?, ?, ?, ?)", (user_id, pending_expense['desc'], to_cents(pending_expense['amount']), pending_expense['category'], day_of_month))
+            self.conn.execute("UPDATE recurrence_index SET subscribed = 1 WHERE user_id = ? AND fingerprint = ?", (user_id, description_fingerprint(pending_expense['desc'])))
 
-    def process_due_subscriptions(self):
-        today = date.today(); cursor = self.conn.cursor(); query_due = "SELECT * FROM recurring_expenses WHERE day_of_month = ?"; cursor.execute(query_due, (today.day,))
-        for sub in cursor.fetchall():
-            user_id, desc, amount, category = sub['user_id'], sub['description'], sub['amount'], sub['category']; query_exists = "SELECT 1 FROM expenses WHERE user_id = ? AND description = ? AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now', 'localtime')"; cursor.execute(query_exists, (user_id, desc))
-            if not cursor.fetchone(): logger.info(f"Lançando assinatura vencida para user {user_id}: {desc}"); self.add_expense(user_id, Decimal(amount), desc, category, today)
+    def propose_subscriptions(self, today: date = None, min_months: int = RECURRENCE_MIN_MONTHS, ttl: float = SUGGESTION_TTL) -> list:
+        # Job em lote para todos os usuários: lê as faixas ativas em ordem de chave, agrupa por impressão digital e propõe as
+        # recorrentes vistas em min_months meses, com gasto neste mês ou no anterior e ainda não propostas neste mês.
+        # As confirmações pendentes são criadas na mesma transação.
+        current = month_index(today or date.today()); proposals = []
+        with self.conn:
+            rows = self.conn.execute("SELECT user_id, fingerprint, amount_bucket, description, amount_cents, category, day_of_month, last_month, prev_month, month_count, subscribed, proposed_month "
+                                     "FROM recurrence_index WHERE last_month >= ? ORDER BY user_id, fingerprint", (current - 2,)).fetchall()
+            expires_at = time.time() + ttl
+            for (user_id, fingerprint), group in groupby(rows, key=lambda row: (row['user_id'], row['fingerprint'])):
+                group = list(group); latest = max(group, key=lambda row: row['last_month'])
+                if latest['last_month'] < current - 1 or sum(row['month_count'] for row in group) < min_months or any((row['proposed_month'] or -1) >= current for row in group): continue
+                if not self._is_recurring(group, current): continue
+                payload = {'desc': latest['description'], 'amount': from_cents(latest['amount_cents']), 'category': latest['category'], 'day_of_month': latest['day_of_month']}
+                pending_id = self.conn.execute("INSERT INTO pending_actions (user_id, kind, payload, expires_at) VALUES (?, ?, ?, ?)", (user_id, CALLBACK_ADD_RECURRING, encode_state(payload), expires_at)).lastrowid
+                proposals.append({'user_id': user_id, 'pending_id': pending_id, 'fingerprint': fingerprint, **payload})
+            self.conn.executemany("UPDATE recurrence_index SET proposed_month = ? WHERE user_id = ? AND fingerprint = ?", [(current, p['user_id'], p['fingerprint']) for p in proposals])
+        if proposals: logger.info(f"Scheduler: {len(proposals)} assinaturas propostas.")
+        return proposals
+
+    def process_due_subscriptions(self, today: date = None) -> int | None:
+        # Um único INSERT ... SELECT lança todas as assinaturas vencidas no mês que ainda não têm gasto, na data de
+        # vencimento (dia 31 vira o último dia em meses curtos). Devolve None se o dia já foi processado.
+        today = today or date.today(); first_day = today.replace(day=1); next_month = add_months(first_day, 1); last_day = monthrange(today.year, today.month)[1]
+        with self.conn:
+            if self.conn.execute("SELECT 1 FROM scheduler_runs WHERE task = 'subscriptions' AND run_date = ?", (today,)).fetchone(): return None
+            inserted = self.conn.execute("""
+                INSERT INTO expenses (user_id, amount_cents, description, category, date, is_installment, installment_id)
+                SELECT r.user_id, r.amount_cents, r.description, r.category, printf('%s-%02d', ?, MIN(r.day_of_month, ?)), FALSE, NULL
+                FROM recurring_expenses r
+                WHERE r.day_of_month <= ?
+                  AND NOT EXISTS (SELECT 1 FROM expenses e WHERE e.user_id = r.user_id AND e.description = r.description AND e.date >= ? AND e.date < ?)
+            """, (today.strftime('%Y-%m'), last_day, 31 if today.day == last_day else today.day, first_day, next_month)).rowcount
+            self.conn.execute("INSERT INTO scheduler_runs (task, run_date, rows_affected) VALUES ('subscriptions', ?, ?)", (today, inserted))
+        if inserted: logger.info(f"Scheduler: {inserted} assinaturas lançadas para {today}.")
+        return inserted
 
     def start_no_spend_challenge(self, user_id: int, category: str, duration_days: int):
         start_date = date.today(); end_date = start_date + timedelta(days=duration_days)
@@ -199,47 +1129,723 @@ class SavieBot:
             with self.conn: self.conn.execute(f"UPDATE challenges SET status = 'completed' WHERE id IN ({','.join('?' for _ in completed_ids)})", completed_ids); self.conn.commit()
         return completed
         
-    def get_active_installments(self, user_id: int) -> list:
-        cursor = self.conn.cursor()
-        query = """
-            SELECT i.description, i.total_amount, i.total_installments,
-                   (SELECT COUNT(*) FROM expenses WHERE installment_id = i.id) as paid_count
-            FROM installments i
-            WHERE i.user_id = ? AND
-                  (SELECT COUNT(*) FROM expenses WHERE installment_id = i.id) < i.total_installments
-            ORDER BY i.start_date DESC
-        """
-        cursor.execute(query, (user_id,))
-        return cursor.fetchall()
+    def get_active_installments(self, user_id: int, today: date = None) -> list:
+        # Pagas/restantes saem da data de início, sem contar linhas em expenses.
+        today = today or date.today(); active = []
+        cursor = self.conn.cursor(); cursor.execute("SELECT description, total_amount_cents, total_installments, start_date FROM installments WHERE user_id = ? AND next_due_date IS NOT NULL ORDER BY start_date DESC", (user_id,))
+        for row in cursor.fetchall():
+            count = row['total_installments']; paid = installments_due(date.fromisoformat(str(row['start_date'])), count, today)
+            if paid < count: active.append({'description': row['description'], 'total_amount_cents': row['total_amount_cents'], 'total_installments': count, 'paid_count': paid, 'remaining_cents': sum(split_cents(row['total_amount_cents'], count)[paid:])})
+        return active
+
+    def get_users_by_username(self, usernames: list[str]) -> dict[str, int]:
+        # Uma consulta para todas as menções; chave em minúsculas porque o Telegram não diferencia.
+        if not usernames: return {}
+        cursor = self.conn.cursor(); cursor.execute(f"SELECT user_id, username FROM users WHERE username COLLATE NOCASE IN ({','.join('?' for _ in usernames)})", list(usernames))
+        return {row['username'].lower(): row['user_id'] for row in cursor.fetchall()}
+
+    def create_shared_bill(self, creator_user_id: int, creator_username: str | None, group_chat_id: int, description: str, total_amount: Decimal, usernames: list[str]) -> int:
+        # Conta e participantes numa transação só; a parte de cada um sai do split_cents e a do criador já nasce paga.
+        shares = split_cents(to_cents(total_amount), len(usernames)); user_ids = self.get_users_by_username(usernames)
+        creator = (creator_username or '').lower()
+        with self.conn:
+            bill_id = self.conn.execute("INSERT INTO shared_bills (creator_user_id, creator_username, group_chat_id, description, total_amount_cents) VALUES (?, ?, ?, ?, ?)",
+                                        (creator_user_id, creator_username, group_chat_id, description, to_cents(total_amount))).lastrowid
+            self.conn.executemany("INSERT INTO bill_participants (bill_id, participant_user_id, participant_username, amount_due_cents, status) VALUES (?, ?, ?, ?, ?)",
+                                  [(bill_id, creator_user_id if username.lower() == creator else user_ids.get(username.lower()), username, cents, 'paid' if username.lower() == creator else 'pending')
+                                   for username, cents in zip(usernames, shares)])
+        return bill_id
+
+    def get_bill_status(self, bill_id: int) -> tuple:
+        cursor = self.conn.cursor(); cursor.execute("SELECT id, creator_user_id, creator_username, group_chat_id, summary_message_id, description, total_amount_cents, status FROM shared_bills WHERE id = ?", (bill_id,)); bill = cursor.fetchone()
+        cursor.execute("SELECT id, participant_user_id, participant_username, amount_due_cents, status FROM bill_participants WHERE bill_id = ? ORDER BY id", (bill_id,))
+        return bill, cursor.fetchall()
+
+    def update_bill_summary_message(self, bill_id: int, message_id: int):
+        with self.conn: self.conn.execute("UPDATE shared_bills SET summary_message_id = ? WHERE id = ?", (message_id, bill_id))
+
+    def mark_bill_paid(self, participant_id: int, user_id: int) -> tuple[int, bool] | None:
+        # (bill_id, mudou?) ou None se o participante não existe ou não é de quem clicou. Último pagamento fecha a conta.
+        with self.conn:
+            row = self.conn.execute("UPDATE bill_participants SET status = 'paid' WHERE id = ? AND participant_user_id = ? AND status = 'pending' RETURNING bill_id", (participant_id, user_id)).fetchone()
+            if row is None:
+                row = self.conn.execute("SELECT bill_id FROM bill_participants WHERE id = ? AND participant_user_id = ?", (participant_id, user_id)).fetchone()
+                return (row['bill_id'], False) if row else None
+            self.conn.execute("UPDATE shared_bills SET status = 'settled' WHERE id = ? AND NOT EXISTS (SELECT 1 FROM bill_participants WHERE bill_id = ? AND status = 'pending')", (row['bill_id'], row['bill_id']))
+        return row['bill_id'], True
+
+    def get_conversation_state(self, user_id: int):
+        cursor = self.conn.cursor(); cursor.execute("SELECT data, updated_at FROM conversation_state WHERE user_id = ? AND expires_at > ?", (user_id, time.time())); return cursor.fetchone()
+
+    def save_conversation_states(self, states: dict, ttl: float = CONVERSATION_TTL):
+        # states: user_id -> (json, updated_at); json None apaga o estado do usuário.
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO conversation_state (user_id, data, updated_at, expires_at) VALUES (?, ?, ?, ?)", [(user_id, data, updated_at, updated_at + ttl) for user_id, (data, updated_at) in states.items() if data is not None])
+            self.conn.executemany("DELETE FROM conversation_state WHERE user_id = ?", [(user_id,) for user_id, (data, _) in states.items() if data is None])
+
+    def create_pending_action(self, user_id: int, kind: str, payload: dict, ttl: float = PENDING_ACTION_TTL) -> int:
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO pending_actions (user_id, kind, payload, expires_at) VALUES (?, ?, ?, ?)", (user_id, kind, encode_state(payload), time.time() + ttl)); return cursor.lastrowid
+
+    def take_pending_action(self, pending_id: int, user_id: int, kind: str) -> dict | None:
+        # Lê e consome na mesma transação: um segundo clique (ou outra instância) não registra o gasto duas vezes.
+        with self.conn:
+            row = self.conn.execute("SELECT payload, expires_at FROM pending_actions WHERE id = ? AND user_id = ? AND kind = ?", (pending_id, user_id, kind)).fetchone()
+            if not row: return None
+            self.conn.execute("DELETE FROM pending_actions WHERE id = ?", (pending_id,))
+        return decode_state(row['payload']) if row['expires_at'] > time.time() else None
+
+    def discard_pending_action(self, pending_id: int, user_id: int):
+        with self.conn: self.conn.execute("DELETE FROM pending_actions WHERE id = ? AND user_id = ?", (pending_id, user_id))
+
+    def purge_expired_state(self) -> int:
+        now = time.time()
+        with self.conn:
+            removed = self.conn.execute("DELETE FROM pending_actions WHERE expires_at <= ?", (now,)).rowcount
+            removed += self.conn.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (now,)).rowcount
+            removed += self.conn.execute("DELETE FROM outbound_messages WHERE status = 'failed' AND next_attempt_at <= ?", (now - NOTIFY_FAILED_TTL,)).rowcount
+        return removed
+
+    def enqueue_outbound_messages(self, messages: list[dict]) -> int:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany("INSERT INTO outbound_messages (chat_id, text, parse_mode, reply_markup, fallback_chat_id, fallback_text, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                  [(m['chat_id'], m['text'], m.get('parse_mode'), m.get('reply_markup'), m.get('fallback_chat_id'), m.get('fallback_text'), now, now) for m in messages])
+        return len(messages)
+
+    def claim_outbound_messages(self, limit: int, lease: float = NOTIFY_LEASE) -> list:
+        # Reserva as mensagens vencidas empurrando next_attempt_at para o fim do lease; se a instância morrer, elas voltam sozinhas.
+        now = time.time()
+        with self.conn:
+            return self.conn.execute("UPDATE outbound_messages SET next_attempt_at = ? WHERE id IN (SELECT id FROM outbound_messages WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?) "
+                                     "RETURNING id, chat_id, text, parse_mode, reply_markup, attempts", (now + lease, now, limit)).fetchall()
+
+    def complete_outbound_message(self, message_id: int):
+        with self.conn: self.conn.execute("DELETE FROM outbound_messages WHERE id = ?", (message_id,))
+
+    def retry_outbound_message(self, message_id: int, delay: float, error: str, count_attempt: bool = True):
+        with self.conn:
+            self.conn.execute("UPDATE outbound_messages SET next_attempt_at = ?, attempts = attempts + ?, last_error = ? WHERE id = ?", (time.time() + delay, int(count_attempt), error, message_id))
+
+    def fail_outbound_message(self, message_id: int, error: str):
+        # Falha definitiva; se houver aviso alternativo (ex.: no grupo), ele entra na fila na mesma transação.
+        now = time.time()
+        with self.conn:
+            self.conn.execute("UPDATE outbound_messages SET status = 'failed', attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?", (error, now, message_id))
+            self.conn.execute("INSERT INTO outbound_messages (chat_id, text, next_attempt_at, created_at) SELECT fallback_chat_id, fallback_text, ?, ? FROM outbound_messages WHERE id = ? AND fallback_chat_id IS NOT NULL", (now, now, message_id))
+
+    def release_outbound_messages(self, message_ids: list[int]):
+        with self.conn: self.conn.executemany("UPDATE outbound_messages SET next_attempt_at = ? WHERE id = ? AND status = 'pending'", [(time.time(), message_id) for message_id in message_ids])
+
+    def count_outbound_messages(self) -> dict:
+        cursor = self.conn.cursor(); cursor.execute("SELECT status, COUNT(*) FROM outbound_messages GROUP BY status"); return dict(cursor.fetchall())
+
+    def ping(self) -> bool:
+        return self.conn.execute('SELECT 1').fetchone()[0] == 1
+
+    # Exportações: nome -> (cabeçalho, consulta, colunas em centavos).
+    EXPORTS = {
+        'usuarios': (['Nome Completo', 'Email', 'Data de Cadastro'], "SELECT full_name, email, created_at FROM users WHERE full_name IS NOT NULL AND email IS NOT NULL", ()),
+        'gastos': (['Data', 'Descrição', 'Categoria', 'Valor', 'Parcelamento'], "SELECT date, description, category, amount_cents, installment_id FROM all_expenses WHERE user_id = ? ORDER BY date, id", (3,)),
+        'parcelas': (['Início', 'Descrição', 'Categoria', 'Valor Total', 'Parcelas'], "SELECT start_date, description, category, total_amount_cents, total_installments FROM installments WHERE user_id = ? ORDER BY start_date, id", (3,)),
+    }
+
+    def export_csv(self, name: str, params: tuple, directory: str, compress: bool = False, part_bytes: int = EXPORT_PART_BYTES, chunk_rows: int = EXPORT_CHUNK_ROWS) -> tuple[list[str], int]:
+        # Cursor lido em blocos de chunk_rows direto para arquivo (opcionalmente gzip); ao passar de part_bytes abre a
+        # próxima parte, cada uma com cabeçalho. A memória fica limitada a um bloco, qualquer que seja o tamanho da tabela.
+        # Sem flush por bloco (no gzip cada um encerraria um bloco deflate): raw.tell() fica atrás só do que o zlib
+        # ainda segura, e a folga de EXPORT_PART_BYTES até os 50 MB cobre isso; o close da parte grava o resto.
+        header, query, cents_columns = self.EXPORTS[name]
+        cursor = self.conn.execute(query, params); paths, rows, raw, out = [], 0, None, None
+        try:
+            while chunk := cursor.fetchmany(chunk_rows):
+                if out is None or raw.tell() >= part_bytes:
+                    if out: out.close(); raw.close()
+                    paths.append(os.path.join(directory, f"savie_{name}_{date.today().isoformat()}_{len(paths) + 1}.csv{'.gz' if compress else ''}"))
+                    raw = open(paths[-1], 'wb'); out = io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if compress else raw, encoding='utf-8', newline='')
+                    writer = csv.writer(out); writer.writerow(header)
+                for row in chunk:
+                    row = list(row)
+                    for column in cents_columns: row[column] = from_cents(row[column])
+                    writer.writerow(row)
+                rows += len(chunk)
+        finally:
+            if out: out.close()
+            if raw and not raw.closed: raw.close()
+        return paths, rows
+
+# --- Categorização por Palavra-chave ---
+class KeywordMatcher:
+    """Todas as palavras-chave numa única regex compilada (texto normalizado, com fronteira de palavra),
+    mais as palavras aprendidas de cada usuário. Vive em memória: nada de varrer a tabela por mensagem."""
+    def __init__(self):
+        self.version = None; self._pattern = None; self._keywords: dict[str, str] = {}
+        self._learned: dict[int, dict[str, str]] = {}; self._user_patterns: dict[int, re.Pattern] = {}
+
+    @staticmethod
+    def _compile(keywords) -> re.Pattern | None:
+        if not keywords: return None
+        alternation = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        return re.compile(rf'(?<!\w)({alternation})s?(?!\w)')  # aceita plural simples: "lanches" -> "lanche"
+
+    def build(self, categories: list, learned: list, version: int):
+        keywords = {}
+        for cat in categories:
+            for keyword in cat['keywords'].split(','):
+                keyword = normalize_text(keyword)
+                if keyword: keywords.setdefault(keyword, f"{cat['emoji']} {cat['name']}")
+        learned_by_user = {}
+        for row in learned: learned_by_user.setdefault(row['user_id'], {})[row['keyword']] = row['category']
+        self._keywords, self._pattern = keywords, self._compile(keywords)
+        self._learned, self._user_patterns, self.version = learned_by_user, {}, version
+        logger.info(f"Matcher de palavras-chave compilado: {len(keywords)} globais, {sum(map(len, learned_by_user.values()))} aprendidas (versão {version}).")
+
+    def match(self, description: str, user_id: int | None = None, normalized: str | None = None) -> str | None:
+        text = normalized if normalized is not None else normalize_text(description)
+        learned = self._learned.get(user_id)
+        if learned:
+            pattern = self._user_patterns.get(user_id)
+            if pattern is None: pattern = self._user_patterns[user_id] = self._compile(learned)
+            found = pattern.search(text)
+            if found: return learned[found.group(1)]
+        found = self._pattern.search(text) if self._pattern else None
+        return self._keywords[found.group(1)] if found else None
+
+    def learn(self, user_id: int, keyword: str, category: str):
+        self._learned.setdefault(user_id, {})[keyword] = category; self._user_patterns.pop(user_id, None)
+
+    def forget_user(self, user_id: int):
+        self._learned.pop(user_id, None); self._user_patterns.pop(user_id, None)
+
+# --- Cliente de IA ---
+class LLMUnavailable(Exception):
+    """A IA não respondeu no prazo, esgotou as tentativas ou está com o disjuntor aberto."""
 
-# Instância do Bot
-savie = SavieBot(db_path=DB_PATH)
+def load_gemini_model():
+    # Import pesado (~1,3 s de grpc/protobuf): fica fora do import do bot e roda numa thread, no pré-carregamento ou na primeira chamada.
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+_ai_error_types: tuple | None = None
+
+def ai_error_types() -> tuple[tuple, tuple]:
+    """(erros que valem nova tentativa, erros de cota) do google.api_core, importado só quando a primeira falha acontece."""
+    global _ai_error_types
+    if _ai_error_types is None:
+        from google.api_core import exceptions as google_exceptions
+        quota = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+        _ai_error_types = (quota + (google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError, google_exceptions.DeadlineExceeded), quota)
+    return _ai_error_types
+
+class LLMClient:
+    """Cliente assíncrono compartilhado por categorização e conversa, sobre uma única instância do modelo
+    (qualquer objeto com generate_content_async, como o genai.GenerativeModel, ou um `loader` que o cria na
+    primeira chamada). Limita as chamadas em voo, impõe um prazo por chamada (espera na fila incluída), repete
+    com backoff exponencial em erro de cota ou indisponibilidade e tem um disjuntor: após `failure_threshold`
+    falhas seguidas recusa chamadas por `reset_timeout` segundos e depois deixa passar uma chamada de teste,
+    que fecha ou reabre o disjuntor."""
+    def __init__(self, model=None, provider: str = "gemini", concurrency: int = AI_CONCURRENCY, timeout: float = AI_TIMEOUT, max_retries: int = AI_MAX_RETRIES,
+                 failure_threshold: int = AI_BREAKER_THRESHOLD, reset_timeout: float = AI_BREAKER_RESET, loader=None):
+        self.model, self.loader, self.provider, self.timeout, self.max_retries = model, loader, provider, timeout, max_retries
+        self.failure_threshold, self.reset_timeout = failure_threshold, reset_timeout
+        self._semaphore = asyncio.Semaphore(concurrency); self._failures = 0; self._opened_at: float | None = None; self._probing = False
+        self._loading: asyncio.Future | None = None
+        self.stats = {'calls': 0, 'retries': 0, 'timeouts': 0, 'quota_errors': 0, 'errors': 0, 'rejected': 0, 'circuit_opened': 0}
+
+    @property
+    def available(self) -> bool:
+        # Disjuntor fechado, ou aberto há mais de reset_timeout sem chamada de teste em andamento.
+        if self._opened_at is None: return True
+        return not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def preload(self) -> asyncio.Future | None:
+        # Carrega o modelo numa thread; o post_init começa a carga e as chamadas concorrentes esperam a mesma.
+        if self.model is None and self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self._load_blocking)); self._loading.add_done_callback(self._loaded)
+        return self._loading
+
+    def _load_blocking(self):
+        started = time.perf_counter(); model = self.loader()
+        logger.info("Modelo de IA (%s) carregado em %.2fs.", self.provider, time.perf_counter() - started); return model
+
+    def _loaded(self, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            self._loading = None  # a próxima chamada tenta de novo
+            if not future.cancelled(): logger.warning("Modelo de IA (%s) não carregou: %s", self.provider, future.exception())
+
+    async def load(self):
+        if self.model is None: self.model = await asyncio.shield(self.preload())
+        return self.model
+
+    async def _call(self, prompt: str, purpose: str):
+        async with self._semaphore:
+            self.stats['calls'] += 1
+            with metrics.timer("savie_ai_seconds", provider=self.provider, purpose=purpose): return await self.model.generate_content_async(prompt)
+
+    async def generate(self, prompt: str, purpose: str = "categorize", timeout: float | None = None) -> str:
+        if not self.available:
+            self.stats['rejected'] += 1; metrics.inc("savie_ai_errors_total", provider=self.provider, purpose=purpose, reason="circuit_open")
+            raise LLMUnavailable("disjuntor aberto")
+        probe = self._opened_at is not None; self._probing = self._probing or probe
+        try:
+            # A carga do modelo (uma vez por processo) não conta no prazo da chamada.
+            try: await self.load()
+            except Exception as e:
+                self.stats['errors'] += 1; self._fail(purpose, "error", probe); raise LLMUnavailable(f"modelo não carregou: {e}") from e
+            loop = asyncio.get_running_loop(); deadline = loop.time() + (timeout or self.timeout); attempt = 0
+            while True:
+                try:
+                    response = await asyncio.wait_for(self._call(prompt, purpose), max(0.0, deadline - loop.time()))
+                    self._record(True, probe); return response.text
+                except asyncio.TimeoutError:
+                    self.stats['timeouts'] += 1; self._fail(purpose, "timeout", probe); raise LLMUnavailable("prazo esgotado") from None
+                except Exception as e:
+                    retryable, quota_errors = ai_error_types()
+                    if not isinstance(e, retryable):
+                        self.stats['errors'] += 1; self._fail(purpose, "error", probe); raise LLMUnavailable(str(e)) from e
+                    quota = isinstance(e, quota_errors)
+                    self.stats['quota_errors' if quota else 'errors'] += 1
+                    delay = min(AI_BACKOFF_BASE * 2 ** attempt, AI_BACKOFF_MAX) * (0.5 + random.random() / 2)
+                    if attempt >= self.max_retries or loop.time() + delay >= deadline:
+                        self._fail(purpose, "quota" if quota else "unavailable", probe); raise LLMUnavailable(str(e)) from e
+                    attempt += 1; self.stats['retries'] += 1; await asyncio.sleep(delay)
+        finally:
+            if probe: self._probing = False
+
+    def _fail(self, purpose: str, reason: str, probe: bool):
+        metrics.inc("savie_ai_errors_total", provider=self.provider, purpose=purpose, reason=reason); self._record(False, probe)
+
+    def _record(self, ok: bool, probe: bool):
+        if ok:
+            if self._opened_at is not None: logger.info("IA (%s) respondeu de novo; disjuntor fechado.", self.provider)
+            self._failures = 0; self._opened_at = None; return
+        self._failures += 1
+        if probe or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                self.stats['circuit_opened'] += 1; logger.warning("IA (%s) com %d falhas seguidas; disjuntor aberto por %.0fs.", self.provider, self._failures, self.reset_timeout)
+            self._opened_at = time.monotonic()
+
+# --- Categorização por IA ---
+class CategorizationService:
+    """Palavra-chave -> cache persistente -> IA. Descrições iguais em voo compartilham a mesma chamada
+    e as pendentes são agrupadas em um único prompt (micro-batching) com resposta em array JSON."""
+    FALLBACK_CATEGORY = "📦 Outros"
+
+    def __init__(self, savie: SavieBot, db: SQLiteExecutor, matcher: KeywordMatcher, model=None, batch_size: int = AI_BATCH_SIZE, batch_window: float = AI_BATCH_WINDOW):
+        self.savie, self.db, self.matcher, self.model = savie, db, matcher, model
+        self._matcher_checked_at = time.monotonic()
+        self.batch_size, self.batch_window = batch_size, batch_window
+        self._inflight: dict[str, asyncio.Future] = {}; self._pending: list[tuple[str, str]] = []
+        self._flush_timer: asyncio.Task | None = None; self._tasks: set[asyncio.Task] = set(); self._touched: set[str] = set()
+        self.stats = {'requests': 0, 'keyword_hits': 0, 'cache_hits': 0, 'coalesced': 0, 'ai_calls': 0, 'ai_descriptions': 0, 'fallbacks': 0}
+
+    async def refresh_matcher(self, force: bool = False):
+        if not force and time.monotonic() - self._matcher_checked_at < KEYWORD_REFRESH_INTERVAL: return
+        self._matcher_checked_at = time.monotonic()
+        if force or await self.db.read(self.savie.get_keyword_catalog_version) != self.matcher.version:
+            self.matcher.build(*await self.db.read(self.savie.get_keyword_catalog))
+
+    async def learn(self, user_id: int, description: str, category: str):
+        # Categorias confirmadas que o matcher ainda não conhecia viram palavra-chave do usuário: a próxima vez não chega à IA.
+        keyword = normalize_text(description)
+        if not keyword or category == self.FALLBACK_CATEGORY or self.matcher.match(description, user_id) == category: return
+        version = await self.db.write(self.savie.add_user_keyword, user_id, keyword, category)
+        self.matcher.learn(user_id, keyword, category)
+        if self.matcher.version == version - 1: self.matcher.version = version  # só a nossa escrita mudou o catálogo
+
+    async def categorize_expense(self, description: str, user_id: int | None = None) -> str:
+        self.stats['requests'] += 1
+        await self.refresh_matcher()
+        category = self.matcher.match(description, user_id)
+        if category: self.stats['keyword_hits'] += 1; return category
+        if self.model is None: self.stats['fallbacks'] += 1; return self.FALLBACK_CATEGORY
+        key = normalize_text(description)
+        if key in self._inflight: self.stats['coalesced'] += 1; return await asyncio.shield(self._inflight[key])
+        category = await self.db.read(self.savie.get_cached_category, key)
+        if category: self.stats['cache_hits'] += 1; self._touched.add(key); return category
+        if key in self._inflight: self.stats['coalesced'] += 1; return await asyncio.shield(self._inflight[key])
+        if not self.model.available: self.stats['fallbacks'] += 1; return self.FALLBACK_CATEGORY  # disjuntor aberto: só palavra-chave e cache
+        future = asyncio.get_running_loop().create_future(); self._inflight[key] = future; self._pending.append((key, description))
+        if len(self._pending) >= self.batch_size: self._spawn(self._run_batch(self._take_batch()))
+        elif self._flush_timer is None: self._flush_timer = self._spawn(self._flush_later())
+        return await asyncio.shield(future)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro); self._tasks.add(task); task.add_done_callback(self._tasks.discard); return task
+
+    def _take_batch(self) -> list:
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]; return batch
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_window); self._flush_timer = None
+        while self._pending: self._spawn(self._run_batch(self._take_batch()))
+
+    async def _run_batch(self, batch: list):
+        results = {}
+        try:
+            categories = await self.db.read(self.savie.get_categories); by_name = {c['name']: f"{c['emoji']} {c['name']}" for c in categories}
+            listing = "\n".join(f"{i}. \"{desc}\"" for i, (_, desc) in enumerate(batch, 1))
+            prompt = (f"Você é um assistente de finanças. Sua tarefa é categorizar cada despesa abaixo em uma das seguintes categorias: {', '.join(by_name)}. "
+                      f"Responda APENAS com um array JSON com o nome da categoria de cada despesa, na mesma ordem: [\"Categoria 1\", \"Categoria 2\"]\n\nDespesas:\n{listing}")
+            self.stats['ai_calls'] += 1; self.stats['ai_descriptions'] += len(batch)
+            json_text = (await self.model.generate(prompt, purpose="categorize")).strip().replace("```json", "").replace("```", ""); names = json.loads(json_text)
+            results = {key: by_name[name] for (key, _), name in zip(batch, names) if name in by_name}
+            touched, self._touched = list(self._touched), set()
+            await self.db.write(self.savie.store_cached_categories, list(results.items()), touched)
+            logger.debug("IA categorizou %d/%d descrições em uma chamada.", len(results), len(batch))
+        except LLMUnavailable as e: logger.warning("IA indisponível para categorizar %d descrições: %s", len(batch), e)
+        except Exception as e: logger.error(f"Erro ao categorizar com IA: {e}")
+        for key, _ in batch:
+            category = results.get(key)
+            if category is None: self.stats['fallbacks'] += 1
+            future = self._inflight.pop(key)
+            if not future.done(): future.set_result(category or self.FALLBACK_CATEGORY)
+
+# --- Fila de Notificações ---
+class RateLimiter:
+    """Agenda cada envio no próximo horário livre respeitando o limite global e o intervalo por chat.
+    Roda só no event loop, então a reserva é atômica sem lock."""
+    def __init__(self, global_rate: float = NOTIFY_GLOBAL_RATE, private_interval: float = NOTIFY_PRIVATE_INTERVAL, group_interval: float = NOTIFY_GROUP_INTERVAL):
+        self.global_interval, self.private_interval, self.group_interval = 1 / global_rate, private_interval, group_interval
+        self._next_global = 0.0; self._next_chat: dict[int, float] = {}
+
+    def reserve(self, chat_id: int) -> float:
+        now = time.monotonic()
+        if len(self._next_chat) > 10000: self._next_chat = {chat: at for chat, at in self._next_chat.items() if at > now}
+        at = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+        self._next_global = at + self.global_interval
+        self._next_chat[chat_id] = at + (self.private_interval if chat_id > 0 else self.group_interval)
+        return at - now
+
+    def pause(self, chat_id: int, seconds: float):
+        self._next_chat[chat_id] = max(self._next_chat.get(chat_id, 0.0), time.monotonic() + seconds)
+
+class NotificationDispatcher:
+    """Consome a fila persistida outbound_messages: envios concorrentes dentro dos limites do Telegram,
+    retry_after respeitado, erros transitórios com backoff e falhas definitivas marcadas (com aviso alternativo)."""
+    def __init__(self, savie: SavieBot, db: SQLiteExecutor, limiter: RateLimiter | None = None, concurrency: int = NOTIFY_CONCURRENCY, max_attempts: int = NOTIFY_MAX_ATTEMPTS, poll_interval: float = 1.0):
+        self.savie, self.db, self.limiter = savie, db, limiter or RateLimiter()
+        self.concurrency, self.max_attempts, self.poll_interval = concurrency, max_attempts, poll_interval
+        self.bot = None; self._runner: asyncio.Task | None = None; self._wake = asyncio.Event(); self._sending: dict[int, asyncio.Task] = {}
+        self.stats = {'enqueued': 0, 'sent': 0, 'retry_after': 0, 'retries': 0, 'failed': 0}
+
+    @staticmethod
+    def message(chat_id: int, text: str, parse_mode: str | None = None, reply_markup: InlineKeyboardMarkup | None = None, fallback_chat_id: int | None = None, fallback_text: str | None = None) -> dict:
+        return {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode, 'reply_markup': json.dumps(reply_markup.to_dict()) if reply_markup else None, 'fallback_chat_id': fallback_chat_id, 'fallback_text': fallback_text}
+
+    async def enqueue(self, chat_id: int, text: str, **kwargs):
+        await self.enqueue_many([self.message(chat_id, text, **kwargs)])
+
+    async def enqueue_many(self, messages: list[dict]):
+        if not messages: return
+        self.stats['enqueued'] += await self.db.write(self.savie.enqueue_outbound_messages, messages); self._wake.set()
+
+    def start(self, bot):
+        self.bot = bot; self._runner = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        # Dá um tempo aos envios em andamento; os que ainda esperam vaga voltam para a fila na hora.
+        if self._runner: self._runner.cancel(); await asyncio.gather(self._runner, return_exceptions=True); self._runner = None
+        if self._sending: await asyncio.wait(list(self._sending.values()), timeout=timeout)
+        pending = list(self._sending)
+        for task in self._sending.values(): task.cancel()
+        await asyncio.gather(*self._sending.values(), return_exceptions=True)
+        if pending: await self.db.write(self.savie.release_outbound_messages, pending)
+
+    async def _run(self):
+        while True:
+            self._wake.clear(); free = self.concurrency - len(self._sending)
+            try: rows = await self.db.write(self.savie.claim_outbound_messages, free) if free > 0 else []
+            except Exception as e: logger.error(f"Notificações: erro ao ler a fila: {e}"); rows = []
+            for row in rows:
+                task = asyncio.create_task(self._deliver(row)); self._sending[row['id']] = task
+                task.add_done_callback(lambda _, message_id=row['id']: (self._sending.pop(message_id, None), self._wake.set()))
+            if rows and len(rows) == free: continue  # lote cheio: pode haver mais na fila; lote menor esvaziou a fila
+            try: await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError: pass
+
+    async def _deliver(self, row):
+        message_id, chat_id = row['id'], row['chat_id']
+        await asyncio.sleep(self.limiter.reserve(chat_id))
+        try:
+            reply_markup = InlineKeyboardMarkup.de_json(json.loads(row['reply_markup']), self.bot) if row['reply_markup'] else None
+            await self.bot.send_message(chat_id=chat_id, text=row['text'], parse_mode=row['parse_mode'], reply_markup=reply_markup)
+        except RetryAfter as e:
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            self.stats['retry_after'] += 1; self.limiter.pause(chat_id, delay)
+            await self.db.write(self.savie.retry_outbound_message, message_id, delay, str(e), False)
+        except (Forbidden, BadRequest) as e:
+            self.stats['failed'] += 1; logger.warning(f"Notificações: envio para {chat_id} falhou em definitivo: {e}")
+            await self.db.write(self.savie.fail_outbound_message, message_id, str(e))
+        except TelegramError as e:
+            if row['attempts'] + 1 >= self.max_attempts:
+                self.stats['failed'] += 1; logger.warning(f"Notificações: desistindo de {chat_id} após {self.max_attempts} tentativas: {e}")
+                await self.db.write(self.savie.fail_outbound_message, message_id, str(e))
+            else:
+                self.stats['retries'] += 1; await self.db.write(self.savie.retry_outbound_message, message_id, min(5 * 2 ** row['attempts'], 300), str(e))
+        else:
+            self.stats['sent'] += 1; await self.db.write(self.savie.complete_outbound_message, message_id)
+
+# --- Resumo das Contas Compartilhadas ---
+class BillSummaryEditor:
+    """Reedita a mensagem-resumo de uma conta no grupo depois dos cliques em "Já paguei". Cliques de uma mesma
+    conta dentro de `delay` segundos viram uma única edição, feita com o estado lido do banco na hora, e a
+    edição respeita o limite de envio do grupo no RateLimiter compartilhado com as notificações."""
+    def __init__(self, savie: SavieBot, db: SQLiteExecutor, limiter: RateLimiter, delay: float = BILL_SUMMARY_DEBOUNCE):
+        self.savie, self.db, self.limiter, self.delay = savie, db, limiter, delay
+        self.bot = None; self._scheduled: dict[int, asyncio.Task] = {}
+        self.stats = {'requests': 0, 'edits': 0, 'retry_after': 0}
+
+    @staticmethod
+    def render(bill, participants: list) -> str:
+        total = from_cents(bill['total_amount_cents']); share = total / max(1, len(participants))
+        lines = [f"*Conta Rachada por @{escape_markdown(bill['creator_username'] or '?')}*\n", f"📝 *Descrição:* {escape_markdown(bill['description'])}",
+                 f"💰 *Total:* R$ {total:.2f} (R$ {share:.2f} por pessoa)\n", "*Participantes:*"]
+        lines += [f"{'✅' if p['status'] == 'paid' else '⏳'} @{escape_markdown(p['participant_username'])}" for p in participants]
+        if bill['status'] == 'settled': lines.append("\n🎉 Todos pagaram!")
+        return "\n".join(lines)
+
+    def schedule(self, bot, bill_id: int, delay: float | None = None):
+        self.bot = bot; self.stats['requests'] += 1
+        if bill_id not in self._scheduled: self._scheduled[bill_id] = asyncio.create_task(self._edit_later(bill_id, self.delay if delay is None else delay))
+
+    async def _edit_later(self, bill_id: int, delay: float):
+        await asyncio.sleep(delay)
+        # Sai do mapa antes de ler o banco: um clique durante a edição agenda a próxima em vez de se perder.
+        self._scheduled.pop(bill_id, None); await self._edit(bill_id)
+
+    async def _edit(self, bill_id: int):
+        bill, participants = await self.db.read(self.savie.get_bill_status, bill_id)
+        if not bill or not bill['summary_message_id']: return
+        await asyncio.sleep(self.limiter.reserve(bill['group_chat_id']))
+        try:
+            await self.bot.edit_message_text(chat_id=bill['group_chat_id'], message_id=bill['summary_message_id'], text=self.render(bill, participants), parse_mode=ParseMode.MARKDOWN)
+            self.stats['edits'] += 1
+        except RetryAfter as e:
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            self.stats['retry_after'] += 1; self.limiter.pause(bill['group_chat_id'], delay); self.schedule(self.bot, bill_id, delay)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower(): logger.warning(f"Resumo da conta {bill_id}: edição recusada: {e}")
+        except TelegramError as e: logger.warning(f"Resumo da conta {bill_id}: falha ao editar: {e}")
+
+    async def flush(self):
+        # No desligamento: as edições agendadas são feitas na hora em vez de perdidas.
+        scheduled, self._scheduled = self._scheduled, {}
+        for task in scheduled.values(): task.cancel()
+        await asyncio.gather(*scheduled.values(), return_exceptions=True)
+        for bill_id in scheduled:
+            try: await self._edit(bill_id)
+            except Exception as e: logger.warning(f"Resumo da conta {bill_id}: não editado no desligamento: {e}")
+
+# --- Relatórios ---
+# Montados na thread de leitura a partir dos totais mensais e guardados em savie.reports (cached_report): um toque
+# repetido no botão, sem gasto novo do usuário, devolve o texto pronto sem ir ao banco.
+def month_label(year_month: str) -> str:
+    return f"{MONTH_ABBR[int(year_month[5:]) - 1]}/{year_month[2:4]}"
+
+def sparkline(values) -> str:
+    top = max(values, default=0)
+    return ''.join(SPARK_BLOCKS[value * (len(SPARK_BLOCKS) - 1) // top] if value > 0 else '·' for value in values)
+
+def month_delta(current: int, previous: int) -> str:
+    if not previous: return "novo" if current else "="
+    change = (current - previous) * 100 / previous
+    return f"{'▲' if change > 0 else '▼' if change < 0 else '='} {abs(change):.0f}%"
+
+def moving_average(series, window: int = TREND_WINDOW) -> list[int]:
+    # Janela corrida: soma o mês que entra e tira o que sai, uma passada pela série inteira.
+    total = sum(series[:window - 1]); averages = []
+    for i in range(window - 1, len(series)):
+        total += series[i]; averages.append(total // window); total -= series[i - window + 1]
+    return averages
+
+def render_trend_report(keys: list[str], categories: list[str], grid: array) -> str | None:
+    """Tendência a partir da matriz de get_monthly_series: gráfico dos meses fechados, o último sobre o anterior e a
+    média móvel sobre a de uma janela antes, no total e por categoria. O mês atual, parcial, entra só como valor."""
+    months = len(keys); closed = months - 1
+    totals = array('q', (sum(grid[m::months]) for m in range(months)))  # soma de cada coluna (mês) da matriz
+    if not any(totals[:closed]): return None
+    def numbers(series) -> str:
+        averages = moving_average(series[:closed])
+        return (f"R$ {from_cents(series[closed - 1]):.2f} ({month_delta(series[closed - 1], series[closed - 2])}) · "
+                f"média R$ {from_cents(averages[-1]):.2f} ({month_delta(averages[-1], averages[-1 - TREND_WINDOW])})")
+    rows = sorted((c for c in range(len(categories)) if any(grid[c * months:c * months + closed])), key=lambda c: sum(grid[c * months:c * months + closed]), reverse=True)
+    lines = [f"📉 *Tendência de {month_label(keys[0])} a {month_label(keys[closed - 1])}*", "",
+             f"*Total* `{sparkline(totals[:closed])}`", numbers(totals), f"{month_label(keys[-1])} até agora: R$ {from_cents(totals[-1]):.2f}", "",
+             f"*Por categoria* ({month_label(keys[closed - 1])} sobre o mês anterior · média de {TREND_WINDOW} meses sobre a de {TREND_WINDOW} meses antes)"]
+    for c in rows[:TREND_TOP_CATEGORIES]:
+        lines += [f"{escape_markdown(categories[c])} `{sparkline(grid[c * months:c * months + closed])}`", numbers(grid[c * months:(c + 1) * months])]
+    if len(rows) > TREND_TOP_CATEGORIES: lines += ["", f"+{len(rows) - TREND_TOP_CATEGORIES} categorias menores, somadas no total."]
+    return '\n'.join(lines)
+
+def trend_report(user_id: int) -> str:
+    keys, categories, grid = savie.get_monthly_series(user_id, TREND_MONTHS + 1)
+    return render_trend_report(keys, categories, grid) or "A tendência precisa de pelo menos um mês fechado com gastos. Volte no mês que vem!"
+
+def month_report(user_id: int) -> str:
+    summary = savie.get_monthly_summary(user_id)
+    if not summary: return "Você ainda não registrou nenhum gasto este mês. Comece agora!"
+    month_name = datetime.now().strftime('%B de %Y').capitalize()
+    return f"📊 *Resumo de {month_name}*\n\n💰 *Total Gasto:* R$ {summary['total']:.2f}\n\nPara ver o detalhamento, use o botão 'Por Categoria'."
+
+def category_report(user_id: int) -> str:
+    summary = savie.get_monthly_summary(user_id)
+    if not summary: return "Você ainda não registrou nenhum gasto este mês."
+    month_name = datetime.now().strftime('%B de %Y').capitalize(); total_geral = summary['total']
+    lines = [f"{row['category']}: *R$ {row['cat_total']:.2f}* ({row['cat_total'] / total_geral * 100:.1f}%)" for row in summary['by_category']]
+    return '\n'.join([f"📈 *Gastos por Categoria - {month_name}*", "", *lines, "", f"💰 *Total Geral:* R$ {total_geral:.2f}"])
+
+async def cached_report(user_id: int, kind: str, build) -> str:
+    # A versão é lida antes da consulta (ReportCache.put descarta o que ficou velho no caminho); commits de outros
+    # processos chegam pela época, em até FOREIGN_WRITES_INTERVAL. O mês na chave vira o relatório na virada do mês.
+    year_month = date.today().strftime('%Y-%m'); version = savie.reports.version(user_id)
+    report = savie.reports.get(user_id, kind, year_month, version)
+    if report is None: report = await db.read(build, user_id); savie.reports.put(user_id, kind, year_month, version, report)
+    return report
+
+# --- Leitura de Recibos (OCR) ---
+class ReceiptBusy(Exception):
+    """Fila de OCR cheia: a foto é recusada em vez de ficar esperando na memória."""
+
+def prepare_receipt_image(data: bytes, max_side: int = OCR_MAX_SIDE):
+    """Decodifica já reduzida, corrige a rotação da câmera e passa para tons de cinza (imagem do Pillow)."""
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = OCR_MAX_PIXELS
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (max_side, max_side))  # JPEG: o decodificador já entrega em 1/2, 1/4 ou 1/8 do tamanho
+        image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((max_side, max_side)); return image
+
+def read_receipt_image(data: bytes) -> str:
+    # Roda num processo do pool; Pillow e pytesseract só são importados lá.
+    import pytesseract
+    return pytesseract.image_to_string(prepare_receipt_image(data), lang=OCR_LANG, config="--psm 6", timeout=OCR_TIMEOUT)
+
+class ReceiptReader:
+    """OCR de recibos num ProcessPoolExecutor criado na primeira foto (processos "spawn": o import do bot é
+    leve e não herda as threads do banco). No máximo `workers` imagens vão ao pool por vez e `max_pending`
+    ficam lendo ou esperando; além disso read() recusa com ReceiptBusy. O texto lido fica num LRU pelo
+    SHA-256 da imagem e fotos iguais em voo compartilham a mesma leitura. `reader` vai por pickle para o
+    processo, então precisa ser uma função de módulo."""
+    def __init__(self, workers: int = OCR_WORKERS, max_pending: int = OCR_MAX_PENDING, cache_size: int = OCR_CACHE_SIZE, reader=read_receipt_image):
+        self.workers, self.max_pending, self.cache_size, self.reader = workers, max_pending, cache_size, reader
+        self._pool: ProcessPoolExecutor | None = None; self._slots = asyncio.Semaphore(workers); self._available: bool | None = None
+        self._cache: OrderedDict = OrderedDict(); self._inflight: dict[str, asyncio.Future] = {}
+        self.stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'rejected': 0, 'ocr_runs': 0, 'errors': 0}
+
+    @property
+    def available(self) -> bool:
+        # Pillow e pytesseract vêm do requirements-media.txt e o binário do tesseract do sistema; a imagem enxuta não tem nenhum.
+        if self._available is None:
+            import importlib.util
+            self._available = bool(importlib.util.find_spec("PIL") and importlib.util.find_spec("pytesseract") and shutil.which("tesseract"))
+        return self._available
+
+    @property
+    def busy(self) -> bool:
+        return len(self._inflight) >= self.max_pending
+
+    async def read(self, data: bytes) -> str:
+        self.stats['requests'] += 1; key = hashlib.sha256(data).hexdigest()
+        if key in self._cache: self._cache.move_to_end(key); self.stats['cache_hits'] += 1; return self._cache[key]
+        if key in self._inflight: self.stats['coalesced'] += 1; return await asyncio.shield(self._inflight[key])
+        if self.busy: self.stats['rejected'] += 1; raise ReceiptBusy(f"{len(self._inflight)} recibos na fila")
+        task = self._inflight[key] = asyncio.ensure_future(self._run(key, bytes(data)))
+        task.add_done_callback(partial(self._done, key))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None: self.stats['errors'] += 1
+
+    async def _run(self, key: str, data: bytes) -> str:
+        async with self._slots:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=OCR_TASKS_PER_CHILD)
+            self.stats['ocr_runs'] += 1
+            try:
+                with metrics.timer("savie_ocr_seconds"): text = await asyncio.get_running_loop().run_in_executor(self._pool, self.reader, data)
+            except BrokenProcessPool:
+                # Processo morto (ex.: OOM na VM): o próximo recibo sobe um pool novo.
+                logger.error("Pool de OCR quebrado; será recriado."); self._pool.shutdown(wait=False); self._pool = None; raise
+        self._cache[key] = text
+        while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+        return text
+
+    def close(self):
+        if self._pool: self._pool.shutdown(wait=False, cancel_futures=True); self._pool = None
+
+# Instâncias do Bot: criadas por init_services() no post_init da Application (ou direto pelos scripts de
+# benchmarks), não no import, para o cold start não esperar conexão, migrações e catálogo de palavras-chave.
+savie: SavieBot | None = None
+db: SQLiteExecutor | None = None
+matcher: KeywordMatcher | None = None
+llm: LLMClient | None = None
+categorizer: CategorizationService | None = None
+notifier: NotificationDispatcher | None = None
+bill_editor: BillSummaryEditor | None = None
+receipts: ReceiptReader | None = None
+metrics_runner: web.AppRunner | None = None  # servidor de /metrics em METRICS_PORT
+
+def init_services(db_path: str = DB_PATH) -> None:
+    """Abre o banco e monta os serviços que os handlers usam. Chamadas repetidas não fazem nada."""
+    global savie, db, matcher, llm, categorizer, notifier, bill_editor, receipts
+    if savie is not None: return
+    started = time.perf_counter()
+    savie = SavieBot(db_path=db_path)
+    db = SQLiteExecutor(savie)
+    matcher = KeywordMatcher(); matcher.build(*savie.get_keyword_catalog())
+    llm = LLMClient(loader=load_gemini_model) if GOOGLE_API_KEY else None
+    categorizer = CategorizationService(savie, db, matcher, model=llm)
+    notifier = NotificationDispatcher(savie, db)
+    bill_editor = BillSummaryEditor(savie, db, notifier.limiter)
+    receipts = ReceiptReader()
+    logger.info(f"Serviços iniciados em {(time.perf_counter() - started) * 1000:.0f}ms.")
+
+metrics.registry.add_collector("savie_categorizer", lambda: categorizer.stats if categorizer else {})
+metrics.registry.add_collector("savie_llm", lambda: llm.stats if llm else {})
+metrics.registry.add_collector("savie_notifier", lambda: notifier.stats if notifier else {})
+metrics.registry.add_collector("savie_profile_cache", lambda: savie.profiles.stats if savie else {})
+metrics.registry.add_collector("savie_report_cache", lambda: savie.reports.stats if savie else {})
+metrics.registry.add_collector("savie_bill_summary", lambda: bill_editor.stats if bill_editor else {})
+metrics.registry.add_collector("savie_receipts", lambda: receipts.stats if receipts else {})
+metrics.registry.add_collector("savie_storage", lambda: savie.storage_stats() if savie else {})
+metrics.registry.describe("savie_db_seconds", "Execução de métodos do SavieBot nas threads do banco.")
+metrics.registry.describe("savie_db_wait_seconds", "Espera na fila de escrita ou no pool de leitura.")
+metrics.registry.describe("savie_update_seconds", "Processamento de um update do Telegram, do handler à resposta.")
+metrics.registry.describe("savie_update_lock_wait_seconds", "Espera pelo lock do usuário antes de processar o update.")
+metrics.registry.describe("savie_telegram_seconds", "Chamadas HTTP à Bot API por método.")
+metrics.registry.describe("savie_ai_seconds", "Chamadas ao Gemini, sem a espera pela vaga no limite de concorrência.")
+metrics.registry.describe("savie_ocr_seconds", "Leitura de um recibo no pool de OCR (decodificação, redução e tesseract), sem a espera por vaga.")
+metrics.registry.describe("savie_ai_errors_total", "Chamadas à IA que caíram no fallback, por motivo (timeout, quota, unavailable, error, circuit_open).")
 
 # --- Funções Handler e Lógica da IA ---
 
+async def get_profile(user_id: int):
+    # Acerto no cache é resolvido aqui mesmo, sem ida ao pool de leitura.
+    return savie.profiles.get(user_id) or await db.read(savie.load_user_profile, user_id)
+
 async def generate_natural_response(text: str, user_name: str) -> str:
     """Usa a IA Generativa para criar uma resposta curta e natural."""
-    if not GOOGLE_API_KEY:
+    if llm is None or not llm.available:
         return "Entendido!"
-    try:
-        logger.info(f"Gerando resposta natural de IA para: '{text}'")
-        prompt = (
-            f"Você é Savie, um assistente financeiro amigável e prestativo. "
-            f"Um usuário chamado {user_name} te enviou a seguinte mensagem, que não é um comando nem um registro de gasto: '{text}'. "
-            f"Sua tarefa é responder de forma curta, positiva e natural, como um humano faria. "
-            f"Se for um agradecimento, agradeça de volta. Se for uma afirmação, confirme com um 'Ok!' ou 'Combinado!'. "
-            f"Não faça perguntas. Mantenha a resposta com no máximo 10 palavras."
-        )
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        logger.error(f"Erro ao gerar resposta com IA: {e}")
+    logger.debug("Gerando resposta natural de IA para: %r", text)
+    prompt = (
+        f"Você é Savie, um assistente financeiro amigável e prestativo. "
+        f"Um usuário chamado {user_name} te enviou a seguinte mensagem, que não é um comando nem um registro de gasto: '{text}'. "
+        f"Sua tarefa é responder de forma curta, positiva e natural, como um humano faria. "
+        f"Se for um agradecimento, agradeça de volta. Se for uma afirmação, confirme com um 'Ok!' ou 'Combinado!'. "
+        f"Não faça perguntas. Mantenha a resposta com no máximo 10 palavras."
+    )
+    try: return (await llm.generate(prompt, purpose="reply", timeout=AI_REPLY_TIMEOUT)).strip() or "Ok!"
+    except LLMUnavailable as e:
+        logger.warning("Resposta de IA indisponível: %s", e)
         return "Ok!"
 
 async def gatekeeper(update: Update, context: ContextTypes.DEFAULT_TYPE, command_name: str) -> bool:
     user_id = update.effective_user.id
-    profile = savie.get_user_profile(user_id)
+    profile = await get_profile(user_id)
     if profile and profile['full_name'] and profile['email']:
         return True
     logger.info(f"Usuário não cadastrado {user_id} tentou usar o comando '{command_name}'. Forçando cadastro.")
@@ -250,8 +1856,10 @@ async def gatekeeper(update: Update, context: ContextTypes.DEFAULT_TYPE, command
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, force_register: bool = False):
     user = update.effective_user
-    savie.register_user(user.id, user.username, user.first_name)
-    profile = savie.get_user_profile(user.id)
+    profile = await get_profile(user.id)
+    if not (profile and profile['username'] == user.username and profile['first_name'] == user.first_name):
+        await db.write(savie.register_user, user.id, user.username, user.first_name)
+        profile = await get_profile(user.id)
     if not force_register and (profile and profile['full_name'] and profile['email']):
         welcome_text = (f"👋 *Olá de novo, {profile['full_name'].split()[0]}!* Que bom te ver.\n\n"
                         "Use os botões abaixo ou me envie um gasto para começar.")
@@ -266,6 +1874,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, force_regist
         )
         context.user_data['state'] = STATE_ASKING_NAME
 
+@metrics.timed("savie_handler_seconds", handler="handle_message")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
@@ -286,11 +1895,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if state == STATE_ASKING_EMAIL:
         email = text.lower().strip()
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+        if not EMAIL_PATTERN.match(email):
             await update.message.reply_text("🤔 Hmm, este e-mail não parece válido. Por favor, tente novamente.")
             return
         full_name = context.user_data.get('full_name')
-        savie.update_user_profile(user_id, full_name, email)
+        await db.write(savie.update_user_profile, user_id, full_name, email)
         context.user_data.clear()
         keyboard = [[KeyboardButton("📊 Gastos do Mês"), KeyboardButton("📈 Por Categoria")], [KeyboardButton("💳 Ver Parcelas"), KeyboardButton("❓ Ajuda")], [KeyboardButton("🎯 Desafios"), KeyboardButton("🗑️ Excluir Dados")]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -302,7 +1911,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    profile = savie.get_user_profile(user_id)
+    profile = await get_profile(user_id)
     if not (profile and profile['full_name'] and profile['email']):
         await start(update, context, force_register=True)
         return
@@ -311,49 +1920,135 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_keyboard_buttons(update, context)
         return
 
-    text_lower = text.lower()
-    installment_keywords = ['x', 'vezes', 'parcela']
-    
-    parsed_data = savie.parse_expense_text(text)
+    parsed_data = parse_expense_text(text)
 
     if not parsed_data:
-        resposta_ia = await generate_natural_response(text, update.effective_user.first_name)
-        await update.message.reply_text(resposta_ia)
+        # Cumprimentos e agradecimentos têm resposta pronta; só o resto vai para a IA.
+        resposta = canned_reply(text) or await generate_natural_response(text, update.effective_user.first_name)
+        await update.message.reply_text(resposta)
         return
 
-    is_installment_intent = any(keyword in text_lower for keyword in installment_keywords)
-
-    if is_installment_intent:
-        match = re.search(r'(\d+)\s*(x|vezes|parcela)', text_lower)
-        if match and int(match.group(1)) > 1:
-            installments_count = int(match.group(1))
-            await process_installment_text(update, context, parsed_data, installments_count)
-            return
+    if parsed_data['installments'] and parsed_data['installments'] > 1:
+        await process_installment_text(update, context, parsed_data, parsed_data['installments'])
+        return
 
     await process_single_expense_text(update, context, parsed_data)
 
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Foto de recibo (ou imagem enviada como arquivo): OCR fora do event loop e a mesma prévia de um gasto digitado."""
+    if not await gatekeeper(update, context, "foto"): return
+    media = update.message.photo[-1] if update.message.photo else update.message.document
+    if not receipts.available:
+        await update.message.reply_text("📷 Ainda não consigo ler fotos de recibos. Digite o gasto, como `Mercado 152,30`.", parse_mode='Markdown'); return
+    if media.file_size and media.file_size > OCR_MAX_BYTES:
+        await update.message.reply_text(f"📷 Imagem grande demais (máximo de {OCR_MAX_BYTES // (1024 * 1024)} MB). Envie como foto, não como arquivo."); return
+    if receipts.busy:
+        await update.message.reply_text("⏳ Estou lendo muitos recibos agora. Reenvie a foto em alguns instantes."); return
+    await update.message.chat.send_action(ChatAction.TYPING)
+    data = await (await media.get_file()).download_as_bytearray()
+    try: text = await receipts.read(data)
+    except ReceiptBusy:
+        await update.message.reply_text("⏳ Estou lendo muitos recibos agora. Reenvie a foto em alguns instantes."); return
+    except Exception as e:
+        logger.warning(f"OCR do recibo de {update.effective_user.id} falhou: {e}")
+        await update.message.reply_text("😕 Não consegui ler este recibo. Tente uma foto mais nítida ou digite o gasto, como `Mercado 152,30`.", parse_mode='Markdown'); return
+    parsed = parse_receipt_text(text)
+    if not parsed:
+        await update.message.reply_text("🧾 Li o recibo, mas não achei o total. Digite o gasto, como `Mercado 152,30`.", parse_mode='Markdown'); return
+    await process_single_expense_text(update, context, parsed)
+
+async def scan_statement_file(bot, file_id: str, user_id: int, commit: bool = False) -> dict:
+    """Baixa o extrato para um arquivo temporário (o file_id vale em qualquer instância) e o lê fora do event loop, numa
+    conexão de leitura; na gravação, o escritor recebe as linhas já prontas e fica ocupado só com o INSERT."""
+    directory = tempfile.mkdtemp(prefix="savie_import_")
+    try:
+        path = os.path.join(directory, "extrato"); await (await bot.get_file(file_id)).download_to_drive(path)
+        await categorizer.refresh_matcher()
+        spill = os.path.join(directory, "linhas") if commit else None
+        stats = await db.read(savie.scan_statement, user_id, path, matcher, categorizer.FALLBACK_CATEGORY, spill)
+        return await db.write(savie.insert_statement, user_id, spill, stats) if commit else stats
+    finally: shutil.rmtree(directory, ignore_errors=True)
+
+def statement_preview_text(summary: dict) -> str:
+    first, last = (datetime.strptime(summary[key], '%Y-%m-%d').strftime('%d/%m/%Y') for key in ('first', 'last'))
+    categories = sorted(summary['categories'].items(), key=lambda item: -item[1][1])
+    lines = [f"🏦 *Prévia do extrato*\n\n📄 {summary['count']} gastos de {first} a {last}\n💵 *Total:* R$ {from_cents(summary['total_cents']):.2f}\n"]
+    lines += [f"{category}: R$ {from_cents(cents):.2f} ({count})" for category, (count, cents) in categories[:10]]
+    if len(categories) > 10: lines.append(f"... e mais {len(categories) - 10} categorias")
+    notes = [(summary['duplicates'], "já registrados, serão ignorados"), (summary['credits'], "entradas (créditos) ignoradas"), (summary['invalid'], "linhas ilegíveis ignoradas")]
+    lines += [""] + [f"• {count} {label}" for count, label in notes if count]
+    return '\n'.join(lines + ["", "Importar estes gastos?"])
+
+async def handle_statement(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Extrato do banco (CSV ou OFX) enviado como arquivo: uma prévia com totais por categoria e um só botão de confirmação."""
+    if not await gatekeeper(update, context, "extrato"): return
+    document, user_id = update.message.document, update.effective_user.id
+    if document.file_size and document.file_size > STATEMENT_MAX_BYTES:
+        await update.message.reply_text(f"🏦 Extrato grande demais (máximo de {STATEMENT_MAX_BYTES // (1024 * 1024)} MB). Exporte um período menor."); return
+    await update.message.chat.send_action(ChatAction.TYPING)
+    try: summary = await scan_statement_file(context.bot, document.file_id, user_id)
+    except ValueError:
+        await update.message.reply_text("😕 Não reconheci este arquivo como extrato. Envie o CSV (com colunas de data, descrição e valor) ou o OFX exportado pelo banco."); return
+    if not summary['count']:
+        await update.message.reply_text(f"🏦 Nenhum gasto novo neste extrato ({summary['duplicates']} já registrados)."); return
+    pending_id = await db.write(savie.create_pending_action, user_id, CALLBACK_CONFIRM_IMPORT, {'file_id': document.file_id, 'count': summary['count']})
+    keyboard = [[InlineKeyboardButton("✅ Importar", callback_data=f"{CALLBACK_CONFIRM_IMPORT}|{pending_id}"), InlineKeyboardButton("❌ Cancelar", callback_data=f"{CALLBACK_CANCEL}|{pending_id}")]]
+    await update.message.reply_text(statement_preview_text(summary), parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+
 async def check_for_anomalies_and_patterns(user_id: int, expense: dict, context: ContextTypes.DEFAULT_TYPE):
-    if savie.check_challenge_violation(user_id, expense['category']):
+    if await db.write(savie.check_challenge_violation, user_id, expense['category']):
         await context.bot.send_message(chat_id=user_id, text=f"Ah, não! 😟\nVocê registrou um gasto na categoria *{expense['category']}* e quebrou seu desafio atual. Mas não desanime, você pode começar um novo com o comando /desafio!", parse_mode='Markdown'); return
-    analytics = savie.get_spending_analytics(user_id, expense['category'])
+    analytics = await db.read(savie.get_spending_analytics, user_id, expense['category'])
     if analytics['historical_avg'] > 0:
         today = date.today(); days_in_month = monthrange(today.year, today.month)[1]; month_progress = today.day / days_in_month; spending_progress = analytics['current_total'] / analytics['historical_avg']
         if spending_progress > month_progress + 0.3:
             alert_text = (f"📡 *Radar Savie:* Atenção! Seus gastos com *{expense['category']}* este mês (R$ {analytics['current_total']:.2f}) já representam {spending_progress:.0%} da sua média mensal, mas estamos em {month_progress:.0%} do mês.")
             await context.bot.send_message(chat_id=user_id, text=alert_text, parse_mode='Markdown')
-    if savie.find_recurring_pattern(user_id, expense['desc'], expense['amount']):
+    if await db.read(savie.find_recurring_pattern, user_id, expense['desc'], expense['amount']):
         suggestion_text = (f"🕵️‍♂️ *Detetive Savie:* Percebi que o gasto '{expense['desc']}' tem se repetido. Deseja que eu o registre como uma despesa recorrente automática todo mês?")
-        keyboard = [[InlineKeyboardButton("Sim, criar recorrência", callback_data=CALLBACK_ADD_RECURRING), InlineKeyboardButton("Não, obrigado", callback_data=CALLBACK_CANCEL)]]
-        context.user_data['suggestion_for_recurring'] = expense
+        pending_id = await db.write(savie.create_pending_action, user_id, CALLBACK_ADD_RECURRING, expense, SUGGESTION_TTL)
+        keyboard = [[InlineKeyboardButton("Sim, criar recorrência", callback_data=f"{CALLBACK_ADD_RECURRING}|{pending_id}"), InlineKeyboardButton("Não, obrigado", callback_data=f"{CALLBACK_CANCEL}|{pending_id}")]]
         await context.bot.send_message(chat_id=user_id, text=suggestion_text, reply_markup=InlineKeyboardMarkup(keyboard))
 
+async def checkpoint_job(context: ContextTypes.DEFAULT_TYPE):
+    # PASSIVE não espera leitores: copia o que der do -wal para o banco e deixa o resto para a próxima vez.
+    try:
+        busy, wal_pages, copied = await db.write(savie.checkpoint)
+        if wal_pages > copied: logger.debug(f"Checkpoint parcial: {copied} de {wal_pages} páginas do WAL (leitores ativos).")
+    except Exception as e: logger.warning(f"Checkpoint do WAL falhou: {e}")
+
+async def foreign_writes_job(context: ContextTypes.DEFAULT_TYPE):
+    # O PRAGMA da sonda roda numa thread: o lock dela é disputado com o escritor em publish_report_changes.
+    try: await asyncio.get_running_loop().run_in_executor(None, savie.check_foreign_writes)
+    except Exception as e: logger.warning(f"Conferência de commits de outros processos falhou: {e}")
+
+async def storage_maintenance_job(context: ContextTypes.DEFAULT_TYPE):
+    """Manutenção diária do banco: gastos antigos para o arquivo morto, páginas livres de volta ao disco, -wal zerado e snapshot.
+    Arquivo e vacuum andam em lotes, cada um uma escrita na fila: os gastos dos usuários passam entre um lote e outro."""
+    started = time.perf_counter(); moved = 0; before = savie.storage_stats()
+    try:
+        if ARCHIVE_AFTER_MONTHS > 0:
+            cutoff = add_months(date.today().replace(day=1), -ARCHIVE_AFTER_MONTHS)
+            while batch := await db.write(savie.archive_expenses, cutoff): moved += batch
+        while await db.write(savie.incremental_vacuum): pass
+        await db.write(savie.checkpoint, 'TRUNCATE')
+        snapshots = await db.write(savie.snapshot, SNAPSHOT_DIR, between_steps=db.drain) if SNAPSHOT_DIR else []
+        after = savie.storage_stats(); megabytes = lambda stats, key: stats[key] / (1024 * 1024)
+        logger.info(f"Manutenção do banco em {time.perf_counter() - started:.1f}s: {moved} gastos arquivados, banco {megabytes(before, 'db_bytes'):.1f} -> {megabytes(after, 'db_bytes'):.1f} MB, "
+                    f"arquivo morto {megabytes(after, 'archive_bytes'):.1f} MB, WAL {megabytes(before, 'wal_bytes'):.1f} -> {megabytes(after, 'wal_bytes'):.1f} MB, {len(snapshots)} snapshots.")
+    except Exception as e: logger.error(f"Manutenção do banco falhou: {e}")
+
 async def daily_scheduler_job(context: ContextTypes.DEFAULT_TYPE):
     logger.info("Scheduler: Executando tarefas diárias...")
     try:
-        savie.process_due_subscriptions()
-        completed_challenges = savie.check_completed_challenges()
-        for challenge in completed_challenges:
-            await context.bot.send_message(chat_id=challenge['user_id'], text=f"🏆 Parabéns! Você completou com sucesso o desafio de não gastar em *{challenge['target_category']}*! Continue assim!", parse_mode='Markdown')
+        await db.write(savie.process_due_subscriptions)
+        await db.write(savie.materialize_due_installments)
+        proposals = await db.write(savie.propose_subscriptions)
+        await notifier.enqueue_many([notifier.message(p['user_id'], f"🕵️‍♂️ Detetive Savie: '{p['desc']}' (R$ {p['amount']:.2f}) aparece todo mês. Deseja que eu o registre como uma despesa recorrente automática no dia {p['day_of_month']}?",
+                                                      reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Sim, criar recorrência", callback_data=f"{CALLBACK_ADD_RECURRING}|{p['pending_id']}"), InlineKeyboardButton("Não, obrigado", callback_data=f"{CALLBACK_CANCEL}|{p['pending_id']}")]])) for p in proposals])
+        await db.write(savie.purge_expired_state)
+        completed_challenges = await db.write(savie.check_completed_challenges)
+        await notifier.enqueue_many([notifier.message(challenge['user_id'], f"🏆 Parabéns! Você completou com sucesso o desafio de não gastar em *{challenge['target_category']}*! Continue assim!", parse_mode='Markdown') for challenge in completed_challenges])
     except Exception as e: logger.error(f"Scheduler: Erro ao executar tarefas diárias: {e}")
 
 async def process_single_expense_text(update: Update, context: ContextTypes.DEFAULT_TYPE, parsed_data: dict):
@@ -361,11 +2056,13 @@ async def process_single_expense_text(update: Update, context: ContextTypes.DEFA
         await update.message.reply_text("😕 Desculpe, não consegui entender o valor. Tente algo como: `Lanche 25,50`")
         return
     
-    amount, desc = parsed_data['amount'], parsed_data['description']
-    category = savie.categorize_expense(desc)
-    context.user_data['pending_expense'] = {'amount': amount, 'desc': desc, 'category': category}
-    preview_text = f"✅ *Gasto reconhecido!*\n\n💵 *Valor:* R$ {amount:.2f}\n📝 *Descrição:* {desc}\n🏷️ *Categoria:* {category}\n\nPosso confirmar?"
-    keyboard = [[InlineKeyboardButton("👍 Confirmar", callback_data=CALLBACK_CONFIRM_EXPENSE), InlineKeyboardButton("❌ Cancelar", callback_data=CALLBACK_CANCEL)]]
+    amount, desc, when = parsed_data['amount'], parsed_data['description'], parsed_data.get('date')
+    category = await categorizer.categorize_expense(desc, update.effective_user.id)
+    payload = {'amount': amount, 'desc': desc, 'category': category, **({'date': when.isoformat()} if when else {})}
+    pending_id = await db.write(savie.create_pending_action, update.effective_user.id, CALLBACK_CONFIRM_EXPENSE, payload)
+    date_line = f"📅 *Data:* {when:%d/%m/%Y}\n" if when and when != date.today() else ""
+    preview_text = f"✅ *Gasto reconhecido!*\n\n💵 *Valor:* R$ {amount:.2f}\n📝 *Descrição:* {desc}\n🏷️ *Categoria:* {category}\n{date_line}\nPosso confirmar?"
+    keyboard = [[InlineKeyboardButton("👍 Confirmar", callback_data=f"{CALLBACK_CONFIRM_EXPENSE}|{pending_id}"), InlineKeyboardButton("❌ Cancelar", callback_data=f"{CALLBACK_CANCEL}|{pending_id}")]]
     await update.message.reply_text(preview_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def process_installment_text(update: Update, context: ContextTypes.DEFAULT_TYPE, parsed_data: dict, installments_count: int):
@@ -373,63 +2070,78 @@ async def process_installment_text(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("😕 Não entendi os detalhes do parcelamento. Tente: `Notebook 3000 em 10x`")
         return
 
-    total_amount, desc = parsed_data['amount'], parsed_data['description']
+    total_amount, desc, when = parsed_data['amount'], parsed_data['description'], parsed_data.get('date')
     installment_value = total_amount / Decimal(installments_count)
-    category = savie.categorize_expense(desc)
-    context.user_data['pending_installment'] = {'total_amount': total_amount, 'desc': desc, 'category': category, 'count': installments_count}
+    category = await categorizer.categorize_expense(desc, update.effective_user.id)
+    payload = {'total_amount': total_amount, 'desc': desc, 'category': category, 'count': installments_count, **({'date': when.isoformat()} if when else {})}
+    pending_id = await db.write(savie.create_pending_action, update.effective_user.id, CALLBACK_CONFIRM_INSTALLMENT, payload)
     preview_text = (f"💳 *Parcelamento reconhecido!*\n\n"
                     f"🛍️ *Descrição:* {desc}\n"
                     f"💰 *Valor Total:* R$ {total_amount:.2f}\n"
-                    f"📅 *Parcelas:* {installments_count}x de R$ {installment_value:.2f}\n"
+                    f"📅 *Parcelas:* {installments_count}x de R$ {installment_value:.2f}" + (f" a partir de {when:%d/%m/%Y}" if when and when != date.today() else "") + "\n"
                     f"🏷️ *Categoria:* {category}\n\nConfirma o registro?")
-    keyboard = [[InlineKeyboardButton("👍 Confirmar", callback_data=CALLBACK_CONFIRM_INSTALLMENT), InlineKeyboardButton("❌ Cancelar", callback_data=CALLBACK_CANCEL)]]
+    keyboard = [[InlineKeyboardButton("👍 Confirmar", callback_data=f"{CALLBACK_CONFIRM_INSTALLMENT}|{pending_id}"), InlineKeyboardButton("❌ Cancelar", callback_data=f"{CALLBACK_CANCEL}|{pending_id}")]]
     await update.message.reply_text(preview_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
 
+@metrics.timed("savie_handler_seconds", handler="handle_callback")
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query; await query.answer(); user_id = query.from_user.id
-    profile = savie.get_user_profile(user_id)
+    profile = await get_profile(user_id)
     if not (profile and profile['full_name'] and profile['email']):
         await query.edit_message_text("Por favor, complete seu cadastro primeiro. Envie /start.")
         return
     parts = query.data.split('|', 1); action = parts[0]; payload = parts[1] if len(parts) > 1 else None
     try:
         if action == CALLBACK_CONFIRM_EXPENSE:
-            pending = context.user_data.get('pending_expense')
+            pending = await db.write(savie.take_pending_action, int(payload), user_id, action) if payload else None
             if not pending: await query.edit_message_text("😕 Dados do gasto expiraram. Envie novamente."); return
-            savie.add_expense(user_id, pending['amount'], pending['desc'], pending['category'], date.today())
+            await db.write(savie.add_expense, user_id, pending['amount'], pending['desc'], pending['category'], date.fromisoformat(pending['date']) if pending.get('date') else date.today())
             await query.edit_message_text(f"✅ *Gasto registrado!*\n\n{pending['category']}: R$ {pending['amount']:.2f} - {pending['desc']}", parse_mode='Markdown')
-            expense_data = context.user_data.pop('pending_expense', None)
-            if expense_data: await check_for_anomalies_and_patterns(user_id, expense_data, context)
+            await categorizer.learn(user_id, pending['desc'], pending['category']); await check_for_anomalies_and_patterns(user_id, pending, context)
         elif action == CALLBACK_CONFIRM_INSTALLMENT:
-            pending = context.user_data.get('pending_installment')
+            pending = await db.write(savie.take_pending_action, int(payload), user_id, action) if payload else None
             if not pending: await query.edit_message_text("😕 Dados do parcelamento expiraram. Envie novamente."); return
-            savie.add_installment_purchase(user_id, pending['total_amount'], pending['desc'], pending['category'], pending['count'], date.today())
-            await query.edit_message_text(f"💳 *Parcelamento registrado!*\n\n🛍️ {pending['desc']} foi agendado em {pending['count']} parcelas.", parse_mode='Markdown'); del context.user_data['pending_installment']
+            await db.write(savie.add_installment_purchase, user_id, pending['total_amount'], pending['desc'], pending['category'], pending['count'], date.fromisoformat(pending['date']) if pending.get('date') else date.today())
+            await categorizer.learn(user_id, pending['desc'], pending['category'])
+            await query.edit_message_text(f"💳 *Parcelamento registrado!*\n\n🛍️ {pending['desc']} foi agendado em {pending['count']} parcelas.", parse_mode='Markdown')
+        elif action == CALLBACK_CONFIRM_IMPORT:
+            pending = await db.write(savie.take_pending_action, int(payload), user_id, action) if payload else None
+            if not pending: await query.edit_message_text("😕 A prévia deste extrato expirou. Envie o arquivo novamente."); return
+            await query.edit_message_text(f"⏳ Importando {pending['count']} gastos...")
+            result = await scan_statement_file(context.bot, pending['file_id'], user_id, commit=True)
+            await query.edit_message_text(f"✅ *Extrato importado!*\n\n{result['count']} gastos registrados, total de R$ {from_cents(result['total_cents']):.2f}.", parse_mode='Markdown')
         elif action == CALLBACK_CANCEL:
-            context.user_data.clear(); await query.edit_message_text("❌ Operação cancelada.")
+            if payload: await db.write(savie.discard_pending_action, int(payload), user_id)
+            await query.edit_message_text("❌ Operação cancelada.")
         elif action == CALLBACK_DELETE_MENU_LAST:
-            last_expense = savie.get_last_expense(user_id)
+            last_expense = await db.read(savie.get_last_expense, user_id)
             if not last_expense: await query.edit_message_text("Nenhum gasto encontrado para excluir."); return
-            exp_id, desc, amount, cat = last_expense['id'], last_expense['description'], Decimal(last_expense['amount']), last_expense['category']
+            exp_id, desc, amount, cat = last_expense['id'], last_expense['description'], from_cents(last_expense['amount_cents']), last_expense['category']
             text = f"Tem certeza que deseja excluir este gasto?\n\n*{cat}*: {desc} - R$ {amount:.2f}"; keyboard = [[InlineKeyboardButton("👍 Sim, excluir", callback_data=f"{CALLBACK_DELETE_CONFIRM_LAST}|{exp_id}"), InlineKeyboardButton("❌ Não", callback_data=CALLBACK_CANCEL)]]
             await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
         elif action == CALLBACK_DELETE_CONFIRM_LAST:
-            expense_id_to_delete = int(payload); savie.delete_expense_by_id(expense_id_to_delete, user_id)
+            expense_id_to_delete = int(payload); await db.write(savie.delete_expense_by_id, expense_id_to_delete, user_id)
             await query.edit_message_text("✅ Último gasto excluído com sucesso.")
         elif action == CALLBACK_DELETE_MENU_ALL:
             text = ("⚠️ *AÇÃO IRREVERSÍVEL!*\n\nVocê tem certeza que deseja apagar *TODOS* os seus dados (gastos, parcelamentos, assinaturas e desafios)?\n\nEsta ação não pode ser desfeita.")
             keyboard = [[InlineKeyboardButton("🔥 SIM, APAGAR TUDO", callback_data=CALLBACK_DELETE_CONFIRM_ALL), InlineKeyboardButton("❌ NÃO, CANCELAR", callback_data=CALLBACK_CANCEL)]]
             await query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
         elif action == CALLBACK_DELETE_CONFIRM_ALL:
-            savie.delete_all_user_data(user_id); await query.edit_message_text("🗑️ Todos os seus dados foram apagados permanentemente.")
+            await db.write(savie.delete_all_user_data, user_id); matcher.forget_user(user_id); await query.edit_message_text("🗑️ Todos os seus dados foram apagados permanentemente.")
         elif action == CALLBACK_ADD_RECURRING:
-            pending_suggestion = context.user_data.get('suggestion_for_recurring')
+            pending_suggestion = await db.write(savie.take_pending_action, int(payload), user_id, action) if payload else None
             if not pending_suggestion: await query.edit_message_text("😕 Os dados desta sugestão expiraram."); return
-            day_of_month = date.today().day; savie.add_recurring_expense(user_id, day_of_month, pending_suggestion)
-            await query.edit_message_text(f"✅ Assinatura '{pending_suggestion['desc']}' criada! Ela será lançada automaticamente todo dia {day_of_month}."); del context.user_data['suggestion_for_recurring']
+            day_of_month = pending_suggestion.get('day_of_month') or date.today().day; await db.write(savie.add_recurring_expense, user_id, day_of_month, pending_suggestion)
+            await query.edit_message_text(f"✅ Assinatura '{pending_suggestion['desc']}' criada! Ela será lançada automaticamente todo dia {day_of_month}.")
+        elif action == CALLBACK_PAY_BILL:
+            result = await db.write(savie.mark_bill_paid, int(payload), user_id)
+            if not result: await query.edit_message_text("😕 Não encontrei esta conta."); return
+            bill_id, changed = result
+            await query.edit_message_text("✅ Pagamento registrado! Vou atualizar o resumo no grupo." if changed else "Você já tinha marcado esta conta como paga.")
+            if changed: bill_editor.schedule(context.bot, bill_id)
         elif action == CALLBACK_CHALLENGE_ACCEPT:
             challenge_category, challenge_days = payload.split('|')
-            savie.start_no_spend_challenge(user_id, challenge_category, int(challenge_days))
+            await db.write(savie.start_no_spend_challenge, user_id, challenge_category, int(challenge_days))
             await query.edit_message_text(f"💪 Desafio aceito! Boa sorte nos próximos {challenge_days} dias. Estou de olho!")
     except Exception as e:
         logger.error(f"Erro no callback '{query.data}': {e}"); await query.edit_message_text("😕 Ocorreu um erro. Tente novamente.")
@@ -440,58 +2152,112 @@ async def exportar_dados(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Desculpe, este é um comando restrito ao administrador.")
         return
     await update.message.reply_text("Gerando o relatório de usuários... por favor, aguarde.")
+    directory = tempfile.mkdtemp(prefix="savie_export_")
     try:
-        cursor = savie.conn.cursor()
-        cursor.execute("SELECT full_name, email, created_at FROM users WHERE full_name IS NOT NULL AND email IS NOT NULL")
-        users = cursor.fetchall()
-        if not users:
+        paths, rows = await db.read(savie.export_csv, 'usuarios', (), directory, bool(context.args and context.args[0] == "gz"))
+        if not rows:
             await update.message.reply_text("Nenhum usuário com cadastro completo encontrado.")
             return
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Nome Completo', 'Email', 'Data de Cadastro'])
-        for user in users:
-            writer.writerow([user['full_name'], user['email'], user['created_at']])
-        output.seek(0)
-        document = io.BytesIO(output.getvalue().encode('utf-8'))
-        document.name = f"savie_usuarios_{datetime.now().strftime('%Y-%m-%d')}.csv"
-        await context.bot.send_document(chat_id=ADMIN_ID, document=document)
+        await send_export_files(context, ADMIN_ID, paths)
     except Exception as e:
         logger.error(f"Erro ao exportar dados: {e}")
         await update.message.reply_text(f"Ocorreu um erro ao gerar o relatório: {e}")
+    finally: shutil.rmtree(directory, ignore_errors=True)
+
+async def meus_dados(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await gatekeeper(update, context, "meusdados"): return
+    user_id = update.effective_user.id; compress = bool(context.args and context.args[0] == "gz")
+    await update.message.reply_text("Preparando a exportação dos seus gastos e parcelamentos... 📦")
+    directory = tempfile.mkdtemp(prefix="savie_export_")
+    try:
+        expenses, expense_rows = await db.read(savie.export_csv, 'gastos', (user_id,), directory, compress)
+        installments, installment_rows = await db.read(savie.export_csv, 'parcelas', (user_id,), directory, compress)
+        if not expense_rows and not installment_rows:
+            await update.message.reply_text("Você ainda não tem gastos registrados para exportar."); return
+        await send_export_files(context, user_id, expenses + installments)
+        if update.effective_chat.id != user_id: await update.message.reply_text("Enviei seus dados no privado. 🔒")
+    except Exception as e:
+        logger.error(f"Erro ao exportar dados do usuário {user_id}: {e}")
+        await update.message.reply_text("Ocorreu um erro ao gerar sua exportação. Tente novamente mais tarde.")
+    finally: shutil.rmtree(directory, ignore_errors=True)
+
+async def send_export_files(context: ContextTypes.DEFAULT_TYPE, chat_id: int, paths: list[str]):
+    for index, path in enumerate(paths, 1):
+        with open(path, 'rb') as document:
+            caption = f"Parte {index}/{len(paths)}" if len(paths) > 1 else None
+            await context.bot.send_document(chat_id=chat_id, document=document, filename=os.path.basename(path), caption=caption, read_timeout=120, write_timeout=120)
+
+async def verificar_totais(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_ID:
+        await update.message.reply_text("Desculpe, este é um comando restrito ao administrador.")
+        return
+    try:
+        if context.args and context.args[0] == "recalcular":
+            rows = await db.write(savie.rebuild_monthly_totals)
+            await update.message.reply_text(f"✅ Totais mensais recalculados a partir de expenses ({rows} linhas).")
+            return
+        mismatches = await db.read(savie.verify_monthly_totals)
+        if not mismatches:
+            await update.message.reply_text("✅ Totais mensais consistentes com a tabela de gastos.")
+            return
+        sample = "\n".join(f"user {m['user_id']} {m['year_month']} {m['category']}: esperado {m['expected']}, gravado {m['stored']}" for m in mismatches[:10])
+        await update.message.reply_text(f"⚠️ {len(mismatches)} divergências encontradas:\n{sample}\n\nUse /totais recalcular para reconstruir.")
+    except Exception as e:
+        logger.error(f"Erro ao verificar totais mensais: {e}")
+        await update.message.reply_text(f"Ocorreu um erro ao verificar os totais: {e}")
+
+async def compactar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_ID:
+        await update.message.reply_text("Desculpe, este é um comando restrito ao administrador.")
+        return
+    try:
+        await update.message.reply_text("⏳ Compactando o banco (VACUUM completo). As gravações esperam até o fim...")
+        elapsed = await db.write(savie.enable_incremental_vacuum)
+        if elapsed is None: await update.message.reply_text("✅ O auto_vacuum incremental já está ativo; a manutenção diária cuida das páginas livres."); return
+        logger.info(f"auto_vacuum incremental ativado (VACUUM completo) em {elapsed:.1f}s.")
+        await update.message.reply_text(f"✅ auto_vacuum incremental ativado em {elapsed:.1f}s. Daqui em diante basta a manutenção diária.")
+    except Exception as e:
+        logger.error(f"Erro ao compactar o banco: {e}")
+        await update.message.reply_text(f"Ocorreu um erro ao compactar o banco: {e}")
+
+async def metricas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_ID:
+        await update.message.reply_text("Desculpe, este é um comando restrito ao administrador.")
+        return
+    if not metrics.ENABLED:
+        await update.message.reply_text("Métricas desativadas (METRICS_ENABLED=0)."); return
+    if context.args and context.args[0] == "zerar":
+        metrics.registry.reset(); await update.message.reply_text("✅ Métricas zeradas."); return
+    await update.message.reply_text(f"📈 Métricas do processo\n\n{metrics.summary() or 'Nada medido ainda.'}")
 
 async def ajuda(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await gatekeeper(update, context, "ajuda"): return
-    help_text = ("*🤖 Central de Ajuda do Savie*\n\n*Como Registrar Gastos*\n• *Texto:* Envie `Cinema 50 reais`.\n• *Parcelas:* Envie `TV 2500 em 10x`.\n\n*Comandos*\n`/start` - Reinicia o bot.\n`/gastos` - Resumo do mês.\n`/categorias` - Gastos por categoria.\n`/parcelas` - Compras parceladas ativas.\n`/desafio` - Comece um desafio para economizar.\n`/excluir` - Apagar registros.\n`/rachar` - (Em grupos) Dividir uma conta.\n`/ajuda` - Exibe esta mensagem.")
+    help_text = ("*🤖 Central de Ajuda do Savie*\n\n*Como Registrar Gastos*\n• *Texto:* Envie `Cinema 50 reais`.\n• *Parcelas:* Envie `TV 2500 em 10x` ou `TV 10x de 250`.\n• *Data:* Acrescente `ontem` ou `15/03` para um gasto de outro dia.\n• *Foto:* Envie a foto de um recibo e eu leio o total.\n• *Extrato:* Envie o CSV ou OFX do banco para importar vários gastos de uma vez.\n\n*Comandos*\n`/start` - Reinicia o bot.\n`/gastos` - Resumo do mês.\n`/categorias` - Gastos por categoria.\n`/tendencia` - Últimos 12 meses por categoria.\n`/parcelas` - Compras parceladas ativas.\n`/desafio` - Comece um desafio para economizar.\n`/excluir` - Apagar registros.\n`/meusdados` - Exportar seus gastos em CSV.\n`/rachar` - (Em grupos) Dividir uma conta.\n`/ajuda` - Exibe esta mensagem.")
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
 async def gastos_mes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await gatekeeper(update, context, "gastos"): return
-    user_id = update.effective_user.id; summary = savie.get_monthly_summary(user_id)
-    if not summary: await update.message.reply_text("Você ainda não registrou nenhum gasto este mês. Comece agora!"); return
-    month_name = datetime.now().strftime('%B de %Y').capitalize()
-    report = f"📊 *Resumo de {month_name}*\n\n💰 *Total Gasto:* R$ {summary['total']:.2f}\n\nPara ver o detalhamento, use o botão 'Por Categoria'."
-    await update.message.reply_text(report, parse_mode='Markdown')
+    await update.message.reply_text(await cached_report(update.effective_user.id, "mes", month_report), parse_mode='Markdown')
 
 async def gastos_por_categoria(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await gatekeeper(update, context, "categorias"): return
-    user_id = update.effective_user.id; summary = savie.get_monthly_summary(user_id)
-    if not summary: await update.message.reply_text("Você ainda não registrou nenhum gasto este mês."); return
-    month_name = datetime.now().strftime('%B de %Y').capitalize()
-    report = f"📈 *Gastos por Categoria - {month_name}*\n\n"; total_geral = summary['total']
-    for row in summary['by_category']:
-        category, amount = row['category'], Decimal(row['cat_total']); percentage = (amount / total_geral) * 100
-        report += f"{category}: *R$ {amount:.2f}* ({percentage:.1f}%)\n"
-    report += f"\n💰 *Total Geral:* R$ {total_geral:.2f}"; await update.message.reply_text(report, parse_mode='Markdown')
+    await update.message.reply_text(await cached_report(update.effective_user.id, "categorias", category_report), parse_mode='Markdown')
+
+async def tendencia(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await gatekeeper(update, context, "tendencia"): return
+    await update.message.reply_text(await cached_report(update.effective_user.id, "tendencia", trend_report), parse_mode='Markdown')
 
 async def compras_parceladas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await gatekeeper(update, context, "parcelas"): return
-    user_id = update.effective_user.id; installments = savie.get_active_installments(user_id)
+    user_id = update.effective_user.id; installments = await db.read(savie.get_active_installments, user_id)
     if not installments: await update.message.reply_text("Você não possui nenhuma compra parcelada ativa no momento. ✅"); return
     report = "💳 *Suas Compras Parceladas Ativas*\n\n"; total_pending = Decimal(0)
     for item in installments:
-        total_amount = Decimal(item['total_amount']); installment_amount = total_amount / item['total_installments']
-        remaining_installments = item['total_installments'] - item['paid_count']; remaining_amount = remaining_installments * installment_amount
+        total_amount = from_cents(item['total_amount_cents']); installment_amount = total_amount / item['total_installments']
+        remaining_amount = from_cents(item['remaining_cents'])
         total_pending += remaining_amount; report += f"🛍️ *{item['description']}*\n"
         report += f" ({item['paid_count']}/{item['total_installments']}) *R$ {installment_amount:.2f}* por mês\n"
         report += f"💸 Restam *R$ {remaining_amount:.2f}*\n\n"
@@ -517,33 +2283,31 @@ async def rachar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.chat.type == 'private':
         await update.message.reply_text("Este comando só funciona em grupos!"); return
     try:
-        args = context.args
-        if len(args) < 2 or not args[0].replace('.','',1).replace(',','',1).isdigit() or not any(a.startswith('@') for a in args):
+        args = context.args; parsed = parse_expense_text(args[0]) if args else None
+        mentions = list(dict.fromkeys(arg[1:] for arg in args if arg.startswith('@') and len(arg) > 1))
+        if not parsed or parsed['amount'] <= 0 or not mentions:
             await update.message.reply_text("Uso: /rachar <valor> @amigo1 @amigo2... <descrição>"); return
-        total_amount = Decimal(args[0].replace(',', '.'))
-        mentions = [arg.replace('@', '') for arg in args if arg.startswith('@')]
+        total_amount = parsed['amount']
         creator_username = update.message.from_user.username
-        if creator_username and creator_username not in mentions:
+        if creator_username and creator_username.lower() not in {m.lower() for m in mentions}:
             mentions.append(creator_username)
         description_parts = [arg for arg in args[1:] if not arg.startswith('@')]
         description = ' '.join(description_parts) or "Conta compartilhada"
-        num_participants = len(mentions)
-        amount_per_person = total_amount / num_participants
-        bill_id = savie.create_shared_bill(update.message.from_user.id, creator_username, update.message.chat_id, description, total_amount)
-        participant_ids = {username: savie.add_bill_participant(bill_id, username, amount_per_person) for username in mentions}
-        bill_info, participants = savie.get_bill_status(bill_id)
-        summary_text = f"**Conta Rachada por @{creator_username}**\n\n📝 *Descrição:* {description}\n💰 *Total:* R$ {total_amount:.2f} (R$ {amount_per_person:.2f} por pessoa)\n\n*Participantes:*\n"
-        for p in participants: summary_text += f"⏳ @{p['participant_username']}\n"
-        summary_message = await update.message.reply_text(summary_text, parse_mode=ParseMode.MARKDOWN)
-        savie.update_bill_summary_message(bill_id, summary_message.message_id)
-        for username, participant_id in participant_ids.items():
-            if username == creator_username: continue
-            user = savie.get_user_by_username(username)
-            if user:
-                try:
-                    dm_text = f"Olá, @{username}! O @{creator_username} te incluiu em uma conta de '{description}'.\n💸 *Sua parte:* R$ {amount_per_person:.2f}\nClique abaixo quando pagar."; keyboard = [[InlineKeyboardButton("✅ Já paguei", callback_data=f"{CALLBACK_PAY_BILL}|{participant_id}")]]
-                    await context.bot.send_message(chat_id=user['user_id'], text=dm_text, reply_markup=InlineKeyboardMarkup(keyboard))
-                except Exception as e: logger.error(f"Não foi possível enviar DM para {username}: {e}"); await context.bot.send_message(chat_id=update.message.chat_id, text=f"PS: Não consegui avisar @{username}. Ele(a) precisa iniciar uma conversa comigo primeiro (/start).")
+        bill_id = await db.write(savie.create_shared_bill, update.message.from_user.id, creator_username, update.message.chat_id, description, total_amount, mentions)
+        bill, participants = await db.read(savie.get_bill_status, bill_id)
+        summary_message = await update.message.reply_text(BillSummaryEditor.render(bill, participants), parse_mode=ParseMode.MARKDOWN)
+        await db.write(savie.update_bill_summary_message, bill_id, summary_message.message_id)
+        # As DMs vão para a fila de saída; se uma falhar em definitivo, o aviso cai no grupo.
+        dms, unknown = [], []
+        for p in participants:
+            if p['status'] != 'pending': continue
+            if not p['participant_user_id']: unknown.append(f"@{p['participant_username']}"); continue
+            dm_text = f"Olá, @{escape_markdown(p['participant_username'])}! O @{escape_markdown(creator_username or '?')} te incluiu em uma conta de '{escape_markdown(description)}'.\n💸 *Sua parte:* R$ {from_cents(p['amount_due_cents']):.2f}\nClique abaixo quando pagar."
+            keyboard = [[InlineKeyboardButton("✅ Já paguei", callback_data=f"{CALLBACK_PAY_BILL}|{p['id']}")]]
+            dms.append(notifier.message(p['participant_user_id'], dm_text, parse_mode=ParseMode.MARKDOWN, reply_markup=InlineKeyboardMarkup(keyboard), fallback_chat_id=update.message.chat_id,
+                                        fallback_text=f"PS: Não consegui avisar @{p['participant_username']}. Ele(a) precisa iniciar uma conversa comigo primeiro (/start)."))
+        if unknown: dms.append(notifier.message(update.message.chat_id, f"PS: {', '.join(unknown)} ainda não falou comigo. Para receber o aviso da conta, é preciso iniciar uma conversa comigo (/start)."))
+        await notifier.enqueue_many(dms)
     except Exception as e:
         logger.error(f"Erro no comando /rachar: {e}"); await update.message.reply_text("Ocorreu um erro ao processar o racha da conta.")
 
@@ -556,30 +2320,238 @@ async def handle_keyboard_buttons(update: Update, context: ContextTypes.DEFAULT_
     elif text == "🗑️ Excluir Dados": await excluir(update, context)
     elif text == "❓ Ajuda": await ajuda(update, context)
 
-def main() -> None:
-    if not BOT_TOKEN:
-        logger.error("ERRO: O BOT_TOKEN não foi definido."); return
+# --- Persistência do Estado de Conversa ---
+class SQLitePersistence(BasePersistence):
+    """Guarda o user_data do PTB (estado do cadastro) no SQLite com TTL. As escritas são acumuladas
+    (write-behind) e gravadas num único executemany. O estado de um usuário é lido no primeiro update dele
+    (o initialize da Application roda antes do post_init, que é quem abre o banco); com PERSISTENCE_SHARED
+    é relido antes de um update quando outro processo gravou no banco desde a última leitura (o contador SavieBot.foreign_writes,
+    que foreign_writes_job mantém fora do event loop), para que qualquer instância continue a conversa de onde outra parou."""
+    def __init__(self, shared: bool = PERSISTENCE_SHARED, update_interval: float = PERSISTENCE_INTERVAL):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False), update_interval=update_interval)
+        self.savie: SavieBot | None = None; self.db: SQLiteExecutor | None = None; self.shared = shared
+        self._dirty: dict[int, tuple] = {}; self._flush_task: asyncio.Task | None = None
+        self._seen: OrderedDict = OrderedDict()  # user_id -> (updated_at, foreign_writes da leitura), LRU do tamanho do cache de perfis
+
+    def attach(self, savie: SavieBot, db: SQLiteExecutor):
+        self.savie, self.db = savie, db
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        now = time.time(); self._remember(user_id, now, self.savie.foreign_writes)
+        self._dirty[user_id] = (encode_state(data) if data else None, now)
+        if self._flush_task is None: self._flush_task = asyncio.create_task(self._write_behind())
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty[user_id] = (None, time.time()); self._seen.pop(user_id, None)
+        if self._flush_task is None: self._flush_task = asyncio.create_task(self._write_behind())
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._dirty or (not self.shared and user_id in self._seen): return
+        foreign_writes = self.savie.foreign_writes; seen = self._seen.get(user_id)
+        if seen and seen[1] == foreign_writes: self._seen.move_to_end(user_id); return  # ninguém mais gravou desde a leitura
+        row = await self.db.read(self.savie.get_conversation_state, user_id)
+        if row is None:
+            if seen: user_data.clear()
+            self._remember(user_id, 0.0, foreign_writes)  # sem estado salvo
+        elif row['updated_at'] > (seen[0] if seen else 0):
+            user_data.clear(); user_data.update(decode_state(row['data'])); self._remember(user_id, row['updated_at'], foreign_writes)
+        else: self._remember(user_id, seen[0], foreign_writes)
+
+    def _remember(self, user_id: int, updated_at: float, foreign_writes: int):
+        self._seen[user_id] = (updated_at, foreign_writes); self._seen.move_to_end(user_id)
+        while len(self._seen) > PROFILE_CACHE_SIZE: self._seen.popitem(last=False)
+
+    async def _write_behind(self):
+        await asyncio.sleep(0.05)  # junta as escritas de um mesmo ciclo do PTB numa só transação
+        self._flush_task = None
+        batch, self._dirty = self._dirty, {}
+        if batch: await self.db.write(self.savie.save_conversation_states, batch)
+
+    async def flush(self) -> None:
+        if self._flush_task: self._flush_task.cancel(); self._flush_task = None
+        batch, self._dirty = self._dirty, {}
+        if batch: await self.db.write(self.savie.save_conversation_states, batch)
+
+    # Somente user_data é persistido; o resto da interface fica vazio.
+    async def get_chat_data(self) -> dict: return {}
+    async def get_bot_data(self) -> dict: return {}
+    async def get_callback_data(self): return None
+    async def get_conversations(self, name: str) -> dict: return {}
+    async def update_conversation(self, name: str, key, new_state) -> None: pass
+    async def update_chat_data(self, chat_id: int, data) -> None: pass
+    async def update_bot_data(self, data) -> None: pass
+    async def update_callback_data(self, data) -> None: pass
+    async def drop_chat_data(self, chat_id: int) -> None: pass
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None: pass
+    async def refresh_bot_data(self, bot_data) -> None: pass
+
+# --- Processamento Concorrente e Webhook ---
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processa updates de usuários diferentes em paralelo (até max_concurrent_updates), mas os de um
+    mesmo usuário em ordem: cada usuário tem um lock e só disputa uma vaga do semáforo quando é a sua vez."""
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: dict[int, list] = {}  # chave -> [lock, updates aguardando]
+
+    @staticmethod
+    def _key(update: object) -> int | None:
+        if not isinstance(update, Update): return None
+        if update.effective_user: return update.effective_user.id
+        return update.effective_chat.id if update.effective_chat else None
+
+    async def process_update(self, update: object, coroutine) -> None:
+        key = self._key(update)
+        if key is None: await super().process_update(update, coroutine); return
+        entry = self._locks.get(key)
+        if entry is None: entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1; waiting_since = time.perf_counter()
+        try:
+            async with entry[0]:
+                metrics.observe("savie_update_lock_wait_seconds", time.perf_counter() - waiting_since)
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0: del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        kind = 'callback_query' if isinstance(update, Update) and update.callback_query else 'message' if isinstance(update, Update) and update.message else 'other'
+        with metrics.timer("savie_update_seconds", kind=kind): await coroutine
+
+    async def initialize(self) -> None: pass
+
+    async def shutdown(self) -> None: pass
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest que mede cada chamada à Bot API por método e código de resposta."""
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        started = time.perf_counter(); code = 'error'
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs); return code, payload
+        finally: metrics.observe("savie_telegram_seconds", time.perf_counter() - started, method=url.rsplit('/', 1)[-1], code=code)
+
+def build_web_app(application: Application, webhook: bool = True) -> web.Application:
+    async def telegram_webhook(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), WEBHOOK_SECRET or ''):
+            return web.Response(status=403)
+        try: data = await request.json()
+        except ValueError: return web.Response(status=400)
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return web.Response()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def ready(request: web.Request) -> web.Response:
+        try: database_ok = await asyncio.wait_for(db.read(savie.ping), timeout=2)
+        except Exception: database_ok = False
+        ok = application.running and database_ok
+        return web.json_response({'application': application.running, 'database': database_ok}, status=200 if ok else 503)
+
+    async def prometheus(request: web.Request) -> web.Response:
+        if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"): return web.Response(status=401)
+        return web.Response(text=metrics.registry.render(), content_type='text/plain', charset='utf-8', headers={'X-Metrics-Enabled': str(int(metrics.ENABLED))})
+
+    # Na PORT pública do webhook, /metrics só com METRICS_TOKEN; sem ele, as métricas ficam no servidor de METRICS_PORT.
+    web_app = web.Application()
+    if webhook: web_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    if METRICS_TOKEN or not webhook: web_app.router.add_get('/metrics', prometheus)
+    web_app.router.add_get('/healthz', healthz)
+    web_app.router.add_get('/ready', ready)
+    return web_app
+
+async def run_webhook(application: Application) -> None:
+    # Servidor aiohttp próprio: updates chegam por POST e caem na update_queue da Application.
+    # Vários processos/máquinas podem atender o mesmo webhook, sem o long polling amarrar o bot a um só.
+    runner = web.AppRunner(build_web_app(application))
+    await application.initialize()
+    if application.post_init: await application.post_init(application)
+    try:
+        await application.start()
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES, max_connections=CONCURRENT_UPDATES)
+        await runner.setup(); await web.TCPSite(runner, '0.0.0.0', PORT).start()
+        logger.info(f"Webhook ouvindo em 0.0.0.0:{PORT}{WEBHOOK_PATH} ({CONCURRENT_UPDATES} updates concorrentes).")
+        stop = asyncio.Event(); loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM): loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        if application.running: await application.stop()
+        if application.post_stop: await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown: await application.post_shutdown(application)
+
+async def start_metrics_server(application: Application) -> web.AppRunner:
+    # As rotas de observabilidade num servidor próprio em METRICS_PORT: no polling não há outro; no webhook é a porta
+    # que não se expõe (no Fly, só a rede privada chega nela).
+    runner = web.AppRunner(build_web_app(application, webhook=False)); await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', METRICS_PORT).start(); logger.info(f"Métricas e health checks em 0.0.0.0:{METRICS_PORT}.")
+    return runner
+
+async def start_services(application: Application) -> None:
+    # O banco abre numa thread; o modelo de IA é pré-carregado em segundo plano, sem atrasar o primeiro update.
+    global metrics_runner
+    await asyncio.get_running_loop().run_in_executor(None, init_services)
+    application.persistence.attach(savie, db); notifier.start(application.bot)
+    if llm: llm.preload()
+    if METRICS_PORT and metrics_runner is None: metrics_runner = await start_metrics_server(application)
+
+async def stop_notifier(application: Application) -> None:
+    # Antes do shutdown da Application: depois dele o cliente HTTP do bot já está fechado.
+    if notifier: await bill_editor.flush(); await notifier.stop()
+
+async def shutdown_services(application: Application) -> None:
+    global metrics_runner
+    if metrics_runner: await metrics_runner.cleanup(); metrics_runner = None
+    if receipts: receipts.close()
+    if db: await asyncio.get_running_loop().run_in_executor(None, db.close); savie.close()
+
+def build_application() -> Application:
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES)).persistence(SQLitePersistence())
+    builder = builder.post_init(start_services).post_stop(stop_notifier).post_shutdown(shutdown_services)
+    if metrics.ENABLED: builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+    if TELEGRAM_API_URL: builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot").base_file_url(f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+    if BOT_MODE == "webhook": builder = builder.updater(None)
+    application = builder.build()
 
-    application = Application.builder().token(BOT_TOKEN).build()
-    
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("ajuda", ajuda))
     application.add_handler(CommandHandler("gastos", gastos_mes))
     application.add_handler(CommandHandler("categorias", gastos_por_categoria))
+    application.add_handler(CommandHandler("tendencia", tendencia))
     application.add_handler(CommandHandler("parcelas", compras_parceladas))
     application.add_handler(CommandHandler("excluir", excluir))
     application.add_handler(CommandHandler("desafio", desafio))
     application.add_handler(CommandHandler("rachar", rachar))
     application.add_handler(CommandHandler("exportar", exportar_dados))
+    application.add_handler(CommandHandler("meusdados", meus_dados))
+    application.add_handler(CommandHandler("totais", verificar_totais))
+    application.add_handler(CommandHandler("metricas", metricas))
+    application.add_handler(CommandHandler("compactar", compactar))
     
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("csv") | filters.Document.FileExtension("ofx") | filters.Document.MimeType("text/csv"), handle_statement))
+    application.add_handler(MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_photo))
     application.add_handler(CallbackQueryHandler(handle_callback))
     
     # Lembrete: Para o JobQueue funcionar, instale com: pip install "python-telegram-bot[job-queue]"
     if application.job_queue:
         application.job_queue.run_repeating(daily_scheduler_job, interval=6*60*60, first=10)
-    
-    application.run_polling()
+        application.job_queue.run_repeating(checkpoint_job, interval=DB_CHECKPOINT_INTERVAL, first=DB_CHECKPOINT_INTERVAL)
+        application.job_queue.run_repeating(foreign_writes_job, interval=FOREIGN_WRITES_INTERVAL, first=FOREIGN_WRITES_INTERVAL)
+        application.job_queue.run_repeating(storage_maintenance_job, interval=24*60*60, first=15*60)
+    return application
+
+def main() -> None:
+    if not BOT_TOKEN:
+        logger.error("ERRO: O BOT_TOKEN não foi definido."); return
+
+    application = build_application()
+    if BOT_MODE == "webhook": asyncio.run(run_webhook(application))
+    else: application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+# Savie - Instrumentação
+# Contadores e histogramas de latência em memória, no formato de texto do Prometheus.
+# Com METRICS_ENABLED=0 os decoradores devolvem a própria função e os timers são um no-op compartilhado.
+
+import asyncio, bisect, functools, os, threading, time
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets; self.counts = [0] * (len(buckets) + 1); self.sum = 0.0; self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1; self.sum += value; self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Estimativa pelo limite superior do bucket, como o histogram_quantile do Prometheus sem interpolar.
+        target, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target: return bound
+        return float('inf')
+
+class Registry:
+    """Métricas do processo. Chaves são (nome, labels ordenados); um lock só, segurado por microssegundos,
+    porque as threads do banco também registram."""
+    def __init__(self):
+        self._lock = threading.Lock(); self.counters: dict[tuple, float] = {}; self.histograms: dict[tuple, Histogram] = {}
+        self._collectors: list[tuple[str, object]] = []; self._help: dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock: self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        self.observe_key(_key(name, labels), value)
+
+    def observe_key(self, key: tuple, value: float):
+        # Caminho rápido para quem já montou a chave (decoradores montam uma vez só).
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None: histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, prefix: str, source):
+        # source() -> dict de contadores já mantidos em outro lugar (ex.: CategorizationService.stats), lido só na coleta.
+        self._collectors.append((prefix, source))
+
+    def collect(self) -> tuple[dict, dict]:
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self.histograms.items()}
+        for prefix, source in self._collectors:
+            for name, value in source().items(): counters[(f"{prefix}_{name}_total", ())] = value
+        return counters, histograms
+
+    def render(self) -> str:
+        counters, histograms = self.collect(); lines = []; seen = set()
+        def header(name: str, kind: str):
+            if name in seen: return
+            seen.add(name)
+            if name in self._help: lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter"); lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            header(name, "histogram"); cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count; lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf' if bound == float('inf') else repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}"); lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock: self.counters.clear(); self.histograms.clear()
+
+def _labels(labels: tuple) -> str:
+    if not labels: return ""
+    return "{" + ",".join(f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in labels) + "}"
+
+registry = Registry()
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(labels.items()) if len(labels) < 2 else tuple(sorted(labels.items())))
+
+class _Timer:
+    __slots__ = ("key", "started")
+
+    def __init__(self, key: tuple):
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter(); return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe_key(self.key, time.perf_counter() - self.started); return False
+
+class _NoopTimer:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): return False
+
+_NOOP = _NoopTimer()
+
+def timer(name: str, **labels):
+    """Context manager: with timer("savie_db_seconds", method="add_expense"): ..."""
+    return _Timer(_key(name, labels)) if ENABLED else _NOOP
+
+def timed(name: str, **labels):
+    """Decorador para funções síncronas ou corrotinas. Desligado, devolve a função original."""
+    def decorate(fn):
+        if not ENABLED: return fn
+        key = _key(name, labels)
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try: return await fn(*args, **kwargs)
+                finally: registry.observe_key(key, time.perf_counter() - started)
+            return async_wrapper
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: registry.observe_key(key, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def inc(name: str, amount: float = 1, **labels):
+    if ENABLED: registry.inc(name, amount, **labels)
+
+def observe(name: str, value: float, **labels):
+    if ENABLED: registry.observe(name, value, **labels)
+
+def summary(limit: int = 15) -> str:
+    # Resumo legível para o /metricas: histogramas mais chamados com média e p95, depois os contadores.
+    counters, histograms = registry.collect(); lines = []
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items(), key=lambda item: -item[1][3])[:limit]:
+        histogram = Histogram(buckets); histogram.counts, histogram.sum, histogram.count = counts, total, count
+        label = ",".join(str(value) for _, value in labels)
+        lines.append(f"{name.removeprefix('savie_').removesuffix('_seconds')}[{label}] n={count} média={total / count * 1000:.1f}ms p95≤{histogram.quantile(0.95) * 1000:.0f}ms")
+    for (name, labels), value in sorted(counters.items()):
+        label = ",".join(str(v) for _, v in labels)
+        lines.append(f"{name.removeprefix('savie_')}{f'[{label}]' if label else ''} = {value:g}")
+    return "\n".join(lines)